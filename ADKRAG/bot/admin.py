@@ -1,5 +1,17 @@
 from django.contrib import admin
-from .models import ScrapedDataEntry
+from .models import DocumentChunk, ScrapedDataEntry, ScrapeJob
+
+# Read-only list of the passages an entry was split into for retrieval
+class DocumentChunkInline(admin.TabularInline):
+    model = DocumentChunk
+    fields = ('position', 'text')
+    readonly_fields = ('position', 'text')
+    extra = 0
+    can_delete = False
+    show_change_link = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 # Customizing the display of the ScrapedDataEntry model in the Admin
 class ScrapedDataEntryAdmin(admin.ModelAdmin):
@@ -16,7 +28,7 @@ class ScrapedDataEntryAdmin(admin.ModelAdmin):
     search_fields = ('url', 'name', 'meta_description', 'scraped_by_user_id')
 
     # Read-only fields in the detail view
-    readonly_fields = ('scraped_at',)
+    readonly_fields = ('scraped_at', 'content_hash', 'http_etag', 'http_last_modified', 'sitemap_lastmod')
 
     # Custom method to display a shorter or more friendly name in the list view
     def name_display(self, obj):
@@ -26,6 +38,9 @@ class ScrapedDataEntryAdmin(admin.ModelAdmin):
         return f"({obj.url[:50]}...)"
     name_display.short_description = 'Name / H1'
     
+    # Passages are rebuilt automatically whenever content_summary changes
+    inlines = [DocumentChunkInline]
+
     # Fieldset configuration for the detail view (optional, but helps organization)
     fieldsets = (
         ('Scraping Metadata', {
@@ -34,7 +49,20 @@ class ScrapedDataEntryAdmin(admin.ModelAdmin):
         ('SEO & Content', {
             'fields': ('url', 'name', 'meta_title', 'meta_description', 'meta_keywords', 'content_summary'),
         }),
+        ('Freshness', {
+            'fields': ('content_hash', 'http_etag', 'http_last_modified', 'sitemap_lastmod'),
+        }),
     )
 
 # Register the model with the customized admin class
 admin.site.register(ScrapedDataEntry, ScrapedDataEntryAdmin)
+
+
+# Read-mostly view of the scrape job queue
+@admin.register(ScrapeJob)
+class ScrapeJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'scrape_url', 'scrape_mode', 'user_id', 'state', 'attempts', 'resume_position', 'created_at')
+    list_filter = ('state', 'scrape_mode', 'created_at')
+    search_fields = ('scrape_url', 'user_id', 'lease_owner')
+    readonly_fields = ('lease_owner', 'lease_expires_at', 'attempts', 'resume_position', 'last_completed_url',
+                       'status', 'created_at', 'updated_at', 'finished_at')
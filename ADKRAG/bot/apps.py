@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class BotConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "bot"
+
+    def ready(self):
+        # Connect the signal handlers that keep the vector index in sync with deletions
+        from . import signals  # noqa: F401
+        from .vector_index import get_index_manager
+
+        # Load the persisted index from disk (no database access here);
+        # staleness is checked against VectorIndexState on first search.
+        get_index_manager().load()
+
+        # The embedding model otherwise loads on the first search or ingest;
+        # EMBEDDING_WARMUP starts loading it in the background at startup instead.
+        if getattr(settings, 'EMBEDDING_WARMUP', False):
+            from .embeddings import warm_up_model
+            warm_up_model()
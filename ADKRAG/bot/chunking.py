@@ -0,0 +1,110 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .embeddings import content_checksum, encode_texts, to_blob
+from .executors import run_in_thread
+from .models import DocumentChunk, ScrapedDataEntry
+from .vector_index import get_index_manager
+
+# all-MiniLM-L6-v2 truncates at 256 word pieces; ~180 words stays safely below that
+DEFAULT_CHUNK_SIZE = 180
+DEFAULT_CHUNK_OVERLAP = 40
+
+def split_into_chunks(text, size=None, overlap=None):
+    """
+    Splits text into overlapping windows of `size` words, each sharing `overlap`
+    words with the previous one so sentences on a boundary are not lost.
+    """
+    size = size or getattr(settings, 'CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    overlap = getattr(settings, 'CHUNK_OVERLAP', DEFAULT_CHUNK_OVERLAP) if overlap is None else overlap
+    if overlap < 0 or overlap >= size:
+        raise ValueError("CHUNK_OVERLAP must be at least 0 and smaller than CHUNK_SIZE.")
+
+    words = (text or '').split()
+    chunks = []
+    step = size - overlap
+    for start in range(0, len(words), step):
+        chunks.append(' '.join(words[start:start + size]))
+        if start + size >= len(words):
+            break
+    return chunks
+
+def split_entries(entries):
+    """Returns the (entry, position, text) passages of the given entries."""
+    passages = []
+    for entry in entries:
+        for position, text in enumerate(split_into_chunks(entry.content_summary)):
+            passages.append((entry, position, text))
+    return passages
+
+def embed_passages(passages, batch_size=64):
+    """Encodes the passages together so the model can batch them. Returns None on failure."""
+    if not passages:
+        return None
+    try:
+        return encode_texts([text for _, _, text in passages], batch_size=batch_size)
+    except Exception as e:
+        print(f"Error embedding passages: {e}")
+        return None
+
+def store_chunks(entries, passages, vectors, update_index=True):
+    """
+    Replaces the DocumentChunk rows of the entries with the given passages and vectors
+    in one transaction, and updates the FAISS index once it commits.
+    When the passages could not be embedded (vectors is None) nothing is touched: the
+    previous chunks stay searchable, and embedding_checksum still names the content they
+    were built from, so `manage.py embed_entries` (or the next save) retries the entries.
+    """
+    if passages and vectors is None:
+        return 0
+    entry_ids = [entry.pk for entry in entries]
+    with transaction.atomic():
+        # The write comes first so the transaction takes SQLite's write lock (waiting for it if
+        # needed) before it reads; the old chunk ids are then read under that lock
+        for entry in entries:
+            entry.embedding_checksum = content_checksum(entry.content_summary)
+        ScrapedDataEntry.objects.bulk_update(entries, ['embedding_checksum'])
+
+        old_ids = list(DocumentChunk.objects.filter(entry_id__in=entry_ids).values_list('id', flat=True))
+        DocumentChunk.objects.filter(pk__in=old_ids).delete()
+
+        chunks = DocumentChunk.objects.bulk_create([
+            DocumentChunk(entry=entry, position=position, text=text, embedding=to_blob(vectors[i]))
+            for i, (entry, position, text) in enumerate(passages)
+        ])
+
+    if update_index:
+        new_ids = [chunk.pk for chunk in chunks]
+        transaction.on_commit(lambda: get_index_manager().update(
+            remove_ids=old_ids, add_ids=new_ids, vectors=vectors if new_ids else None,
+        ))
+    return len(chunks)
+
+def rebuild_chunks_for_entries(entries, update_index=True, batch_size=64):
+    """
+    Replaces the DocumentChunk passages of the given entries with freshly split and
+    embedded ones. All passages are encoded together so the model can batch them.
+    """
+    entries = list(entries)
+    if not entries:
+        return 0
+    passages = split_entries(entries)
+    return store_chunks(entries, passages, embed_passages(passages, batch_size), update_index)
+
+async def rebuild_chunks_for_entries_async(entries, update_index=True, batch_size=64):
+    """
+    rebuild_chunks_for_entries for the scrape worker's event loop: encoding runs in the
+    executor thread pool (model.encode releases the GIL) and only the database writes
+    go through sync_to_async, so heartbeats and other ORM calls are not held up.
+    """
+    entries = list(entries)
+    if not entries:
+        return 0
+    passages = split_entries(entries)
+    vectors = await run_in_thread(embed_passages, passages, batch_size)
+    return await sync_to_async(store_chunks)(entries, passages, vectors, update_index)
+
+def rebuild_entry_chunks(entry):
+    """Re-chunks and re-embeds a single entry (called from ScrapedDataEntry.save)."""
+    return rebuild_chunks_for_entries([entry])
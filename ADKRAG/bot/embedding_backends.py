@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+
+# Name of the sentence-transformers model used for every vector in the project
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# all-MiniLM-L6-v2 truncates inputs at 256 word pieces
+MAX_SEQ_LENGTH = 256
+
+# Files written by `manage.py export_embedding_model` into EMBEDDING_ONNX_PATH
+ONNX_FILENAME = "model.onnx"
+ONNX_INT8_FILENAME = "model_int8.onnx"
+TOKENIZER_FILENAME = "tokenizer.json"
+# Local copy of the torch model saved next to the export, so neither backend needs the network
+TORCH_SUBDIR = "sentence-transformers"
+
+# This module must not import Django: the embedding benchmark loads backends in fresh processes.
+
+class TorchEmbeddingBackend:
+    """The sentence-transformers model on PyTorch (the reference implementation)."""
+    name = "torch"
+
+    def __init__(self, model_path=None, threads=None):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_path or EMBEDDING_MODEL_NAME, device="cpu")
+
+    def encode(self, texts, batch_size=32):
+        return np.asarray(self.model.encode(texts, batch_size=batch_size), dtype='float32')
+
+
+class OnnxEmbeddingBackend:
+    """
+    The same model exported to ONNX and run by onnxruntime with the `tokenizers` library,
+    without torch. Reproduces the model's Pooling (mean over real tokens) and Normalize
+    modules in NumPy. `quantized` selects the dynamically int8-quantized export.
+    """
+    name = "onnx"
+
+    def __init__(self, model_dir, quantized=False, threads=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        model_file = os.path.join(model_dir, ONNX_INT8_FILENAME if quantized else ONNX_FILENAME)
+        self.session = ort.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILENAME))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype='int64')
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype='int64')
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'token_type_ids' in self.input_names:
+            feeds['token_type_ids'] = np.zeros_like(input_ids)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype('float32')
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, texts, batch_size=32):
+        if not texts:
+            return np.zeros((0, self.dimension), dtype='float32')
+        # Batch texts of similar length together to minimise padding, then restore the order
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        vectors = np.empty((len(texts), self.dimension), dtype='float32')
+        for start in range(0, len(texts), batch_size):
+            positions = order[start:start + batch_size]
+            vectors[positions] = self._encode_batch([texts[i] for i in positions])
+        return vectors
+
+
+def create_backend(kind, model_path=None, onnx_path=None, quantized=False, threads=None):
+    """Instantiates a backend by EMBEDDING_BACKEND name: "torch" or "onnx"."""
+    if kind == "torch":
+        return TorchEmbeddingBackend(model_path, threads=threads)
+    if kind == "onnx":
+        if not onnx_path:
+            raise ValueError("EMBEDDING_ONNX_PATH must be set to use the onnx embedding backend.")
+        return OnnxEmbeddingBackend(onnx_path, quantized=quantized, threads=threads)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND {kind!r}; expected 'torch' or 'onnx'.")
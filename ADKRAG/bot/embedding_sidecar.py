@@ -0,0 +1,136 @@
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+import numpy as np
+
+# One process (`manage.py run_embedding_server`) holds the embedding model and serves
+# every web and scrape worker on the host over a unix socket, instead of each worker
+# loading its own copy.
+#
+# Wire format, both directions: two big-endian uint32 lengths (header, payload), a JSON
+# header, then the payload. Requests carry {"op": "encode", "batch_size": n} and the texts
+# as a JSON list; responses carry {"shape": [rows, dim]} and raw float32 vectors, or {"error": ...}.
+FRAME = struct.Struct('>II')
+
+# Errors from connect/send that mean the request did not reach the sidecar
+RETRYABLE_ERRORS = (ConnectionRefusedError, ConnectionResetError, BrokenPipeError, FileNotFoundError)
+
+def send_message(sock, header, payload=b''):
+    header_bytes = json.dumps(header).encode('utf-8')
+    sock.sendall(FRAME.pack(len(header_bytes), len(payload)) + header_bytes + payload)
+
+def _recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 1 << 20))
+        if not chunk:
+            raise ConnectionError("Embedding sidecar connection closed.")
+        data += chunk
+    return bytes(data)
+
+def recv_message(sock):
+    header_size, payload_size = FRAME.unpack(_recv_exactly(sock, FRAME.size))
+    header = json.loads(_recv_exactly(sock, header_size))
+    return header, _recv_exactly(sock, payload_size)
+
+
+class SidecarEmbeddingBackend:
+    """
+    Embedding backend that forwards encode() calls to the sidecar. Each thread keeps
+    its own connection and reconnects once if the sidecar was restarted.
+    """
+    name = "sidecar"
+
+    def __init__(self, socket_path, timeout=30):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def _request(self, header, payload=b''):
+        for attempt in range(2):
+            try:
+                sock = self._connection()
+                send_message(sock, header, payload)
+            except RETRYABLE_ERRORS:
+                # The sidecar never saw the whole request (restarted, or not up yet), so it
+                # is safe to send it again on a fresh connection
+                self._close()
+                if attempt:
+                    raise
+                continue
+            except OSError:
+                self._close()
+                raise
+            try:
+                return recv_message(sock)
+            except OSError:
+                # Sent but unanswered (timeout, sidecar died mid-encode): not retried, since
+                # the sidecar may still be working on it
+                self._close()
+                raise
+        raise AssertionError("unreachable")
+
+    def encode(self, texts, batch_size=32):
+        header, payload = self._request({'op': 'encode', 'batch_size': batch_size}, json.dumps(list(texts)).encode('utf-8'))
+        if 'error' in header:
+            raise RuntimeError(f"Embedding sidecar error: {header['error']}")
+        return np.frombuffer(payload, dtype='float32').reshape(header['shape'])
+
+    def ping(self):
+        header, _ = self._request({'op': 'ping'})
+        return header
+
+
+class EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        backend = self.server.backend
+        while True:
+            try:
+                header, payload = recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                if header.get('op') == 'ping':
+                    send_message(self.request, {'backend': backend.name})
+                    continue
+                texts = json.loads(payload)
+                # One encode at a time: the model already uses every core for a single batch
+                with self.server.encode_lock:
+                    vectors = np.ascontiguousarray(backend.encode(texts, batch_size=header.get('batch_size', 32)),
+                                                   dtype='float32')
+                send_message(self.request, {'shape': list(vectors.shape)}, vectors.tobytes())
+            except (ConnectionError, BrokenPipeError):
+                return
+            except Exception as e:
+                send_message(self.request, {'error': str(e)})
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, backend):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # left behind by a previous server
+        self.backend = backend
+        self.encode_lock = threading.Lock()
+        super().__init__(socket_path, EmbeddingRequestHandler)
+        os.chmod(socket_path, 0o660)
@@ -0,0 +1,90 @@
+import hashlib
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .embedding_backends import EMBEDDING_MODEL_NAME, create_backend  # noqa: F401
+
+def load_backend(use_sidecar=True):
+    """
+    Creates the embedding backend selected by EMBEDDING_BACKEND ("torch" or "onnx"),
+    or a client of the shared embedding sidecar when EMBEDDING_SIDECAR_SOCKET is set.
+    """
+    socket_path = getattr(settings, 'EMBEDDING_SIDECAR_SOCKET', None)
+    if use_sidecar and socket_path:
+        from .embedding_sidecar import SidecarEmbeddingBackend
+        return SidecarEmbeddingBackend(socket_path, timeout=getattr(settings, 'EMBEDDING_SIDECAR_TIMEOUT', 30))
+    return create_backend(
+        getattr(settings, 'EMBEDDING_BACKEND', 'torch'),
+        model_path=getattr(settings, 'EMBEDDING_MODEL_PATH', None),
+        onnx_path=getattr(settings, 'EMBEDDING_ONNX_PATH', None),
+        quantized=getattr(settings, 'EMBEDDING_ONNX_QUANTIZED', False),
+        threads=getattr(settings, 'EMBEDDING_THREADS', None),
+    )
+
+# --- Lazily Initialized Global Resources ---
+# The model is loaded on first use (or by the EMBEDDING_WARMUP hook in BotConfig.ready),
+# not at import, so management commands and workers that never embed do not pay for it.
+_model = None
+_model_error = None
+_model_failed_at = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """
+    Returns the process-wide embedding backend, loading it on first call. Concurrent
+    first callers wait for a single load. A failed load is re-raised without retrying
+    for EMBEDDING_LOAD_RETRY_SECONDS, then tried again (e.g. once the model files are in place).
+    """
+    global _model, _model_error, _model_failed_at
+    if _model is None:
+        with _model_lock:
+            retry_after = getattr(settings, 'EMBEDDING_LOAD_RETRY_SECONDS', 60)
+            if _model is None and (_model_failed_at is None or time.monotonic() - _model_failed_at >= retry_after):
+                try:
+                    _model = load_backend()
+                    _model_error = _model_failed_at = None
+                    print(f"Embedding model loaded successfully ({_model.name} backend).")
+                except Exception as e:
+                    print(f"Error loading embedding model: {e}")
+                    _model_error, _model_failed_at = e, time.monotonic()
+    if _model is None:
+        raise RuntimeError(f"Embedding model failed to load. Cannot compute embeddings. ({_model_error})")
+    return _model
+
+def warm_up_model():
+    """Loads the model in a background thread so startup is not blocked by it."""
+    def load():
+        try:
+            get_model()
+        except RuntimeError:
+            pass  # Already reported; requests will raise the same error
+    thread = threading.Thread(target=load, name="embedding-warmup", daemon=True)
+    thread.start()
+    return thread
+
+# --- Helper Functions ---
+
+def content_checksum(text):
+    """
+    Returns a stable SHA-256 hex digest of a document, or None for empty content.
+    Used to detect when a stored embedding no longer matches its text.
+    """
+    if not text:
+        return None
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def encode_texts(texts, batch_size=32):
+    """Encodes a list of texts into a float32 matrix of shape (len(texts), dim)."""
+    embeddings = get_model().encode(texts, batch_size=batch_size)
+    return np.asarray(embeddings, dtype='float32')
+
+def to_blob(vector):
+    """Serializes a single embedding vector to raw float32 bytes for a BinaryField."""
+    return np.asarray(vector, dtype='float32').tobytes()
+
+def from_blob(blob):
+    """Deserializes raw float32 bytes (as stored by to_blob) back into a vector."""
+    return np.frombuffer(bytes(blob), dtype='float32')
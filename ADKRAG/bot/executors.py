@@ -0,0 +1,101 @@
+import asyncio
+import functools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+
+# The event loop of a scrape worker should only orchestrate I/O. CPU-bound work goes to:
+#  - a thread pool, for work that releases the GIL (model.encode, numpy, FAISS)
+#  - a process pool, for pure-Python work that holds it (HTML parsing)
+_thread_pool = None
+_process_pool = None
+
+def get_thread_pool():
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'EXECUTOR_THREADS', 2), thread_name_prefix='bot-cpu',
+        )
+    return _thread_pool
+
+def _process_context():
+    # Forking copies the parent's threads (thread pool, ORM, loaded model) and its open
+    # database connections into the child; forkserver/spawn start clean interpreters instead
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(method)
+
+def get_process_pool():
+    """Process pool for parsing, or None when EXECUTOR_PROCESSES is 0 (run inline)."""
+    global _process_pool
+    workers = getattr(settings, 'EXECUTOR_PROCESSES', 2)
+    if _process_pool is None and workers > 0:
+        _process_pool = ProcessPoolExecutor(max_workers=workers, mp_context=_process_context())
+    return _process_pool
+
+async def run_in_thread(func, *args, **kwargs):
+    """Runs a GIL-releasing callable in the shared thread pool."""
+    return await asyncio.get_running_loop().run_in_executor(get_thread_pool(), functools.partial(func, *args, **kwargs))
+
+async def run_in_process(func, *args):
+    """
+    Runs a picklable module-level function in the process pool. The function must not
+    touch the ORM or Django settings: the worker processes are not set up for them.
+    """
+    pool = get_process_pool()
+    if pool is None:
+        return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+
+def shutdown_executors():
+    global _thread_pool, _process_pool
+    for pool in (_thread_pool, _process_pool):
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+    _thread_pool = _process_pool = None
+
+
+class LoopLagMonitor:
+    """
+    Measures event loop responsiveness: a task sleeps `interval` seconds at a time and
+    records how late it wakes up. Lag stays near zero while the loop only does I/O and
+    grows whenever something blocks it (parsing, encoding, sync ORM calls).
+    """
+
+    def __init__(self, interval=None, window=None):
+        self.interval = interval or getattr(settings, 'LOOP_LAG_INTERVAL', 0.1)
+        self.samples = deque(maxlen=window or getattr(settings, 'LOOP_LAG_WINDOW', 600))
+        self.max_lag = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def snapshot(self):
+        """Lag in milliseconds over the recent window (and the max since start)."""
+        if not self.samples:
+            return {"last_ms": 0.0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        ordered = sorted(self.samples)
+        return {
+            "last_ms": round(self.samples[-1] * 1000, 1),
+            "p50_ms": round(ordered[len(ordered) // 2] * 1000, 1),
+            "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 1),
+            "max_ms": round(self.max_lag * 1000, 1),
+        }
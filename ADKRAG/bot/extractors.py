@@ -0,0 +1,157 @@
+from bs4 import BeautifulSoup
+from django.conf import settings
+
+from .executors import run_in_process
+
+try:
+    import lxml.html
+except ImportError:  # lxml is optional; the BeautifulSoup extractor is always available
+    lxml = None
+
+# Elements stripped as page chrome, and class substrings marking cookie banners / sidebars
+BOILERPLATE_TAGS = frozenset(['header', 'footer', 'nav'])
+BOILERPLATE_CLASSES = ('cookie', 'sidebar')
+# Elements whose text BeautifulSoup's get_text() leaves out
+NON_TEXT_TAGS = frozenset(['script', 'style', 'template'])
+
+# ----------------------------------------------------
+# --- BeautifulSoup extractor (reference behaviour) ---
+# ----------------------------------------------------
+
+# Function to remove unnecessary tags like headers, footers, and sidebars
+def remove_header_footer(soup):
+    for tag in soup.find_all(["header", "footer", "nav"]):
+        tag.decompose()
+    for tag in soup.find_all(class_=lambda x: x and ("cookie" in x.lower() or "sidebar" in x.lower())):
+        tag.decompose()
+    for p in soup.find_all("p"):
+        if "cookie" in p.get_text().lower():
+            p.decompose()
+
+def normalize_space(text):
+    """Collapses runs of whitespace, so both extractors agree on nested inline markup."""
+    return " ".join(text.split())
+
+def _meta_content(soup, name):
+    tag = soup.find('meta', attrs={'name': name})
+    return tag['content'].strip() if tag and tag.has_attr('content') else None
+
+def extract_with_bs4(html):
+    """The original process_url extraction: html.parser plus three cleanup passes."""
+    soup = BeautifulSoup(html, "html.parser")
+
+    h1_tag = soup.find('h1')
+    h1_value = normalize_space(h1_tag.get_text()) if h1_tag else None
+
+    remove_header_footer(soup)
+
+    title_tag = soup.find('title')
+    return {
+        "name": h1_value,
+        "meta_title": normalize_space(title_tag.get_text()) if title_tag else None,
+        "meta_description": _meta_content(soup, 'description'),
+        "meta_keywords": _meta_content(soup, 'keywords'),
+        "content": soup.get_text(separator="\n", strip=True),
+    }
+
+# ----------------------------------------------------
+# --- lxml extractor (fast path) ---
+# ----------------------------------------------------
+
+def _is_boilerplate(element, tag):
+    if tag in BOILERPLATE_TAGS:
+        return True
+    classes = (element.get('class') or '').lower()
+    if classes and any(marker in classes for marker in BOILERPLATE_CLASSES):
+        return True
+    return tag == 'p' and 'cookie' in element.text_content().lower()
+
+def extract_with_lxml(html):
+    """
+    Same output as extract_with_bs4 from a single walk over an lxml tree: the first
+    <h1>, <title> and meta tags are picked up while boilerplate, comments and
+    script/style bodies are collected, and those are dropped before the text is joined.
+    """
+    if lxml is None:
+        raise RuntimeError("lxml is not installed.")
+    root = lxml.html.document_fromstring(html)
+
+    found = {}
+    dropped = []
+    silenced = []
+    for element in root.iter():
+        tag = element.tag
+        if not isinstance(tag, str):
+            # Comments and processing instructions carry no page text
+            dropped.append(element)
+            continue
+        if tag == 'h1' and 'name' not in found:
+            found['name'] = normalize_space(element.text_content())
+        elif tag == 'title' and 'title' not in found:
+            found['title'] = element
+        elif tag == 'meta' and element.get('name') in ('description', 'keywords'):
+            found.setdefault(element.get('name'), element)
+        elif tag in NON_TEXT_TAGS:
+            silenced.append(element)
+        if _is_boilerplate(element, tag):
+            dropped.append(element)
+
+    for element in silenced:
+        # Keep the tail: it is text that follows the element, not part of it
+        element.text = None
+        for child in list(element):
+            element.remove(child)
+    for element in dropped:
+        if element.getparent() is not None:
+            element.drop_tree()
+
+    def surviving(key):
+        # Metadata inside stripped boilerplate is ignored, as with the BeautifulSoup extractor
+        element = found.get(key)
+        return element if element is not None and element.getroottree().getroot() is root else None
+
+    def meta_content(key):
+        element = surviving(key)
+        content = element.get('content') if element is not None else None
+        return content.strip() if content is not None else None
+
+    title = surviving('title')
+    return {
+        "name": found.get('name'),
+        "meta_title": normalize_space(title.text_content()) if title is not None else None,
+        "meta_description": meta_content('description'),
+        "meta_keywords": meta_content('keywords'),
+        "content": "\n".join(text.strip() for text in root.itertext() if text.strip()),
+    }
+
+# ----------------------------------------------------
+# --- Selection and process pool ---
+# ----------------------------------------------------
+
+EXTRACTORS = {
+    'lxml': extract_with_lxml,
+    'bs4': extract_with_bs4,
+}
+
+def get_extractor_name():
+    name = getattr(settings, 'SCRAPE_EXTRACTOR', 'lxml')
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown SCRAPE_EXTRACTOR {name!r}; expected one of {sorted(EXTRACTORS)}.")
+    return 'bs4' if name == 'lxml' and lxml is None else name
+
+def extract_page(html, extractor='lxml'):
+    """
+    Returns {"name", "meta_title", "meta_description", "meta_keywords", "content"} for a page.
+    Falls back to BeautifulSoup for documents lxml refuses (e.g. an XML encoding declaration).
+    Runs in the executor process pool, so it must not touch Django settings or the ORM.
+    """
+    if extractor != 'bs4':
+        try:
+            return EXTRACTORS[extractor](html)
+        except Exception as e:
+            print(f"{extractor} extraction failed, falling back to BeautifulSoup: {e}")
+    return extract_with_bs4(html)
+
+async def extract_page_async(html):
+    """Parses a page in the executor process pool so the crawl event loop keeps running."""
+    return await run_in_process(extract_page, html, get_extractor_name())
@@ -0,0 +1,126 @@
+import asyncio
+import time
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .chunking import embed_passages, split_entries, store_chunks
+from .executors import run_in_thread
+
+# all-MiniLM-L6-v2 truncates inputs at 256 word pieces
+MAX_SEQ_TOKENS = 256
+
+def estimate_tokens(text):
+    """Rough word-piece count of a passage (English averages ~1.3 pieces per word)."""
+    return min(MAX_SEQ_TOKENS, int(len(text.split()) * 1.3) + 2)
+
+class EmbeddingPipeline:
+    """
+    Ingest stage between the scrape writer and the vector store. Saved entries are
+    queued with their passages; a single consumer encodes them in groups sized so that
+    the padded batch (passages x longest passage) stays within INGEST_TOKEN_BUDGET
+    tokens, then writes the chunks and the FAISS index update for the whole group at once.
+
+    submit() blocks while more than INGEST_MAX_PENDING_PASSAGES passages are waiting,
+    which holds up the writer and, through it, the crawl workers until encoding catches up.
+    Throughput is reported in the scrape status as embed_docs_per_sec (pages per second
+    of encoding time), alongside embedded_pages, embed_failed_pages and the embed_queue
+    backlog. Pages that fail to embed keep their previous chunks (see store_chunks).
+    """
+
+    def __init__(self, status, token_budget=None, max_batch=None, max_pending=None):
+        self.status = status
+        self.token_budget = token_budget or getattr(settings, 'INGEST_TOKEN_BUDGET', 16384)
+        self.max_batch = max_batch or getattr(settings, 'INGEST_MAX_BATCH', 128)
+        self.max_pending = max_pending or getattr(settings, 'INGEST_MAX_PENDING_PASSAGES', 2048)
+        self._queue = deque()  # (entry, passages, longest passage in tokens)
+        self._pending = 0
+        self._changed = asyncio.Condition()
+        self._closed = False
+        self._task = None
+        self._embedded = 0
+        self._failed = 0
+        self._encode_seconds = 0.0
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.close()
+            return
+        # Interrupted: stop now; the rows keep embedding_checksum = NULL for `manage.py embed_entries`
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        if self._queue:
+            print(f"{len(self._queue)} scraped entries were left unembedded; run `manage.py embed_entries`.")
+
+    async def submit(self, entries):
+        for entry in entries:
+            passages = split_entries([entry])
+            longest = max((estimate_tokens(text) for _, _, text in passages), default=0)
+            async with self._changed:
+                # Backpressure; an empty queue always admits, so one huge page cannot deadlock
+                await self._changed.wait_for(
+                    lambda: self._pending == 0 or self._pending + len(passages) <= self.max_pending
+                )
+                self._queue.append((entry, passages, longest))
+                self._pending += len(passages)
+                self.status["embed_queue"] = self._pending
+                self._changed.notify_all()
+
+    async def close(self):
+        """Embeds everything still queued, then stops the consumer."""
+        async with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        await self._task
+
+    def _next_group(self):
+        # Whole entries in arrival order, as many as fit the padded-token budget
+        group, longest, passage_count = [], 0, 0
+        while self._queue:
+            _, passages, entry_longest = self._queue[0]
+            group_longest = max(longest, entry_longest)
+            if group and (passage_count + len(passages)) * group_longest > self.token_budget:
+                break
+            group.append(self._queue.popleft())
+            longest, passage_count = group_longest, passage_count + len(passages)
+        return group, longest
+
+    async def _run(self):
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                group, longest = self._next_group()
+
+            entries = [entry for entry, _, _ in group]
+            passages = [passage for _, entry_passages, _ in group for passage in entry_passages]
+            # Short passages pad less, so more of them fit one forward pass
+            batch_size = max(1, min(self.max_batch, self.token_budget // max(longest, 1)))
+            try:
+                started = time.perf_counter()
+                vectors = await run_in_thread(embed_passages, passages, batch_size)
+                if passages and vectors is None:
+                    # embed_passages already logged the error; store_chunks would keep the old chunks
+                    self._failed += len(entries)
+                else:
+                    self._encode_seconds += time.perf_counter() - started
+                    await sync_to_async(store_chunks)(entries, passages, vectors)
+                    self._embedded += len(entries)
+            except Exception as e:
+                print(f"Error embedding {len(entries)} scraped entries: {e}")
+                self._failed += len(entries)
+
+            async with self._changed:
+                self._pending -= len(passages)
+                self.status["embed_queue"] = self._pending
+                self.status["embedded_pages"] = self._embedded
+                self.status["embed_failed_pages"] = self._failed
+                if self._encode_seconds:
+                    self.status["embed_docs_per_sec"] = round(self._embedded / self._encode_seconds, 2)
+                self._changed.notify_all()
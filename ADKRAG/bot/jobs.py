@@ -0,0 +1,316 @@
+import asyncio
+import os
+import socket
+from contextlib import asynccontextmanager
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from crawl4ai import AsyncWebCrawler
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .executors import LoopLagMonitor, shutdown_executors
+from .models import ACTIVE_JOB_STATES, ScrapeJob
+from .scrape_status import bump_version, publish_status
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+# ----------------------------------------------------
+# --- Job Table Helpers (sync, used by the views) ---
+# ----------------------------------------------------
+
+def initial_status(user_id, rem_link):
+    """The progress dict shape reported by /bot/api/scrape/status/."""
+    return {
+        "version": 1,
+        "scraped_pages": 0,
+        "remaining_pages": 0,
+        "current_url": None,
+        "total_characters_scraped": 0,
+        "is_scraping": True,
+        "user_id": user_id,
+        "failed_pages": 0,
+        "skipped_pages": 0,
+        "unchanged_pages": 0,
+        "saved_pages": 0,
+        "last_batch_inserted": 0,
+        "embedded_pages": 0,
+        "embed_failed_pages": 0,
+        "embed_queue": 0,
+        "embed_docs_per_sec": None,
+        "file_size": 0, # Kept for status response compatibility, though no longer relevant
+        "rem_link": rem_link,
+        "error": None,
+    }
+
+def enqueue_scrape_job(user_id, scrape_url, scrape_mode, rem_link):
+    """Queues a scrape job. Returns None if the user already has a queued or running job."""
+    if ScrapeJob.objects.filter(user_id=user_id, state__in=ACTIVE_JOB_STATES).exists():
+        return None
+    try:
+        with transaction.atomic():
+            job = ScrapeJob.objects.create(
+                user_id=user_id,
+                scrape_url=scrape_url,
+                scrape_mode=scrape_mode,
+                rem_link=rem_link,
+                status=initial_status(user_id, rem_link),
+            )
+    except IntegrityError:
+        # A concurrent request queued one between the check and the insert
+        return None
+    publish_status(job, job.status, bump=False)
+    return job
+
+def latest_job_for_user(user_id):
+    return ScrapeJob.objects.filter(user_id=user_id).order_by('-created_at').first()
+
+# ----------------------------------------------------
+# --- Leasing (async-safe ORM, used by the worker) ---
+# ----------------------------------------------------
+
+@sync_to_async
+def lease_next_job(worker_id):
+    """
+    Leases the oldest runnable job, respecting the global and per-user running-job caps.
+    A job is runnable when queued, or running under a lease that expired (its worker died).
+    Returns the leased job or None.
+    """
+    now = timezone.now()
+    max_attempts = _setting('SCRAPE_JOB_MAX_ATTEMPTS', 3)
+
+    # Jobs whose workers keep dying are given up on instead of retried forever
+    ScrapeJob.objects.filter(
+        state='running', lease_expires_at__lte=now, attempts__gte=max_attempts
+    ).update(state='failed', finished_at=now, lease_owner=None, lease_expires_at=None)
+
+    running = ScrapeJob.objects.filter(state='running', lease_expires_at__gt=now)
+    if running.count() >= _setting('SCRAPE_MAX_RUNNING_JOBS', 4):
+        return None
+
+    busy_users = list(
+        running.values('user_id').annotate(n=Count('id'))
+        .filter(n__gte=_setting('SCRAPE_MAX_JOBS_PER_USER', 1))
+        .values_list('user_id', flat=True)
+    )
+    candidates = ScrapeJob.objects.filter(
+        Q(state='queued') | Q(state='running', lease_expires_at__lte=now)
+    ).exclude(user_id__in=busy_users).order_by('created_at')
+
+    lease_until = now + timedelta(seconds=_setting('SCRAPE_JOB_LEASE_SECONDS', 60))
+    for job in candidates[:10]:
+        # Compare-and-swap on (state, lease_expires_at): only one worker can win the update
+        won = ScrapeJob.objects.filter(
+            pk=job.pk, state=job.state, lease_expires_at=job.lease_expires_at
+        ).update(
+            state='running', lease_owner=worker_id, lease_expires_at=lease_until, attempts=F('attempts') + 1
+        )
+        if won:
+            job.refresh_from_db()
+            return job
+    return None
+
+def _progress_fields(status):
+    return {
+        "status": dict(status),
+        "resume_position": status.get("resume_position", 0),
+        "last_completed_url": status.get("last_completed_url"),
+    }
+
+@sync_to_async
+def save_job_progress(job_id, worker_id, status):
+    """Stores a progress snapshot and renews the lease. Returns False if the lease was lost."""
+    lease_until = timezone.now() + timedelta(seconds=_setting('SCRAPE_JOB_LEASE_SECONDS', 60))
+    return bool(ScrapeJob.objects.filter(pk=job_id, lease_owner=worker_id, state='running').update(
+        lease_expires_at=lease_until, updated_at=timezone.now(), **_progress_fields(status)
+    ))
+
+@sync_to_async
+def finish_job(job_id, worker_id, status, state):
+    status["is_scraping"] = False
+    ScrapeJob.objects.filter(pk=job_id, lease_owner=worker_id).update(
+        state=state, lease_owner=None, lease_expires_at=None,
+        finished_at=timezone.now(), updated_at=timezone.now(), **_progress_fields(status)
+    )
+
+@sync_to_async
+def release_job(job_id, worker_id, status):
+    """Puts an interrupted job back in the queue so another worker resumes it."""
+    ScrapeJob.objects.filter(pk=job_id, lease_owner=worker_id).update(
+        state='queued', lease_owner=None, lease_expires_at=None, updated_at=timezone.now(), **_progress_fields(status)
+    )
+
+# ----------------------------------------------------
+# --- Worker ---
+# ----------------------------------------------------
+
+class CrawlerPool:
+    """
+    A fixed set of started AsyncWebCrawler instances reused across jobs, so each
+    job does not pay for launching a fresh Chromium.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._idle = asyncio.Queue()
+
+    async def _new_crawler(self):
+        crawler = AsyncWebCrawler()
+        await crawler.__aenter__()
+        return crawler
+
+    async def start(self):
+        for _ in range(self.size):
+            self._idle.put_nowait(await self._new_crawler())
+
+    async def close(self):
+        while not self._idle.empty():
+            crawler = self._idle.get_nowait()
+            try:
+                await crawler.__aexit__(None, None, None)
+            except Exception as e:
+                print(f"Error closing crawler: {e}")
+
+    async def _replace(self, crawler):
+        try:
+            await crawler.__aexit__(None, None, None)
+        except Exception:
+            pass
+        try:
+            self._idle.put_nowait(await self._new_crawler())
+        except Exception as e:
+            print(f"Error starting replacement crawler: {e}")
+
+    @asynccontextmanager
+    async def crawler(self):
+        crawler = await self._idle.get()
+        healthy = True
+        try:
+            yield crawler
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            if healthy:
+                self._idle.put_nowait(crawler)
+            else:
+                # The browser may be in a bad state; replace it rather than hand it to the next job
+                await self._replace(crawler)
+
+
+class ScrapeWorker:
+    """Leases jobs from ScrapeJob and runs up to `max_jobs` of them concurrently."""
+
+    def __init__(self, max_jobs=None, poll_interval=None):
+        self.max_jobs = max_jobs or _setting('SCRAPE_WORKER_MAX_JOBS', 2)
+        self.poll_interval = poll_interval or _setting('SCRAPE_WORKER_POLL_INTERVAL', 2)
+        self.heartbeat_interval = _setting('SCRAPE_JOB_HEARTBEAT_SECONDS', 10)
+        self.publish_interval = _setting('SCRAPE_STATUS_PUBLISH_INTERVAL', 0.5)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.loop_lag = LoopLagMonitor()
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        pool = CrawlerPool(self.max_jobs)
+        await pool.start()
+        self.loop_lag.start()
+        print(f"Scrape worker {self.worker_id} started ({self.max_jobs} concurrent jobs).")
+
+        tasks = set()
+        try:
+            while not self._stopping.is_set():
+                if len(tasks) < self.max_jobs:
+                    job = await lease_next_job(self.worker_id)
+                    if job:
+                        task = asyncio.create_task(self.run_job(job, pool))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                        continue
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Running jobs are released back to the queue and resume elsewhere
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await pool.close()
+            self.loop_lag.stop()
+            await asyncio.to_thread(shutdown_executors)
+            print(f"Scrape worker {self.worker_id} stopped.")
+
+    async def _publish_progress(self, job, status):
+        # Progress goes to the shared cache only (no ORM), and only when something changed.
+        # Loop lag rides along with real changes rather than triggering publishes itself.
+        last_snapshot = None
+        while True:
+            snapshot = {key: value for key, value in status.items() if key not in ("version", "loop_lag")}
+            if snapshot != last_snapshot:
+                status["loop_lag"] = self.loop_lag.snapshot()
+                publish_status(job, status)
+                last_snapshot = snapshot
+            await asyncio.sleep(self.publish_interval)
+
+    async def _heartbeat(self, job, status, job_task):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                renewed = await save_job_progress(job.pk, self.worker_id, status)
+            except DatabaseError as e:
+                # A transient error (e.g. "database is locked") must not end the renewals,
+                # or the lease expires and another worker runs the job a second time
+                print(f"Heartbeat for scrape job {job.pk} failed: {e}; retrying.")
+                continue
+            if not renewed:
+                print(f"Lost lease on scrape job {job.pk}; stopping it.")
+                job_task.cancel()
+                return
+
+    async def run_job(self, job, pool):
+        # Imported here because bot.views imports this module to enqueue jobs
+        from .views import run_scraper
+
+        status = initial_status(job.user_id, job.rem_link)
+        status.update({
+            "version": (job.status or {}).get("version", 0),
+            "resume_position": job.resume_position,
+            "last_completed_url": job.last_completed_url,
+        })
+        print(f"Running scrape job {job.pk} ({job.scrape_mode} {job.scrape_url}), attempt {job.attempts}")
+
+        heartbeat = asyncio.create_task(self._heartbeat(job, status, asyncio.current_task()))
+        publisher = asyncio.create_task(self._publish_progress(job, status))
+        try:
+            async with pool.crawler() as crawler:
+                await run_scraper(job.scrape_mode, job.scrape_url, status,
+                                  crawler=crawler, resume_position=job.resume_position)
+            publisher.cancel()
+            status["loop_lag"] = self.loop_lag.snapshot()
+            # Final snapshots get their new version before the row is written: web processes
+            # without the shared cache serve the row, and pollers revalidate on the version
+            bump_version(status)
+            await finish_job(job.pk, self.worker_id, status, 'done')
+            publish_status(job, status, state='done', bump=False)
+        except asyncio.CancelledError:
+            publisher.cancel()
+            bump_version(status)
+            await release_job(job.pk, self.worker_id, status)
+            publish_status(job, status, state='queued', bump=False)
+            raise
+        except Exception as e:
+            publisher.cancel()
+            print(f"Scrape job {job.pk} failed: {e}")
+            status["error"] = f"Scrape job failed: {str(e)}"
+            bump_version(status)
+            await finish_job(job.pk, self.worker_id, status, 'failed')
+            publish_status(job, status, state='failed', bump=False)
+        finally:
+            heartbeat.cancel()
+            publisher.cancel()
@@ -0,0 +1,47 @@
+import os
+import resource
+import time
+
+# Imported by the benchmark's child processes: keep Django (and the app's models) out of here,
+# so each process only loads the backend being measured.
+
+def rss_mb():
+    """Current resident set size in MB (Linux), or the peak RSS elsewhere."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_backend(spec, texts, batch_size, repeat):
+    """
+    Runs in a fresh process so each backend's import and model memory is measured on its own.
+    Returns load time, RSS growth, single-query latencies, batch throughput and the vectors.
+    """
+    from bot.embedding_backends import create_backend
+
+    baseline_rss = rss_mb()
+    started = time.perf_counter()
+    backend = create_backend(**spec)
+    backend.encode(texts[:1])  # first call initialises lazily allocated buffers
+    load_seconds = time.perf_counter() - started
+    loaded_rss = rss_mb()
+
+    latencies = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        backend.encode([texts[i % len(texts)]])
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    vectors = backend.encode(texts, batch_size=batch_size)
+    batch_seconds = time.perf_counter() - started
+
+    return {
+        'load_s': load_seconds,
+        'rss_mb': loaded_rss - baseline_rss,
+        'latencies': latencies,
+        'docs_per_s': len(texts) / batch_seconds,
+        'vectors': vectors,
+    }
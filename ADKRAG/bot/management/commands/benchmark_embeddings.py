@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.chunking import split_into_chunks
+from bot.embedding_backends import ONNX_FILENAME, ONNX_INT8_FILENAME, TORCH_SUBDIR
+from bot.extractors import extract_with_bs4
+
+from ._embedding_probe import measure_backend
+
+FIXTURES_DIR = Path(__file__).resolve().parents[2] / 'fixtures' / 'html'
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+
+class Command(BaseCommand):
+    """
+    Compares the embedding backends on the same passages: model load time, memory,
+    single-query encode latency (the search path), batch throughput (the ingest path)
+    and cosine similarity of each backend's vectors to the torch reference.
+    """
+    help = "Benchmark encode latency, throughput and RSS of the torch, onnx and onnx-int8 embedding backends."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+        parser.add_argument('--onnx-path', default=getattr(settings, 'EMBEDDING_ONNX_PATH', None))
+        parser.add_argument('--texts', type=int, default=256, help="Number of passages encoded in the batch run.")
+        parser.add_argument('--batch-size', type=int, default=32)
+        parser.add_argument('--repeat', type=int, default=100, help="Single-query encodes timed per backend.")
+        parser.add_argument('--threads', type=int, default=getattr(settings, 'EMBEDDING_THREADS', None))
+
+    def sample_texts(self, count):
+        from bot.models import DocumentChunk
+
+        texts = list(DocumentChunk.objects.values_list('text', flat=True)[:count])
+        if not texts:
+            # No corpus yet: use passages of the saved HTML fixtures
+            for path in sorted(FIXTURES_DIR.glob('*.html')):
+                texts += split_into_chunks(extract_with_bs4(path.read_text(encoding='utf-8'))['content'], size=60, overlap=10)
+        if not texts:
+            raise CommandError("No passages to encode: scrape some pages first.")
+        return (texts * (count // len(texts) + 1))[:count]
+
+    def backend_spec(self, name, options):
+        onnx_path = options['onnx_path']
+        if name == 'torch':
+            local_copy = os.path.join(onnx_path, TORCH_SUBDIR) if onnx_path else None
+            model_path = getattr(settings, 'EMBEDDING_MODEL_PATH', None) or (
+                local_copy if local_copy and os.path.isdir(local_copy) else None
+            )
+            return {'kind': 'torch', 'model_path': model_path, 'threads': options['threads']}
+        filename = ONNX_INT8_FILENAME if name == 'onnx-int8' else ONNX_FILENAME
+        if not onnx_path or not os.path.exists(os.path.join(onnx_path, filename)):
+            return None
+        return {'kind': 'onnx', 'onnx_path': onnx_path, 'quantized': name == 'onnx-int8', 'threads': options['threads']}
+
+    def handle(self, *args, **options):
+        texts = self.sample_texts(options['texts'])
+        self.stdout.write(f"{len(texts)} passages, batch size {options['batch_size']}, "
+                          f"{options['repeat']} single-query encodes, threads={options['threads'] or 'default'}")
+
+        header = (f"{'backend':<10} {'load s':>7} {'RSS MB':>7} {'p50 ms':>7} {'p99 ms':>7} "
+                  f"{'docs/s':>8} {'cos mean':>9} {'cos min':>8}")
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        context = multiprocessing.get_context('spawn')
+        reference = None
+        for name in options['backends']:
+            spec = self.backend_spec(name, options)
+            if spec is None:
+                self.stdout.write(f"{name:<10} skipped: run `manage.py export_embedding_model --quantize` first")
+                continue
+            try:
+                with context.Pool(1) as pool:
+                    result = pool.apply(measure_backend, (spec, texts, options['batch_size'], options['repeat']))
+            except Exception as e:
+                self.stdout.write(f"{name:<10} failed: {e}")
+                continue
+
+            vectors = result['vectors']
+            if name == 'torch':
+                reference = vectors
+            if reference is not None:
+                cosines = (vectors * reference).sum(axis=1) / (
+                    np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1)
+                )
+                cos_mean, cos_min = f"{cosines.mean():.5f}", f"{cosines.min():.5f}"
+            else:
+                cos_mean = cos_min = 'n/a'
+
+            ms = np.array(result['latencies']) * 1000
+            self.stdout.write(
+                f"{name:<10} {result['load_s']:>7.2f} {result['rss_mb']:>7.0f} {np.percentile(ms, 50):>7.2f} "
+                f"{np.percentile(ms, 99):>7.2f} {result['docs_per_s']:>8.1f} {cos_mean:>9} {cos_min:>8}"
+            )
@@ -0,0 +1,76 @@
+import time
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.extractors import EXTRACTORS, extract_with_bs4, lxml
+
+FIXTURES_DIR = Path(__file__).resolve().parents[2] / 'fixtures' / 'html'
+METADATA_FIELDS = ('name', 'meta_title', 'meta_description', 'meta_keywords')
+
+
+def line_overlap(reference, candidate):
+    """Share of the reference text lines (with multiplicity) that the candidate also produced."""
+    reference_lines, candidate_lines = reference.split('\n'), candidate.split('\n')
+    remaining = {}
+    for line in candidate_lines:
+        remaining[line] = remaining.get(line, 0) + 1
+    matched = 0
+    for line in reference_lines:
+        if remaining.get(line):
+            remaining[line] -= 1
+            matched += 1
+    return matched / len(reference_lines) if reference_lines else 1.0
+
+
+class Command(BaseCommand):
+    """
+    Times the SCRAPE_EXTRACTOR implementations over saved HTML pages and checks
+    their output against the BeautifulSoup extractor that process_url used originally.
+    """
+    help = "Benchmark the HTML extractors (ms/page) and compare their output with the BeautifulSoup baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=str(FIXTURES_DIR), help="Directory of saved .html pages.")
+        parser.add_argument('--repeat', type=int, default=20, help="Extractions per page and extractor.")
+        parser.add_argument('--extractors', nargs='+', default=list(EXTRACTORS), choices=EXTRACTORS)
+
+    def handle(self, *args, **options):
+        pages = {path.name: path.read_text(encoding='utf-8', errors='replace')
+                 for path in sorted(Path(options['path']).glob('*.html'))}
+        if not pages:
+            raise CommandError(f"No .html files found in {options['path']}.")
+        extractors = [name for name in options['extractors'] if name != 'lxml' or lxml is not None]
+        if len(extractors) < len(options['extractors']):
+            self.stdout.write(self.style.WARNING("lxml is not installed; skipping the lxml extractor."))
+
+        total_kb = sum(len(html) for html in pages.values()) / 1024
+        self.stdout.write(f"{len(pages)} pages ({total_kb:.0f} KB), {options['repeat']} runs each")
+
+        header = f"{'extractor':<10} {'mean ms':>9} {'p50 ms':>8} {'p99 ms':>8} {'pages/s':>9} {'metadata':>9} {'text':>7}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        baseline = {name: extract_with_bs4(html) for name, html in pages.items()}
+        for extractor in extractors:
+            extract = EXTRACTORS[extractor]
+            timings = []
+            metadata_matches, text_overlap = 0, []
+            for name, html in pages.items():
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    result = extract(html)
+                    timings.append(time.perf_counter() - start)
+
+                expected = baseline[name]
+                metadata_matches += all(result[field] == expected[field] for field in METADATA_FIELDS)
+                text_overlap.append(line_overlap(expected['content'], result['content']))
+                if result != expected:
+                    self.stdout.write(f"  {extractor}: output differs from bs4 on {name}")
+
+            ms = np.array(timings) * 1000
+            self.stdout.write(
+                f"{extractor:<10} {ms.mean():>9.2f} {np.percentile(ms, 50):>8.2f} {np.percentile(ms, 99):>8.2f} "
+                f"{1000 / ms.mean():>9.1f} {metadata_matches:>5}/{len(pages):<3} {np.mean(text_overlap):>7.1%}"
+            )
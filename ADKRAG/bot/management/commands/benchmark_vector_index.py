@@ -0,0 +1,118 @@
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from bot.vector_index import (
+    INDEX_TYPES, apply_search_params, build_index, get_index_config, prepare_vectors, read_index_file,
+)
+
+
+def synthetic_corpus(n, dimension, n_clusters, seed):
+    """
+    Generates normalized, clustered vectors that roughly mimic sentence embeddings
+    (uniform random vectors make every ANN index look equally bad).
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dimension)).astype('float32')
+    assignments = rng.integers(0, n_clusters, size=n)
+    vectors = centers[assignments] + 0.35 * rng.normal(size=(n, dimension)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+class Command(BaseCommand):
+    """
+    Compares the configurable FAISS backends on a synthetic corpus so VECTOR_INDEX
+    can be chosen from measured recall@k (1 - recall is the loss against exact search),
+    p50/p99 latency, bytes per vector and the time to load the saved file, both read
+    into memory and memory-mapped (VECTOR_INDEX MMAP).
+    """
+    help = "Benchmark recall@k, latency, size and load time of the VECTOR_INDEX backends against the flat baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100_000, help="Number of corpus vectors.")
+        parser.add_argument('--dimension', type=int, default=384, help="Vector dimension (all-MiniLM-L6-v2 uses 384).")
+        parser.add_argument('--queries', type=int, default=1000, help="Number of query vectors.")
+        parser.add_argument('--k', type=int, default=10, help="Neighbours retrieved per query.")
+        parser.add_argument('--clusters', type=int, default=500, help="Topic clusters in the synthetic corpus.")
+        parser.add_argument('--types', nargs='+', default=list(INDEX_TYPES), choices=INDEX_TYPES)
+        parser.add_argument('--nprobe', nargs='+', type=int, default=[8, 16, 64], help="IVF nprobe values to sweep.")
+        parser.add_argument('--ef-search', nargs='+', type=int, default=[32, 64, 128], help="HNSW efSearch values to sweep.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        k = options['k']
+        corpus = synthetic_corpus(options['size'], options['dimension'], options['clusters'], options['seed'])
+        queries = synthetic_corpus(options['queries'], options['dimension'], options['clusters'], options['seed'] + 1)
+        ids = np.arange(len(corpus), dtype='int64')
+
+        self.stdout.write(f"Corpus: {len(corpus)} x {options['dimension']}, {len(queries)} queries, k={k}")
+
+        # Exact baseline used as ground truth for recall
+        baseline = faiss.IndexFlatL2(corpus.shape[1])
+        baseline.add(corpus)
+        _, ground_truth = baseline.search(queries, k)
+
+        header = (f"{'backend':<12} {'param':<14} {'build s':>8} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8} "
+                  f"{'MB':>8} {'B/vec':>7} {'read ms':>8} {'mmap ms':>8}")
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        for index_type in options['types']:
+            config = get_index_config({'TYPE': index_type})
+            vectors = prepare_vectors(corpus, config)
+
+            start = time.perf_counter()
+            index = build_index(vectors, ids, config)
+            build_seconds = time.perf_counter() - start
+            size_bytes = len(faiss.serialize_index(index))
+            size_mb = size_bytes / (1024 * 1024)
+            bytes_per_vector = size_bytes / len(corpus)
+            read_ms, mmap_ms = self._load_times(index)
+
+            if index_type in ('ivf_flat', 'ivf_pq'):
+                sweep = [('nprobe', value, {'NPROBE': value}) for value in options['nprobe']]
+            elif index_type == 'hnsw_flat':
+                sweep = [('efSearch', value, {'EF_SEARCH': value}) for value in options['ef_search']]
+            else:
+                sweep = [('-', '', {})]
+
+            for name, value, overrides in sweep:
+                search_config = get_index_config({'TYPE': index_type, **overrides})
+                apply_search_params(index, search_config)
+                recall, p50, p99 = self._measure(index, prepare_vectors(queries, search_config), ground_truth, k)
+                param = f"{name}={value}" if value != '' else name
+                self.stdout.write(
+                    f"{index_type:<12} {param:<14} {build_seconds:>8.2f} {recall:>9.3f} {p50:>8.3f} {p99:>8.3f} "
+                    f"{size_mb:>8.1f} {bytes_per_vector:>7.0f} {read_ms:>8.1f} {mmap_ms:>8.1f}"
+                )
+
+    @staticmethod
+    def _load_times(index):
+        """Saves the index and times loading it back, read into memory and memory-mapped."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'index.faiss')
+            faiss.write_index(index, path)
+            timings = []
+            for mmap in (False, True):
+                start = time.perf_counter()
+                loaded, _ = read_index_file(path, mmap=mmap)
+                timings.append((time.perf_counter() - start) * 1000)
+                del loaded
+            return timings
+
+    @staticmethod
+    def _measure(index, queries, ground_truth, k):
+        latencies = []
+        hits = 0
+        for i, query in enumerate(queries):
+            start = time.perf_counter()
+            _, result_ids = index.search(query.reshape(1, -1), k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(set(result_ids[0].tolist()) & set(ground_truth[i].tolist()))
+        recall = hits / (len(queries) * k)
+        return recall, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
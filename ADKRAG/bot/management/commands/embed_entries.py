@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from bot.chunking import rebuild_chunks_for_entries
+from bot.embeddings import content_checksum
+from bot.models import ScrapedDataEntry
+from bot.vector_index import get_index_manager
+
+
+class Command(BaseCommand):
+    """
+    Backfills DocumentChunk passages and embeddings for ScrapedDataEntry rows that
+    have none yet, or whose content_summary changed since they were last chunked.
+    """
+    help = "Chunk and embed scraped entries whose passages are missing or stale, then rebuild the vector index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=64, help="Number of entries chunked and encoded per batch.")
+        parser.add_argument('--force', action='store_true', help="Re-chunk every entry, even if it looks up to date.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        force = options['force']
+
+        entries = ScrapedDataEntry.objects.only('id', 'url', 'content_summary', 'embedding_checksum')
+
+        pending = [
+            entry for entry in entries.iterator(chunk_size=batch_size)
+            if force or entry.embedding_checksum != content_checksum(entry.content_summary)
+        ]
+        self.stdout.write(f"{len(pending)} entries need chunking.")
+
+        total_chunks = 0
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            # The index is rebuilt once at the end instead of once per batch
+            total_chunks += rebuild_chunks_for_entries(batch, update_index=False, batch_size=batch_size)
+            self.stdout.write(f"Chunked {start + len(batch)}/{len(pending)} entries ({total_chunks} passages)")
+
+        if pending:
+            manager = get_index_manager()
+            manager.rebuild(version=manager.bump_db_version())
+
+        self.stdout.write(self.style.SUCCESS("Embedding backfill complete."))
@@ -0,0 +1,85 @@
+import inspect
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.embedding_backends import (
+    EMBEDDING_MODEL_NAME, ONNX_FILENAME, ONNX_INT8_FILENAME, TORCH_SUBDIR,
+)
+
+
+class Command(BaseCommand):
+    """
+    Exports the sentence-transformers model to ONNX for the onnx embedding backend.
+    Writes model.onnx, tokenizer.json, optionally the dynamically int8-quantized
+    model_int8.onnx, and a local copy of the torch model under sentence-transformers/.
+    """
+    help = "Export the embedding model to ONNX (optionally int8-quantized) into EMBEDDING_ONNX_PATH."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=getattr(settings, 'EMBEDDING_MODEL_PATH', None) or EMBEDDING_MODEL_NAME,
+                            help="sentence-transformers model name or local directory to export.")
+        parser.add_argument('--output', default=getattr(settings, 'EMBEDDING_ONNX_PATH', None),
+                            help="Output directory (defaults to EMBEDDING_ONNX_PATH).")
+        parser.add_argument('--quantize', action='store_true', help="Also write a dynamically int8-quantized model.")
+        parser.add_argument('--opset', type=int, default=14)
+
+    def handle(self, *args, **options):
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise CommandError(f"Exporting needs torch and sentence-transformers: {e}")
+        output = options['output']
+        if not output:
+            raise CommandError("Pass --output or set EMBEDDING_ONNX_PATH.")
+        os.makedirs(output, exist_ok=True)
+
+        st_model = SentenceTransformer(options['model'], device='cpu')
+        transformer = st_model[0].auto_model.eval()
+        tokenizer = st_model.tokenizer
+
+        sample = tokenizer(["An example sentence to trace the model."], return_tensors='pt')
+        input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+
+        class TokenEmbeddings(torch.nn.Module):
+            # Positional inputs in input_names order -> last hidden state (pooling happens in NumPy)
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, *inputs):
+                return self.model(**dict(zip(input_names, inputs)))[0]
+
+        onnx_path = os.path.join(output, ONNX_FILENAME)
+        dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names + ['token_embeddings']}
+        export_options = {}
+        if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+            # Newer torch defaults to the dynamo exporter, which does not take dynamic_axes
+            export_options['dynamo'] = False
+        with torch.no_grad():
+            torch.onnx.export(
+                TokenEmbeddings(transformer), tuple(sample[name] for name in input_names), onnx_path,
+                input_names=input_names, output_names=['token_embeddings'],
+                dynamic_axes=dynamic_axes, opset_version=options['opset'], **export_options,
+            )
+        self.stdout.write(f"Wrote {onnx_path} ({os.path.getsize(onnx_path) / 2**20:.1f} MB)")
+
+        # tokenizer.json is what the `tokenizers` library loads; the torch copy keeps both backends offline
+        tokenizer.save_pretrained(output)
+        st_model.save(os.path.join(output, TORCH_SUBDIR))
+
+        if options['quantize']:
+            try:
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+            except ImportError as e:
+                raise CommandError(f"Quantizing needs onnxruntime: {e}")
+            int8_path = os.path.join(output, ONNX_INT8_FILENAME)
+            quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+            self.stdout.write(f"Wrote {int8_path} ({os.path.getsize(int8_path) / 2**20:.1f} MB)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Set EMBEDDING_BACKEND=onnx (and EMBEDDING_ONNX_QUANTIZED=true for int8) to use the export, "
+            f"or EMBEDDING_MODEL_PATH={os.path.join(output, TORCH_SUBDIR)} for offline torch."
+        ))
@@ -0,0 +1,48 @@
+import os
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.embedding_sidecar import EmbeddingServer
+from bot.embeddings import load_backend
+
+
+class Command(BaseCommand):
+    """
+    Long-running embedding sidecar: loads the embedding model once and serves encode
+    requests from every web and scrape worker on the host over a unix socket. Point
+    the workers at it with EMBEDDING_SIDECAR_SOCKET.
+    """
+    help = "Serve the embedding model to local workers over a unix socket."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=getattr(settings, 'EMBEDDING_SIDECAR_SOCKET', None),
+                            help="Unix socket path (default: EMBEDDING_SIDECAR_SOCKET).")
+
+    def handle(self, *args, **options):
+        socket_path = options['socket']
+        if not socket_path:
+            raise CommandError("Pass --socket or set EMBEDDING_SIDECAR_SOCKET.")
+
+        started = time.perf_counter()
+        # The sidecar itself must load the real model, not a client of itself
+        backend = load_backend(use_sidecar=False)
+        self.stdout.write(f"Loaded the {backend.name} embedding backend in {time.perf_counter() - started:.1f}s")
+
+        server = EmbeddingServer(socket_path, backend)
+
+        def stop(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, stop)
+        self.stdout.write(self.style.SUCCESS(f"Serving embeddings on {socket_path}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
@@ -0,0 +1,38 @@
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand
+
+from bot.jobs import ScrapeWorker
+
+
+class Command(BaseCommand):
+    """
+    Long-running worker that leases ScrapeJob rows and crawls them with a pool of
+    warm browsers. Run one or more per deployment; jobs of a stopped or crashed
+    worker are picked up again once their lease expires.
+    """
+    help = "Process queued scrape jobs from the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-jobs', type=int, default=None,
+                            help="Jobs run concurrently by this worker (default: SCRAPE_WORKER_MAX_JOBS).")
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help="Seconds between checks for new jobs (default: SCRAPE_WORKER_POLL_INTERVAL).")
+
+    def handle(self, *args, **options):
+        asyncio.run(self._run(options['max_jobs'], options['poll_interval']))
+
+    async def _run(self, max_jobs, poll_interval):
+        worker = ScrapeWorker(max_jobs=max_jobs, poll_interval=poll_interval)
+
+        # Stop leasing on SIGTERM/SIGINT; running jobs are released back to the queue
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, worker.stop)
+            except NotImplementedError:
+                # Windows event loops do not support signal handlers
+                pass
+
+        await worker.run()
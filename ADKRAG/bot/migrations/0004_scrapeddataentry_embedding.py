@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0003_alter_scrapeddataentry_content_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapeddataentry',
+            name='embedding',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='scrapeddataentry',
+            name='embedding_checksum',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0004_scrapeddataentry_embedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VectorIndexState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Vector Index State',
+                'verbose_name_plural': 'Vector Index State',
+            },
+        ),
+    ]
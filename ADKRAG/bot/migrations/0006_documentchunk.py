@@ -0,0 +1,71 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:00
+
+import hashlib
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def reuse_page_embeddings(apps, schema_editor):
+    """
+    Carries the whole-page embeddings over as passage embeddings. A page no longer than
+    one chunk becomes a single chunk of the same words, so its vector is reused as is
+    (the tokenizer ignores the whitespace differences). Longer pages, and pages whose
+    text changed since they were embedded, are left for `manage.py embed_entries`.
+    """
+    ScrapedDataEntry = apps.get_model('bot', 'ScrapedDataEntry')
+    DocumentChunk = apps.get_model('bot', 'DocumentChunk')
+    VectorIndexState = apps.get_model('bot', 'VectorIndexState')
+    db_alias = schema_editor.connection.alias
+    chunk_size = getattr(settings, 'CHUNK_SIZE', 180)
+
+    chunks, stale_ids = [], []
+    entries = ScrapedDataEntry.objects.using(db_alias).exclude(embedding_checksum__isnull=True).only(
+        'id', 'content_summary', 'embedding', 'embedding_checksum')
+    for entry in entries.iterator():
+        text = entry.content_summary or ''
+        words = text.split()
+        current = entry.embedding_checksum == hashlib.sha256(text.encode('utf-8')).hexdigest()
+        if entry.embedding is not None and current and len(words) <= chunk_size:
+            chunks.append(DocumentChunk(entry_id=entry.id, position=0, text=' '.join(words), embedding=entry.embedding))
+        else:
+            stale_ids.append(entry.id)
+    DocumentChunk.objects.using(db_alias).bulk_create(chunks, batch_size=500)
+    ScrapedDataEntry.objects.using(db_alias).filter(id__in=stale_ids).update(embedding_checksum=None)
+
+    # The saved FAISS index is keyed by entry id; a new version makes every process rebuild it from the chunks
+    VectorIndexState.objects.using(db_alias).get_or_create(pk=1)
+    VectorIndexState.objects.using(db_alias).filter(pk=1).update(version=F('version') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0005_vectorindexstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(help_text='Order of the passage within the entry.')),
+                ('text', models.TextField()),
+                ('embedding', models.BinaryField(blank=True, editable=False, null=True)),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='bot.scrapeddataentry')),
+            ],
+            options={
+                'verbose_name': 'Document Chunk',
+                'verbose_name_plural': 'Document Chunks',
+                'ordering': ['entry', 'position'],
+                'unique_together': {('entry', 'position')},
+            },
+        ),
+        migrations.RunPython(reuse_page_embeddings, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='scrapeddataentry',
+            name='embedding',
+        ),
+    ]
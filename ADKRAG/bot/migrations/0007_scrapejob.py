@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0006_documentchunk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(db_index=True, max_length=50, verbose_name='Requested by user id')),
+                ('scrape_url', models.URLField(max_length=2000)),
+                ('scrape_mode', models.CharField(choices=[('single', 'Single Page'), ('sitemap', 'Full Sitemap')], default='single', max_length=10)),
+                ('rem_link', models.IntegerField(default=0)),
+                ('state', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='queued', max_length=10)),
+                ('lease_owner', models.CharField(blank=True, max_length=255, null=True)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('resume_position', models.PositiveIntegerField(default=0)),
+                ('last_completed_url', models.URLField(blank=True, max_length=2000, null=True)),
+                ('status', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Scrape Job',
+                'verbose_name_plural': 'Scrape Jobs',
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
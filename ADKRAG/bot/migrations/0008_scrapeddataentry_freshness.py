@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0007_scrapejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapeddataentry',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='scrapeddataentry',
+            name='http_etag',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='HTTP ETag'),
+        ),
+        migrations.AddField(
+            model_name='scrapeddataentry',
+            name='http_last_modified',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='HTTP Last-Modified'),
+        ),
+        migrations.AddField(
+            model_name='scrapeddataentry',
+            name='sitemap_lastmod',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Sitemap lastmod'),
+        ),
+        migrations.AlterField(
+            model_name='scrapejob',
+            name='scrape_mode',
+            field=models.CharField(choices=[('single', 'Single Page'), ('sitemap', 'Full Sitemap'), ('refresh', 'Refresh Sitemap')], default='single', max_length=10),
+        ),
+        # Embedded entries were chunked from their current content, so its checksum is already known
+        migrations.RunSQL(
+            "UPDATE bot_scrapeddataentry SET content_hash = embedding_checksum",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
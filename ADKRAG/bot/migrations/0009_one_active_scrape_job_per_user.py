@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:03
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fail_duplicate_active_jobs(apps, schema_editor):
+    """Keeps one active job per user (a running one first, else the oldest) so the constraint can be added."""
+    ScrapeJob = apps.get_model('bot', 'ScrapeJob')
+    jobs = ScrapeJob.objects.using(schema_editor.connection.alias)
+    active = jobs.filter(state__in=('queued', 'running')).order_by('user_id', '-state', 'created_at', 'pk')
+    kept, duplicates = set(), []
+    for pk, user_id in active.values_list('pk', 'user_id'):
+        if user_id in kept:
+            duplicates.append(pk)
+        kept.add(user_id)
+    jobs.filter(pk__in=duplicates).update(state='failed', finished_at=timezone.now(), lease_owner=None,
+                                          lease_expires_at=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0008_scrapeddataentry_freshness'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_active_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='scrapejob',
+            constraint=models.UniqueConstraint(condition=models.Q(('state__in', ('queued', 'running'))), fields=('user_id',), name='one_active_scrape_job_per_user'),
+        ),
+    ]
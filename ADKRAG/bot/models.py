@@ -19,6 +19,18 @@ class ScrapedDataEntry(models.Model):
     scraped_at = models.DateTimeField(auto_now_add=True)
     content_summary = models.TextField(verbose_name="Content Summary", null=True, blank=True)
 
+    # Checksum of the content_summary that the entry's DocumentChunk passages (and
+    # their embeddings) were built from, so unchanged content is never re-embedded.
+    embedding_checksum = models.CharField(max_length=64, null=True, blank=True, editable=False)
+
+    # Freshness data used by the "refresh" scrape mode to skip unchanged pages:
+    # checksum of the last crawled content, the HTTP validators sent back in
+    # conditional requests, and the <lastmod> the sitemap listed for the page.
+    content_hash = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    http_etag = models.CharField(max_length=255, null=True, blank=True, verbose_name="HTTP ETag")
+    http_last_modified = models.CharField(max_length=64, null=True, blank=True, verbose_name="HTTP Last-Modified")
+    sitemap_lastmod = models.DateTimeField(null=True, blank=True, verbose_name="Sitemap lastmod")
+
     class Meta:
         verbose_name = "Scraped Data Entry"
         verbose_name_plural = "Scraped Data Entries"
@@ -26,3 +38,112 @@ class ScrapedDataEntry(models.Model):
 
     def __str__(self):
         return f"{self.url} ({self.scrape_mode})"
+
+    def save(self, *args, rebuild_chunks=True, **kwargs):
+        # Imported lazily so that loading the models does not load the embedding model
+        from .embeddings import content_checksum
+
+        self.content_hash = content_checksum(self.content_summary)
+        chunks_stale = self.content_hash != self.embedding_checksum
+        super().save(*args, **kwargs)
+
+        # Re-chunk and re-embed only when the text changed since the chunks were built.
+        # Async callers pass rebuild_chunks=False and embed off the ORM thread instead.
+        if chunks_stale and rebuild_chunks:
+            from .chunking import rebuild_entry_chunks
+            rebuild_entry_chunks(self)
+
+
+class DocumentChunk(models.Model):
+    """
+    A passage of a ScrapedDataEntry's content_summary with its sentence embedding.
+    Retrieval runs over chunks, so long pages are indexed beyond the model's token limit.
+    """
+    entry = models.ForeignKey(ScrapedDataEntry, on_delete=models.CASCADE, related_name='chunks')
+    position = models.PositiveIntegerField(help_text="Order of the passage within the entry.")
+    text = models.TextField()
+    # Raw float32 bytes of the passage embedding (NULL until embedded)
+    embedding = models.BinaryField(null=True, blank=True, editable=False)
+
+    class Meta:
+        verbose_name = "Document Chunk"
+        verbose_name_plural = "Document Chunks"
+        ordering = ['entry', 'position']
+        unique_together = ('entry', 'position')
+
+    def __str__(self):
+        return f"{self.entry.url} #{self.position}"
+
+
+class VectorIndexState(models.Model):
+    """
+    Single-row table holding the version of the shared FAISS index.
+    Every add/remove bumps the version so other processes and replicas
+    can detect that their in-memory index is stale and reload it.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Vector Index State"
+        verbose_name_plural = "Vector Index State"
+
+    def __str__(self):
+        return f"Vector index v{self.version}"
+
+
+# Jobs in these states block a user from starting another one
+ACTIVE_JOB_STATES = ('queued', 'running')
+
+
+class ScrapeJob(models.Model):
+    """
+    A queued scrape request. Jobs are leased by `manage.py run_scrape_worker`
+    processes, so they survive restarts and an interrupted sitemap resumes
+    from the last contiguous completed URL.
+    """
+    STATE_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    user_id = models.CharField(max_length=50, db_index=True, verbose_name="Requested by user id")
+    scrape_url = models.URLField(max_length=2000)
+    scrape_mode = models.CharField(max_length=10, choices=[
+        ('single', 'Single Page'),
+        ('sitemap', 'Full Sitemap'),
+        ('refresh', 'Refresh Sitemap')
+    ], default='single')
+    rem_link = models.IntegerField(default=0)
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='queued', db_index=True)
+
+    # Leasing: a worker owns the job until lease_expires_at and renews it while running
+    lease_owner = models.CharField(max_length=255, null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    # Resume point: number of sitemap URLs completed without gaps, and the last of them
+    resume_position = models.PositiveIntegerField(default=0)
+    last_completed_url = models.URLField(max_length=2000, null=True, blank=True)
+
+    # Latest snapshot of the progress dict reported by /bot/api/scrape/status/
+    status = models.JSONField(default=dict, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Scrape Job"
+        verbose_name_plural = "Scrape Jobs"
+        ordering = ['created_at']
+        constraints = [
+            # Two concurrent requests cannot both queue a job for the same user
+            models.UniqueConstraint(fields=['user_id'], condition=models.Q(state__in=ACTIVE_JOB_STATES),
+                                    name='one_active_scrape_job_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.scrape_url} ({self.scrape_mode}, {self.state})"
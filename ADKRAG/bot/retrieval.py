@@ -0,0 +1,191 @@
+import numpy as np
+
+from .embeddings import from_blob
+from .models import DocumentChunk
+from .search_cache import get_cached_result, get_query_embedding, set_cached_result
+from .vector_index import get_index_manager
+
+# Upper bounds for request parameters so a single query cannot scan the whole corpus
+MAX_K = 20
+MAX_FETCH_K = 200
+DEFAULT_MMR_LAMBDA = 0.5
+
+BOOLEAN_VALUES = {True: True, False: False, 1: True, 0: False, 'true': True, 'false': False, '1': True, '0': False}
+
+def parse_bool(value, name):
+    """Parses a JSON boolean (or true/false/1/0, also as strings); raises ValueError for anything else."""
+    key = value.strip().lower() if isinstance(value, str) else value
+    if not isinstance(key, (bool, int, str)) or key not in BOOLEAN_VALUES:
+        raise ValueError(f"'{name}' must be true or false.")
+    return BOOLEAN_VALUES[key]
+
+def parse_search_params(data):
+    """
+    Validates the optional retrieval parameters of a search request.
+    Raises ValueError with a client-facing message on bad input.
+    """
+    try:
+        k = int(data.get('k', 1))
+        fetch_k = data.get('fetch_k')
+        fetch_k = int(fetch_k) if fetch_k is not None else None
+        max_distance = data.get('max_distance')
+        max_distance = float(max_distance) if max_distance is not None else None
+        mmr_lambda = float(data.get('mmr_lambda', DEFAULT_MMR_LAMBDA))
+    except (TypeError, ValueError):
+        raise ValueError("'k' and 'fetch_k' must be integers; 'max_distance' and 'mmr_lambda' must be numbers.")
+
+    if not 1 <= k <= MAX_K:
+        raise ValueError(f"'k' must be between 1 and {MAX_K}.")
+    if fetch_k is not None and not k <= fetch_k <= MAX_FETCH_K:
+        raise ValueError(f"'fetch_k' must be between 'k' and {MAX_FETCH_K}.")
+    if max_distance is not None and max_distance < 0:
+        raise ValueError("'max_distance' must not be negative.")
+    if not 0 <= mmr_lambda <= 1:
+        raise ValueError("'mmr_lambda' must be between 0 and 1.")
+    mmr = parse_bool(data.get('mmr', False), 'mmr')
+
+    return {
+        "k": k,
+        "fetch_k": fetch_k,
+        "max_distance": max_distance,
+        "mmr": mmr,
+        "mmr_lambda": mmr_lambda,
+    }
+
+def mmr_select(query_vector, candidate_vectors, k, mmr_lambda=DEFAULT_MMR_LAMBDA):
+    """
+    Maximal marginal relevance: greedily picks k candidates that are similar to the
+    query but dissimilar to the candidates already picked. Returns candidate positions.
+    """
+    query = query_vector / (np.linalg.norm(query_vector) or 1.0)
+    candidates = candidate_vectors / np.maximum(np.linalg.norm(candidate_vectors, axis=1, keepdims=True), 1e-12)
+
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+
+    selected = []
+    remaining = list(range(len(candidates)))
+    while remaining and len(selected) < k:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+            scores = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * redundancy
+        else:
+            scores = relevance[remaining]
+        best = remaining[int(np.argmax(scores))]
+        selected.append(best)
+        remaining.remove(best)
+    return selected
+
+def find_matches(question, k=1, max_distance=None, mmr=False, mmr_lambda=DEFAULT_MMR_LAMBDA, fetch_k=None):
+    """
+    Returns up to k passages for the question as a list of
+    {"chunk_id", "passage", "url", "distance"} dicts, closest first.
+
+    A single batched FAISS search retrieves a candidate pool of fetch_k passages;
+    candidates farther than max_distance (squared L2) are dropped and, when mmr
+    is enabled, the pool is reranked for diversity. Returns None if the index is empty.
+    """
+    fetch_k = fetch_k or (max(4 * k, 20) if mmr else k)
+    fetch_k = min(max(fetch_k, k), MAX_FETCH_K)
+
+    query_embedding = get_query_embedding(question)
+    distances, ids = get_index_manager().search(query_embedding, fetch_k)
+    if ids.shape[1] == 0:
+        return None
+
+    candidates = [
+        (int(chunk_id), float(distance))
+        for chunk_id, distance in zip(ids[0], distances[0])
+        if chunk_id >= 0 and (max_distance is None or distance <= max_distance)
+    ]
+    if not candidates:
+        return []
+
+    fields = ['id', 'text', 'entry__url'] + (['embedding'] if mmr else [])
+    rows = {row['id']: row for row in DocumentChunk.objects.filter(pk__in=[c[0] for c in candidates]).values(*fields)}
+    # The index can briefly reference chunks deleted by another process
+    candidates = [c for c in candidates if c[0] in rows and (not mmr or rows[c[0]]['embedding'] is not None)]
+
+    if mmr and len(candidates) > k:
+        vectors = np.vstack([from_blob(rows[chunk_id]['embedding']) for chunk_id, _ in candidates])
+        order = mmr_select(query_embedding[0], vectors, k, mmr_lambda)
+        candidates = [candidates[i] for i in order]
+    else:
+        candidates = candidates[:k]
+
+    return [
+        {
+            "chunk_id": chunk_id,
+            "passage": rows[chunk_id]['text'],
+            "url": rows[chunk_id]['entry__url'],
+            "distance": distance,
+        }
+        for chunk_id, distance in candidates
+    ]
+
+def search(question, **params):
+    """
+    Cached front end for find_matches. Results are keyed by the normalized question,
+    the parameters and the current index version, so they expire as soon as the index changes.
+    """
+    manager = get_index_manager()
+    manager.ensure_current()
+
+    matches = get_cached_result(question, params, manager.version)
+    if matches is not None:
+        return matches
+
+    matches = find_matches(question, **params)
+    if matches is not None:
+        set_cached_result(question, params, manager.version, matches)
+    return matches
+
+def build_search_payload(question, matches):
+    """
+    Returns the response body of /bot/api/search/ for the matches of a question:
+    a prompt for the agent ("answer") built from every passage, citing its source URL.
+    """
+    if not matches:
+        return {
+            "answer": f'User Question: "{question}" \n\n No sufficiently relevant content was found. Say that you do not know.',
+            "question": question,
+            "matches": [],
+            "matched_content_preview": "",
+        }
+
+    content = " \n\n ".join(
+        f'Content: "{match["passage"]}" (Source: {match["url"]})' for match in matches
+    )
+    prompt = (
+        f'User Question: "{question}" \n\n '
+        f'Based on the following relevant content, write a helpful and short reply (under 50 words): \n\n '
+        f'{content}'
+    )
+
+    best_match = matches[0]
+    return {
+        "answer": prompt,
+        "question": question,
+        "matches": matches,
+        "passage": best_match["passage"],
+        "url": best_match["url"],
+        "matched_content_preview": best_match["passage"][:50] + "..."
+    }
+
+def search_response(question, **params):
+    """
+    Runs a search and returns (status_code, payload) exactly as /bot/api/search/ answers,
+    so the HTTP endpoint and in-process callers such as the agent's search tool share it.
+    """
+    try:
+        # One batched search over the shared index
+        matches = search(question, **params)
+        if matches is None:
+            return 503, {"error": "No scraped data found in the database to search against."}
+        return 200, build_search_payload(question, matches)
+    except RuntimeError as e:
+        # Catches errors like model not loading
+        return 500, {"error": str(e)}
+    except Exception as e:
+        print(f"Error during API processing: {e}")
+        return 500, {"error": f"An internal server error occurred: {str(e)}"}
@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.core.cache import caches
+
+# Seconds a status snapshot stays in the cache after its last update
+STATUS_TTL = 24 * 3600
+# Snapshots loaded from the database fill a cache miss (after a restart or eviction). The worker
+# overwrites them with set() on its next update, since the status cache is shared between processes
+DB_FALLBACK_TTL = 60
+
+def get_status_cache():
+    """Cache shared by web processes and scrape workers (local files, or Redis when REDIS_URL is set)."""
+    return caches[getattr(settings, 'SCRAPE_STATUS_CACHE_ALIAS', 'default')]
+
+def _key(user_id):
+    return f"scrape:status:{user_id}"
+
+def build_status_payload(job, status):
+    """The /bot/api/scrape/status/ response body for a job and its progress dict."""
+    return {
+        "user_id": job.user_id,
+        "job_id": job.pk,
+        "state": job.state,
+        "version": status.get("version", 0),
+        "url": job.scrape_url,
+        "mode": job.scrape_mode,
+        "scraped_pages": status.get("scraped_pages", 0),
+        "failed_pages": status.get("failed_pages", 0),
+        "skipped_pages": status.get("skipped_pages", 0),
+        "unchanged_pages": status.get("unchanged_pages", 0),
+        "saved_pages": status.get("saved_pages", 0),
+        "last_batch_inserted": status.get("last_batch_inserted", 0),
+        "embedded_pages": status.get("embedded_pages", 0),
+        "embed_failed_pages": status.get("embed_failed_pages", 0),
+        "embed_queue": status.get("embed_queue", 0),
+        "embed_docs_per_sec": status.get("embed_docs_per_sec"),
+        "total_characters_scraped": status.get("total_characters_scraped", 0),
+        "is_scraping": job.state in ('queued', 'running') and status.get("is_scraping", True),
+        "remaining_pages": status.get("remaining_pages", 0),
+        "current_url": status.get("current_url") or job.scrape_url,
+        "file_size": status.get("file_size", 0),
+        "all_urls": [status.get("current_url") or job.scrape_url],
+        "error": status.get("error", ""),
+        # Event loop lag of the scrape worker (ms); stays low while parsing/encoding run in executors
+        "loop_lag": status.get("loop_lag"),
+    }
+
+def bump_version(status):
+    status["version"] = status.get("version", 0) + 1
+    return status["version"]
+
+def publish_status(job, status, state=None, bump=True):
+    """
+    Bumps the status version and writes the snapshot to the shared cache.
+    The version doubles as the ETag, so pollers can make conditional requests.
+    Final snapshots are bumped before they are written to the job row instead
+    (bump=False here), so web processes reading the row see a new version too.
+    """
+    if bump:
+        bump_version(status)
+    if state:
+        job.state = state
+    get_status_cache().set(_key(job.user_id), build_status_payload(job, status), timeout=STATUS_TTL)
+
+def read_status(user_id):
+    """Returns the cached status payload for a user, or None if nothing is cached."""
+    return get_status_cache().get(_key(user_id))
+
+def cache_status_from_db(job):
+    """Caches a snapshot loaded from the job row, unless a worker published a fresher one meanwhile."""
+    payload = build_status_payload(job, job.status or {})
+    get_status_cache().add(_key(job.user_id), payload, timeout=DB_FALLBACK_TTL)
+    return payload
+
+def etag_for(payload):
+    # The state is part of the tag as well, so a finished job never matches a running snapshot
+    return f'"{payload.get("job_id")}-{payload.get("version", 0)}-{payload.get("state")}"'
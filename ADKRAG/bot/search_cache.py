@@ -0,0 +1,106 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+from .embeddings import encode_texts, from_blob, to_blob
+
+# Counter names exposed by cache_stats()
+STAT_NAMES = ('embedding_hits', 'embedding_misses', 'result_hits', 'result_misses')
+
+def get_search_cache():
+    """Returns the Django cache used for search (locmem by default, Redis if configured)."""
+    return caches[getattr(settings, 'SEARCH_CACHE_ALIAS', 'default')]
+
+def normalize_question(question):
+    """Lowercases, collapses whitespace and drops trailing punctuation so near-identical questions share a key."""
+    question = re.sub(r'\s+', ' ', question.strip().lower())
+    return question.rstrip(' ?!.')
+
+def _digest(value):
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+# Hit/miss counts are kept per process and added to the shared counters in one batch every
+# STATS_FLUSH_EVERY events or STATS_FLUSH_INTERVAL seconds, instead of two cache round trips per event
+STATS_FLUSH_EVERY = 100
+STATS_FLUSH_INTERVAL = 10.0
+_pending = Counter()
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+def _count(name):
+    with _pending_lock:
+        _pending[name] += 1
+        due = sum(_pending.values()) >= STATS_FLUSH_EVERY or time.monotonic() - _last_flush >= STATS_FLUSH_INTERVAL
+    if due:
+        flush_stats()
+
+def flush_stats():
+    """Adds this process's pending hit/miss counts to the shared counters."""
+    global _last_flush
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    cache = get_search_cache()
+    for name, amount in pending.items():
+        key = f"search:stats:{name}"
+        # Counters never expire; add() is a no-op when the key already exists
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            # The counter was evicted between add() and incr()
+            cache.set(key, amount, timeout=None)
+
+def get_query_embedding(question):
+    """Returns the (1, dim) float32 embedding of a question, encoding it only on a cache miss."""
+    cache = get_search_cache()
+    # Encode the normalized text too: questions that share a key must share a vector
+    question = normalize_question(question)
+    key = f"search:embedding:{_digest(question)}"
+
+    blob = cache.get(key)
+    if blob is not None:
+        _count('embedding_hits')
+        return from_blob(blob).reshape(1, -1)
+
+    _count('embedding_misses')
+    embedding = encode_texts([question])
+    cache.set(key, to_blob(embedding[0]), timeout=getattr(settings, 'SEARCH_CACHE_EMBEDDING_TTL', 24 * 3600))
+    return np.asarray(embedding, dtype='float32')
+
+def _result_key(question, params, index_version):
+    # The index version is part of the key, so every change to the index
+    # (new or re-scraped pages, deletions) invalidates cached results at once.
+    payload = json.dumps(params, sort_keys=True)
+    return f"search:result:v{index_version}:{_digest(normalize_question(question) + payload)}"
+
+def get_cached_result(question, params, index_version):
+    result = get_search_cache().get(_result_key(question, params, index_version))
+    _count('result_hits' if result is not None else 'result_misses')
+    return result
+
+def set_cached_result(question, params, index_version, result):
+    get_search_cache().set(
+        _result_key(question, params, index_version),
+        result,
+        timeout=getattr(settings, 'SEARCH_CACHE_RESULT_TTL', 600),
+    )
+
+def cache_stats():
+    """Returns the hit/miss counters and hit ratios of both caches."""
+    flush_stats()
+    cache = get_search_cache()
+    values = cache.get_many([f"search:stats:{name}" for name in STAT_NAMES])
+    stats = {name: values.get(f"search:stats:{name}", 0) for name in STAT_NAMES}
+    for kind in ('embedding', 'result'):
+        total = stats[f'{kind}_hits'] + stats[f'{kind}_misses']
+        stats[f'{kind}_hit_ratio'] = round(stats[f'{kind}_hits'] / total, 4) if total else None
+    return stats
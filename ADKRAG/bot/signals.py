@@ -0,0 +1,49 @@
+import threading
+
+from django.db import transaction
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from .models import DocumentChunk, ScrapedDataEntry
+from .vector_index import get_index_manager
+
+# Chunk ids whose entries were deleted in the current transaction, per thread and database alias
+_pending = threading.local()
+
+def _pending_ids(using):
+    if not hasattr(_pending, 'ids'):
+        _pending.ids = {}
+    return _pending.ids.setdefault(using, set())
+
+def flush_unindexed_chunks(using):
+    """
+    Removes every chunk deleted in the committed transaction from the index in one
+    update, so a bulk delete costs one version bump (and at most one HNSW rebuild)
+    instead of one per entry.
+    """
+    pending = _pending_ids(using)
+    chunk_ids = sorted(pending)
+    pending.clear()
+    if not chunk_ids:
+        return
+    # Ids queued by a delete that was rolled back still have their rows; they stay indexed
+    existing = set()
+    for start in range(0, len(chunk_ids), 500):
+        batch = chunk_ids[start:start + 500]
+        existing.update(DocumentChunk.objects.using(using).filter(id__in=batch).values_list('id', flat=True))
+    removed = [chunk_id for chunk_id in chunk_ids if chunk_id not in existing]
+    if removed:
+        get_index_manager().remove(removed)
+
+
+@receiver(pre_delete, sender=ScrapedDataEntry)
+def unindex_scraped_entry(sender, instance, using, **kwargs):
+    """
+    Drops the entry's passages from the shared index once the delete is committed.
+    Chunk ids are collected before the cascade removes the DocumentChunk rows; the
+    first on_commit callback of the transaction removes the ids of all its deletes.
+    """
+    chunk_ids = list(instance.chunks.using(using).values_list('id', flat=True))
+    if chunk_ids:
+        _pending_ids(using).update(chunk_ids)
+        transaction.on_commit(lambda: flush_unindexed_chunks(using), using=using)
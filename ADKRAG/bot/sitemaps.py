@@ -0,0 +1,157 @@
+import asyncio
+import zlib
+from collections import deque, namedtuple
+from datetime import datetime, time, timezone as dt_timezone
+from xml.etree.ElementTree import XMLPullParser
+
+import aiohttp
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+# One <url> of a sitemap; lastmod is an aware datetime or None
+SitemapEntry = namedtuple('SitemapEntry', ['url', 'lastmod'])
+
+GZIP_MAGIC = b'\x1f\x8b'
+READ_CHUNK_SIZE = 64 * 1024
+# sitemapindex files may point at other indexes; stop following them past this depth
+MAX_SITEMAP_DEPTH = 3
+# URLs buffered per child sitemap downloading ahead of the one being read
+PREFETCH_QUEUE_SIZE = 1000
+
+def parse_lastmod(value):
+    """Parses a W3C datetime <lastmod> value (a date or a full timestamp) into an aware datetime."""
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            date = parse_date(value)
+            parsed = datetime.combine(date, time.min) if date else None
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+def _local_name(tag):
+    # Strips the "{http://www.sitemaps.org/schemas/sitemap/0.9}" namespace prefix
+    return tag.rsplit('}', 1)[-1]
+
+class SitemapReader:
+    """
+    Streams the URLs of a sitemap without holding the document in memory.
+
+    The response body is fed chunk by chunk to an incremental XML parser (gunzipped on
+    the fly for .xml.gz files), and <url> elements are yielded as soon as they close.
+    Child sitemaps of a <sitemapindex> are fetched `concurrency` at a time, but their
+    URLs are still yielded in index order, so sitemap positions stay stable for resuming.
+    Sitemaps that cannot be fetched are logged in `failed_sitemaps` and skipped.
+    """
+
+    def __init__(self, session, concurrency=None, rate_limiter=None, modified_since=None, failed_sitemaps=None):
+        self.session = session
+        self.concurrency = max(1, concurrency or getattr(settings, 'SITEMAP_FETCH_CONCURRENCY', 4))
+        self.rate_limiter = rate_limiter
+        self.modified_since = modified_since
+        self.failed_sitemaps = [] if failed_sitemaps is None else failed_sitemaps
+        self._visited = set()
+
+    async def _chunks(self, sitemap_url):
+        if self.rate_limiter:
+            await self.rate_limiter.acquire(sitemap_url)
+        async with self.session.get(sitemap_url) as response:
+            response.raise_for_status()
+            # aiohttp already undoes Content-Encoding: gzip; a .xml.gz file served
+            # as-is is recognised by its magic bytes instead of its name
+            decompressor = None
+            async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+                if decompressor is None:
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if chunk.startswith(GZIP_MAGIC) else False
+                yield decompressor.decompress(chunk) if decompressor else chunk
+            if decompressor:
+                yield decompressor.flush()
+
+    async def _parse(self, sitemap_url):
+        """Yields SitemapEntry for <url> elements and child sitemap URLs (str) for <sitemap> elements."""
+        parser = XMLPullParser(events=('end',))
+        fields = {}
+        async for chunk in self._chunks(sitemap_url):
+            parser.feed(chunk)
+            for _, element in parser.read_events():
+                name = _local_name(element.tag)
+                if name in ('loc', 'lastmod'):
+                    fields[name] = (element.text or '').strip()
+                elif name == 'url':
+                    if fields.get('loc'):
+                        yield SitemapEntry(fields['loc'], parse_lastmod(fields.get('lastmod')))
+                    fields = {}
+                elif name == 'sitemap':
+                    if fields.get('loc'):
+                        yield fields['loc']
+                    fields = {}
+                else:
+                    continue
+                # Drop finished elements so memory stays flat on 50k-URL sitemaps
+                element.clear()
+        parser.close()
+
+    async def _prefetch(self, sitemap_url, depth, queue):
+        try:
+            async for entry in self._iter(sitemap_url, depth):
+                await queue.put(entry)
+        except Exception as e:
+            print(f"Error reading sitemap {sitemap_url}: {e}")
+            self.failed_sitemaps.append(sitemap_url)
+        # Not reached when cancelled, when nobody is reading the queue anymore
+        await queue.put(None)
+
+    async def _iter(self, sitemap_url, depth):
+        if sitemap_url in self._visited:
+            return
+        self._visited.add(sitemap_url)
+
+        children = []
+        async for item in self._parse(sitemap_url):
+            if isinstance(item, str):
+                # Index files are small (at most 50k <loc> strings), so collect them first
+                if depth < MAX_SITEMAP_DEPTH:
+                    children.append(item)
+            elif self.modified_since is None or item.lastmod is None or item.lastmod > self.modified_since:
+                yield item
+
+        # Keep up to `concurrency` child sitemaps downloading ahead of the one being yielded.
+        # Each prefetch queue is bounded, so a slow consumer also throttles the downloads.
+        pending = deque()
+        children = deque(children)
+        while children or pending:
+            while children and len(pending) < self.concurrency:
+                queue = asyncio.Queue(maxsize=PREFETCH_QUEUE_SIZE)
+                pending.append((queue, asyncio.create_task(self._prefetch(children.popleft(), depth + 1, queue))))
+            queue, task = pending.popleft()
+            try:
+                while (entry := await queue.get()) is not None:
+                    yield entry
+            except BaseException:
+                task.cancel()
+                for _, other in pending:
+                    other.cancel()
+                raise
+            await task
+
+    def __call__(self, sitemap_url):
+        return self._iter(sitemap_url, 0)
+
+async def iter_sitemap_urls(sitemap_url, rate_limiter=None, modified_since=None, failed_sitemaps=None):
+    """
+    Async generator of SitemapEntry(url, lastmod) for a sitemap, a gzipped sitemap or a
+    (nested) sitemap index. With modified_since, entries whose <lastmod> is not newer are skipped.
+    Child sitemaps that could not be read are appended to `failed_sitemaps` if given.
+    """
+    timeout = aiohttp.ClientTimeout(total=None, sock_read=getattr(settings, 'SITEMAP_READ_TIMEOUT', 60))
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        reader = SitemapReader(session, rate_limiter=rate_limiter, modified_since=modified_since,
+                               failed_sitemaps=failed_sitemaps)
+        async for entry in reader(sitemap_url):
+            yield entry
@@ -1,3 +1,1114 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import faiss
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, OperationalError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import search_cache
+from .chunking import split_into_chunks
+from .embedding_backends import ONNX_FILENAME, ONNX_INT8_FILENAME, TORCH_SUBDIR, create_backend
+from .embedding_sidecar import EmbeddingServer, SidecarEmbeddingBackend
+from .embeddings import content_checksum, from_blob, to_blob
+from .extractors import extract_with_bs4, extract_with_lxml, lxml
+from .ingest import EmbeddingPipeline
+from .jobs import ScrapeWorker, enqueue_scrape_job, lease_next_job, save_job_progress
+from .models import DocumentChunk, ScrapedDataEntry, ScrapeJob, VectorIndexState
+from .ratelimit import HostRateLimiter, TokenBucket
+from .scrape_status import get_status_cache, publish_status, read_status
+from .vector_index import VectorIndexManager
+
+ONNX_PATH = getattr(settings, 'EMBEDDING_ONNX_PATH', None) or ''
+HAS_ONNX_DEPS = all(importlib.util.find_spec(name) for name in ('onnxruntime', 'tokenizers'))
+HAS_TORCH_DEPS = importlib.util.find_spec('sentence_transformers') is not None
+
+SENTENCES = [
+    "Ada Lovelace wrote the first published algorithm for Babbage's Analytical Engine.",
+    "How do I install the package on Windows?",
+    "Free shipping on orders over $50",
+    "The Trail Runner X2 combines a cushioned midsole with a 5 mm lug outsole for loose terrain. " * 12,
+    "",
+    "ok",
+]
+
+
+def cosine_similarities(a, b):
+    return (a * b).sum(axis=1) / np.maximum(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12)
+
+
+@unittest.skipUnless(HAS_ONNX_DEPS and HAS_TORCH_DEPS, "onnxruntime, tokenizers and sentence-transformers are required")
+@unittest.skipUnless(os.path.exists(os.path.join(ONNX_PATH, ONNX_FILENAME)), "run `manage.py export_embedding_model` first")
+class OnnxEmbeddingBackendTests(SimpleTestCase):
+    """The onnx backend must reproduce the torch embeddings it was exported from."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Compare against the torch copy saved with the export, so the test needs no network
+        local_copy = os.path.join(ONNX_PATH, TORCH_SUBDIR)
+        model_path = local_copy if os.path.isdir(local_copy) else getattr(settings, 'EMBEDDING_MODEL_PATH', None)
+        cls.reference = create_backend('torch', model_path=model_path).encode(SENTENCES)
+
+    def assert_matches_reference(self, backend, tolerance):
+        vectors = backend.encode(SENTENCES, batch_size=4)
+        self.assertEqual(vectors.shape, self.reference.shape)
+        self.assertEqual(vectors.dtype, np.float32)
+        self.assertGreaterEqual(cosine_similarities(vectors, self.reference).min(), tolerance)
+
+    def test_fp32_matches_torch(self):
+        self.assert_matches_reference(create_backend('onnx', onnx_path=ONNX_PATH), tolerance=0.9999)
+
+    @unittest.skipUnless(os.path.exists(os.path.join(ONNX_PATH, ONNX_INT8_FILENAME)), "no int8 export")
+    def test_int8_matches_torch(self):
+        self.assert_matches_reference(create_backend('onnx', onnx_path=ONNX_PATH, quantized=True), tolerance=0.98)
+
+    def test_batching_does_not_change_vectors(self):
+        backend = create_backend('onnx', onnx_path=ONNX_PATH)
+        one_by_one = np.vstack([backend.encode([sentence]) for sentence in SENTENCES])
+        np.testing.assert_allclose(backend.encode(SENTENCES, batch_size=32), one_by_one, atol=1e-5)
+
+    def test_vectors_are_normalized(self):
+        vectors = create_backend('onnx', onnx_path=ONNX_PATH).encode(SENTENCES)
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5)
+
+
+NESTED_MARKUP = """<html><head><title>  Trail
+  Runner </title></head><body>
+<h1><span>Trail</span> <b>Runner</b>  X2</h1>
+<p>Cushioned <em>midsole</em>,<br>5 mm <a href="#">lugs</a>.</p>
+<div><p>Nested <span> <i>inline</i> </span> text</p></div>
+</body></html>"""
+
+
+@unittest.skipIf(lxml is None, "lxml is not installed")
+class ExtractorTests(SimpleTestCase):
+    """The lxml extractor must produce exactly what the BeautifulSoup one does."""
+
+    def test_fixtures(self):
+        fixtures = os.path.join(os.path.dirname(__file__), 'fixtures', 'html')
+        for name in sorted(os.listdir(fixtures)):
+            with open(os.path.join(fixtures, name), encoding='utf-8') as f:
+                html = f.read()
+            self.assertEqual(extract_with_lxml(html), extract_with_bs4(html), name)
+
+    def test_nested_inline_markup(self):
+        page = extract_with_lxml(NESTED_MARKUP)
+        self.assertEqual(page, extract_with_bs4(NESTED_MARKUP))
+        self.assertEqual((page["name"], page["meta_title"]), ("Trail Runner X2", "Trail Runner"))
+
+
+class LengthBackend:
+    """Stand-in model: one 2-d vector per text, derived from its length."""
+    name = "length"
+
+    def encode(self, texts, batch_size=32):
+        if any(text == "boom" for text in texts):
+            raise ValueError("cannot encode boom")
+        return np.array([[len(text), batch_size] for text in texts], dtype='float32')
+
+
+class EmbeddingSidecarTests(SimpleTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.tmpdir.name, 'embed.sock')
+        self.server = EmbeddingServer(self.socket_path, LengthBackend())
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = SidecarEmbeddingBackend(self.socket_path, timeout=5)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def test_encode_round_trip(self):
+        vectors = self.client.encode(["a", "abc", "", "ünïcode"], batch_size=8)
+        self.assertEqual(vectors.dtype, np.float32)
+        np.testing.assert_array_equal(vectors, [[1, 8], [3, 8], [0, 8], [7, 8]])
+        self.assertEqual(self.client.encode([]).shape, (0,))
+
+    def test_connection_is_reused_after_errors(self):
+        with self.assertRaisesMessage(RuntimeError, "cannot encode boom"):
+            self.client.encode(["boom"])
+        self.assertEqual(self.client.ping(), {'backend': 'length'})
+        np.testing.assert_array_equal(self.client.encode(["xy"]), [[2, 32]])
+
+    def test_send_failure_is_retried_on_a_new_connection(self):
+        stale = mock.Mock()
+        stale.sendall.side_effect = BrokenPipeError("sidecar restarted")
+        self.client._local.sock = stale
+        np.testing.assert_array_equal(self.client.encode(["xy"]), [[2, 32]])
+        stale.sendall.assert_called_once()
+        stale.close.assert_called_once()
+
+    def test_timeout_after_send_is_not_retried(self):
+        calls = []
+
+        class SlowBackend(LengthBackend):
+            def encode(self, texts, batch_size=32):
+                calls.append(texts)
+                time.sleep(0.5)
+                return super().encode(texts, batch_size)
+
+        self.server.backend = SlowBackend()
+        self.client.timeout = 0.1
+        self.client._close()
+        with self.assertRaises(TimeoutError):
+            self.client.encode(["xy"])
+        time.sleep(0.6)
+        self.assertEqual(calls, [["xy"]])
+
+
+class SearchApiTests(TestCase):
+    def test_mmr_accepts_only_booleans(self):
+        from .retrieval import parse_search_params
+
+        for value, expected in [(True, True), (False, False), (1, True), (0, False),
+                                ("true", True), ("False", False), ("1", True), ("0", False)]:
+            self.assertIs(parse_search_params({"mmr": value})["mmr"], expected, value)
+        for value in ["yes", "", "2", 2, 1.0, None, []]:
+            with self.assertRaisesMessage(ValueError, "'mmr' must be true or false."):
+                parse_search_params({"mmr": value})
+
+    async def test_invalid_mmr_is_a_bad_request(self):
+        with mock.patch('bot.views.search_response') as search_response:
+            response = await self.async_client.post('/bot/api/search/', {"question": "adk", "mmr": "no"},
+                                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "'mmr' must be true or false."})
+        search_response.assert_not_called()
+
+    def test_cache_stats_are_staff_only(self):
+        from django.contrib.auth.models import User
+
+        self.assertEqual(self.client.get('/bot/api/search/cache/stats/').status_code, 302)
+        self.client.force_login(User.objects.create_user(username="staff", is_staff=True))
+        self.assertEqual(self.client.get('/bot/api/search/cache/stats/').status_code, 200)
+
+
+class SearchCacheTests(SimpleTestCase):
+    def setUp(self):
+        search_cache.flush_stats()  # also restarts the flush interval
+        search_cache.get_search_cache().clear()
+
+    def test_questions_sharing_a_key_share_the_encoded_text(self):
+        with mock.patch('bot.search_cache.encode_texts', return_value=np.ones((1, 4), dtype='float32')) as encode:
+            search_cache.get_query_embedding("What is ADK?")
+            search_cache.get_query_embedding("  what IS   adk ")
+        encode.assert_called_once_with(["what is adk"])
+
+    def test_counters_are_written_in_batches(self):
+        cache = search_cache.get_search_cache()
+        with mock.patch.object(cache, 'incr', wraps=cache.incr) as incr:
+            for _ in range(3):
+                search_cache.get_cached_result("q", {}, 0)
+            incr.assert_not_called()
+            stats = search_cache.cache_stats()
+        self.assertEqual(incr.call_count, 1)
+        self.assertEqual((stats['result_misses'], stats['result_hits']), (3, 0))
+
+
+MATCHES = [
+    {"chunk_id": 7, "passage": "ADK is a framework for building agents with tools and sessions.", "url": "https://example.com/adk", "distance": 0.42},
+    {"chunk_id": 9, "passage": "Agents call tools to fetch facts.", "url": "https://example.com/tools", "distance": 0.61},
+]
+
+
+class InProcessSearchToolTests(SimpleTestCase):
+    """The agent's in-process search tool must return exactly what /bot/api/search/ returns."""
+
+    async def assert_same_payload(self, matches):
+        from myadk.wikipedia_analyst import agent
+
+        with mock.patch('bot.retrieval.search', return_value=matches), mock.patch.object(agent, 'SEARCH_MODE', 'auto'):
+            response = await self.async_client.post('/bot/api/search/', {"question": " What is ADK? "},
+                                                    content_type='application/json')
+            tool_output = await agent.search_api(" What is ADK? ")
+        self.assertEqual(tool_output, response.content.decode())
+
+    async def test_matches(self):
+        await self.assert_same_payload(MATCHES)
+
+    async def test_no_relevant_matches(self):
+        await self.assert_same_payload([])
+
+    async def test_empty_index(self):
+        await self.assert_same_payload(None)
+
+    async def test_concurrent_searches_run_in_parallel(self):
+        from myadk.wikipedia_analyst import agent
+
+        # Both calls must be inside search_local at once to get past the barrier
+        barrier = threading.Barrier(2, timeout=5)
+
+        def search_local(question):
+            barrier.wait()
+            return question
+
+        with mock.patch.object(agent, 'search_local', search_local), mock.patch.object(agent, 'SEARCH_MODE', 'local'):
+            results = await asyncio.gather(agent.search_api("a"), agent.search_api("b"))
+        self.assertEqual(results, ["a", "b"])
+
+    async def test_local_search_closes_its_thread_connection(self):
+        from myadk.wikipedia_analyst import agent
+
+        calls = []
+
+        def search_local(question):
+            calls.append(("search", threading.get_ident()))
+            return question
+
+        def close_old_connections():
+            calls.append(("close", threading.get_ident()))
+
+        with mock.patch.object(agent, 'search_local', search_local), mock.patch.object(agent, 'SEARCH_MODE', 'local'), \
+                mock.patch('django.db.close_old_connections', close_old_connections):
+            self.assertEqual(await agent.search_api("a"), "a")
+        # Both before and after the search, in the executor thread that ran it
+        self.assertEqual([name for name, _ in calls], ["close", "search", "close"])
+        self.assertEqual(len({thread for _, thread in calls} | {threading.get_ident()}), 2)
+
+
+class VectorIndexManagerTests(TestCase):
+    """Index manager against real chunk rows, with small random vectors instead of the model."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, 'documents.faiss')
+        self.rng = np.random.default_rng(0)
+
+    def manager(self, **config):
+        return VectorIndexManager(self.path, save_interval=0, config={'MMAP': False, **config})
+
+    def add_chunks(self, count, dimension=8):
+        """Creates `count` embedded chunks (one entry each) and returns their ids and vectors."""
+        start = ScrapedDataEntry.objects.count()
+        entries = ScrapedDataEntry.objects.bulk_create([
+            ScrapedDataEntry(url=f"https://example.com/{start + i}", scraped_by_user_id="1", content_summary="text")
+            for i in range(count)
+        ])
+        vectors = self.rng.random((count, dimension), dtype='float32')
+        chunks = DocumentChunk.objects.bulk_create([
+            DocumentChunk(entry=entry, position=0, text="text", embedding=to_blob(vector))
+            for entry, vector in zip(entries, vectors)
+        ])
+        return np.array([chunk.pk for chunk in chunks], dtype='int64'), vectors
+
+    def assert_nearest(self, manager, vectors, ids):
+        _, found = manager.search(vectors, k=1)
+        np.testing.assert_array_equal(found[:, 0], ids)
+
+    def test_update_bumps_the_shared_version_and_saves(self):
+        ids, vectors = self.add_chunks(5)
+        manager = self.manager()
+        manager.rebuild()
+        base = manager.version
+        self.assertEqual(manager.ntotal, 5)
+
+        new_ids, new_vectors = self.add_chunks(2)
+        manager.update(remove_ids=ids[:1], add_ids=new_ids, vectors=new_vectors)
+        self.assertEqual(VectorIndexState.objects.get(pk=1).version, base + 1)
+
+        reloaded = self.manager()
+        self.assertTrue(reloaded.load())
+        self.assertEqual((reloaded.version, reloaded.ntotal), (base + 1, 6))
+        self.assert_nearest(reloaded, np.vstack([vectors[1:], new_vectors]), np.concatenate([ids[1:], new_ids]))
+
+    def test_stale_replica_reloads_and_conflicting_writer_rebuilds(self):
+        ids, vectors = self.add_chunks(4)
+        first, second = self.manager(), self.manager()
+        first.rebuild()
+        second.ensure_current()
+        base = second.version
+
+        new_ids, new_vectors = self.add_chunks(1)
+        first.update(add_ids=new_ids, vectors=new_vectors)
+        # `second` missed that change: its own update rebuilds from the rows instead of diverging
+        other_ids, other_vectors = self.add_chunks(1)
+        second.update(add_ids=other_ids, vectors=other_vectors)
+        self.assertEqual((second.version, second.ntotal), (base + 2, 6))
+
+        first.ensure_current()
+        self.assertEqual((first.version, first.ntotal), (base + 2, 6))
+        self.assert_nearest(first, new_vectors, new_ids)
+
+    def data_files(self):
+        return sorted(name for name in os.listdir(self.tmpdir.name) if name != 'documents.faiss.json')
+
+    def test_concurrent_saves_leave_a_consistent_manifest(self):
+        self.add_chunks(4)
+        first, second = self.manager(), self.manager()
+        first.rebuild()
+        second.ensure_current()
+        second.version += 1  # as if it had applied a change `first` has not seen
+        threads = [threading.Thread(target=manager.save) for manager in (first, second) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        reloaded = self.manager()
+        self.assertTrue(reloaded.load())
+        # Whichever manifest landed last names the file written with its own version
+        self.assertIn(reloaded.version, (first.version, second.version))
+        self.assertIn(f"documents.faiss.v{reloaded.version}.", reloaded._read_manifest()['file'])
+        self.assertEqual(reloaded.ntotal, 4)
+
+    def test_saves_keep_the_current_and_previous_data_file(self):
+        self.add_chunks(2)
+        manager = self.manager()
+        manager.rebuild()
+        for _ in range(3):
+            manager.save()
+        manifest = manager._read_manifest()
+        self.assertEqual(self.data_files(), sorted([manifest['file'], manifest['previous']]))
+
+    @unittest.skipUnless(hasattr(faiss, 'IO_FLAG_MMAP_IFC'), "FAISS build cannot memory-map indexes")
+    def test_mapped_index_is_copied_before_the_first_update(self):
+        ids, vectors = self.add_chunks(5)
+        self.manager(MMAP=True).rebuild()
+
+        mapped = self.manager(MMAP=True)
+        self.assertTrue(mapped.load())
+        self.assertTrue(mapped.mapped)
+        new_ids, new_vectors = self.add_chunks(3)
+        mapped.update(add_ids=new_ids, vectors=new_vectors)
+        self.assertFalse(mapped.mapped)
+        self.assertEqual(mapped.ntotal, 8)
+        self.assert_nearest(mapped, np.vstack([vectors, new_vectors]), np.concatenate([ids, new_ids]))
+
+    def test_pq_serves_flat_until_codebooks_can_be_trained(self):
+        ids, vectors = self.add_chunks(8)
+        manager = self.manager(TYPE='pq', PQ_M=4, PQ_NBITS=4)  # 2**4 = 16 training vectors needed
+        manager.rebuild()
+        self.assertIsInstance(faiss.downcast_index(manager.index.index), faiss.IndexFlatL2)
+        distances, _ = manager.search(vectors, k=1)
+        np.testing.assert_allclose(distances[:, 0], 0, atol=1e-6)
+        self.assert_nearest(manager, vectors, ids)
+
+        # Growing past RETRAIN_GROWTH x the fallback size rebuilds, now with enough vectors for PQ
+        new_ids, new_vectors = self.add_chunks(30)
+        manager.update(add_ids=new_ids, vectors=new_vectors)
+        self.assertIsInstance(faiss.downcast_index(manager.index.index), faiss.IndexPQ)
+        self.assertEqual(manager.ntotal, 38)
+
+    def test_bulk_delete_rebuilds_hnsw_once(self):
+        self.add_chunks(6)
+        manager = self.manager(TYPE='hnsw_flat')
+        manager.rebuild()
+        with mock.patch('bot.signals.get_index_manager', return_value=manager), \
+                mock.patch.object(manager, 'rebuild', wraps=manager.rebuild) as rebuild, \
+                self.captureOnCommitCallbacks(execute=True):
+            ScrapedDataEntry.objects.filter(url__in=[f"https://example.com/{i}" for i in range(4)]).delete()
+        rebuild.assert_called_once()
+        self.assertEqual(manager.ntotal, 2)
+
+    def test_rolled_back_delete_keeps_chunks_indexed(self):
+        ids, _ = self.add_chunks(3)
+        manager = self.manager()
+        manager.rebuild()
+        with mock.patch('bot.signals.get_index_manager', return_value=manager):
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    ScrapedDataEntry.objects.get(url="https://example.com/0").delete()
+                    transaction.set_rollback(True)
+            with self.captureOnCommitCallbacks(execute=True):
+                ScrapedDataEntry.objects.get(url="https://example.com/1").delete()
+        self.assertEqual(manager.ntotal, 2)
+        self.assertEqual(sorted(manager.index.id_map.at(i) for i in range(2)), [ids[0], ids[2]])
+
+
+class FakeCrawlerPool:
+    """Hands out a placeholder crawler; the tests below never reach a real page."""
+
+    @asynccontextmanager
+    async def crawler(self):
+        yield object()
+
+
+class ScrapeJobTests(TestCase):
+    async def enqueue(self, user_id="1", mode="sitemap"):
+        return await sync_to_async(enqueue_scrape_job)(user_id, "https://example.com/sitemap.xml", mode, 100)
+
+    async def run_leased_job(self, worker_id):
+        """Leases the next job as `worker_id` and runs it in a ScrapeWorker with that id."""
+        worker = ScrapeWorker()
+        worker.worker_id = worker_id
+        await worker.run_job(await lease_next_job(worker_id), FakeCrawlerPool())
+
+    def test_one_active_job_per_user_even_when_the_check_races(self):
+        first = enqueue_scrape_job("1", "https://example.com/a.xml", "sitemap", 100)
+        # As if a concurrent request had passed the exists() check before `first` was inserted
+        with mock.patch('django.db.models.query.QuerySet.exists', return_value=False):
+            self.assertIsNone(enqueue_scrape_job("1", "https://example.com/b.xml", "sitemap", 100))
+        self.assertEqual(list(ScrapeJob.objects.values_list('pk', flat=True)), [first.pk])
+
+        # Finished jobs do not count, and other users are unaffected
+        ScrapeJob.objects.filter(pk=first.pk).update(state='done')
+        self.assertIsNotNone(enqueue_scrape_job("1", "https://example.com/b.xml", "sitemap", 100))
+        self.assertIsNotNone(enqueue_scrape_job("2", "https://example.com/a.xml", "sitemap", 100))
+
+    def test_worker_progress_reaches_other_processes_without_redis(self):
+        job = enqueue_scrape_job("1", "https://example.com/sitemap.xml", "sitemap", 100)
+        status = dict(job.status, scraped_pages=7)
+        publish_status(job, status)
+
+        # A fresh backend instance has no in-process state, like the cache of a web process
+        other_process = caches.create_connection(settings.SCRAPE_STATUS_CACHE_ALIAS)
+        with mock.patch('bot.scrape_status.get_status_cache', return_value=other_process):
+            payload = read_status(job.user_id)
+        self.assertEqual((payload["scraped_pages"], payload["version"]), (7, status["version"]))
+
+    async def test_lease_is_exclusive_until_it_expires(self):
+        job = await self.enqueue()
+        leased = await lease_next_job("w1")
+        self.assertEqual((leased.pk, leased.lease_owner, leased.attempts), (job.pk, "w1", 1))
+        self.assertIsNone(await lease_next_job("w2"))
+
+        # w1 stopped renewing: w2 takes the job over and w1's heartbeat learns it lost the lease
+        await ScrapeJob.objects.filter(pk=job.pk).aupdate(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        taken = await lease_next_job("w2")
+        self.assertEqual((taken.lease_owner, taken.attempts), ("w2", 2))
+        self.assertFalse(await save_job_progress(job.pk, "w1", {}))
+        self.assertTrue(await save_job_progress(job.pk, "w2", {"resume_position": 5}))
+
+    async def test_job_is_failed_after_max_attempts(self):
+        job = await self.enqueue()
+        await ScrapeJob.objects.filter(pk=job.pk).aupdate(
+            state='running', attempts=3, lease_owner="w1", lease_expires_at=timezone.now() - timedelta(seconds=1))
+        with self.settings(SCRAPE_JOB_MAX_ATTEMPTS=3):
+            self.assertIsNone(await lease_next_job("w2"))
+        self.assertEqual((await ScrapeJob.objects.aget(pk=job.pk)).state, 'failed')
+
+    async def test_interrupted_job_is_released_and_resumes(self):
+        job = await self.enqueue()
+        resumed_from = []
+
+        async def interrupted_scraper(scrape_mode, scrape_url, status, crawler=None, resume_position=0):
+            resumed_from.append(resume_position)
+            status["resume_position"] = resume_position + 3
+            status["last_completed_url"] = "https://example.com/3"
+            await asyncio.Event().wait()  # until the worker shuts down
+
+        async def finishing_scraper(scrape_mode, scrape_url, status, crawler=None, resume_position=0):
+            resumed_from.append(resume_position)
+            status["resume_position"] = resume_position + 2
+
+        with mock.patch('bot.views.run_scraper', interrupted_scraper):
+            task = asyncio.create_task(self.run_leased_job("w1"))
+            while not resumed_from:
+                await asyncio.sleep(0)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        released = await ScrapeJob.objects.aget(pk=job.pk)
+        self.assertEqual((released.state, released.lease_owner), ('queued', None))
+        self.assertEqual((released.resume_position, released.last_completed_url), (3, "https://example.com/3"))
+
+        with mock.patch('bot.views.run_scraper', finishing_scraper):
+            await self.run_leased_job("w2")
+        finished = await ScrapeJob.objects.aget(pk=job.pk)
+        self.assertEqual(resumed_from, [0, 3])
+        self.assertEqual((finished.state, finished.resume_position, finished.attempts), ('done', 5, 2))
+
+    async def test_sitemap_error_fails_the_job(self):
+        job = await self.enqueue()
+
+        async def unreachable_sitemap(*args, **kwargs):
+            raise ConnectionError("sitemap unreachable")
+            yield
+
+        with mock.patch('bot.views.iter_sitemap_urls', unreachable_sitemap):
+            await self.run_leased_job("w1")
+        failed = await ScrapeJob.objects.aget(pk=job.pk)
+        self.assertEqual(failed.state, 'failed')
+        self.assertIn("sitemap unreachable", failed.status["error"])
+
+    async def test_poller_sees_completion_without_a_shared_cache(self):
+        job = await self.enqueue()
+        status_url = f"/bot/api/scrape/status/{job.user_id}/"
+        # Without REDIS_URL the web process never sees the worker's cache, only the job row
+        await sync_to_async(get_status_cache().clear)()
+        running = await self.async_client.get(status_url)
+        self.assertEqual(running.status_code, 200)
+
+        async def finishing_scraper(scrape_mode, scrape_url, status, crawler=None, resume_position=0):
+            status["scraped_pages"] = 1
+
+        with mock.patch('bot.views.run_scraper', finishing_scraper):
+            await self.run_leased_job("w1")
+        await sync_to_async(get_status_cache().clear)()
+
+        done = await self.async_client.get(status_url, headers={"If-None-Match": running["ETag"]})
+        self.assertEqual(done.status_code, 200)
+        self.assertEqual((done.json()["state"], done.json()["is_scraping"]), ("done", False))
+        unchanged = await self.async_client.get(status_url, headers={"If-None-Match": done["ETag"]})
+        self.assertEqual(unchanged.status_code, 304)
+
+    async def test_heartbeat_survives_database_errors(self):
+        worker = ScrapeWorker()
+        worker.heartbeat_interval = 0
+        job_task = mock.Mock()
+        renewals = mock.AsyncMock(side_effect=[OperationalError("database is locked"), True, False])
+        with mock.patch('bot.jobs.save_job_progress', renewals):
+            await worker._heartbeat(mock.Mock(pk=1), {}, job_task)
+        self.assertEqual(renewals.await_count, 3)
+        job_task.cancel.assert_called_once()
+
+
+@override_settings(SCRAPE_STREAM_POLL_INTERVAL=0, SCRAPE_STREAM_HEARTBEAT_SECONDS=0)
+class ScrapeStatusStreamTests(TestCase):
+    async def events(self, user_id="1"):
+        from .views import _scrape_status_events
+        return [event async for event in _scrape_status_events(user_id)]
+
+    async def test_stream_sends_deltas_heartbeats_and_done(self):
+        running = {"job_id": 1, "version": 2, "state": "running", "is_scraping": True, "scraped_pages": 1, "current_url": "https://example.com/a"}
+        progressed = dict(running, version=3, scraped_pages=2)
+        finished = dict(progressed, version=4, state="done", is_scraping=False, current_url=None)
+        with mock.patch('bot.views.read_status', side_effect=[running, running, progressed, finished]):
+            events = await self.events()
+
+        self.assertEqual(events, [
+            "retry: 3000\n\n",
+            f"event: status\ndata: {json.dumps(running)}\n\n",
+            ": heartbeat\n\n",
+            'event: status\ndata: {"scraped_pages": 2}\n\n',
+            'event: status\ndata: {"current_url": null, "is_scraping": false, "state": "done"}\n\n',
+            f"event: done\ndata: {json.dumps(finished)}\n\n",
+        ])
+
+    async def test_stream_without_a_job_ends_at_once(self):
+        await sync_to_async(get_status_cache().clear)()
+        events = await self.events("nobody")
+        self.assertEqual(len(events), 2)
+        self.assertTrue(events[1].startswith("event: done\n"))
+        self.assertIn("No scraping task found", events[1])
+
+    async def test_stream_falls_back_to_the_job_row(self):
+        job = await sync_to_async(enqueue_scrape_job)("1", "https://example.com/sitemap.xml", "sitemap", 100)
+        await ScrapeJob.objects.filter(pk=job.pk).aupdate(state='done', status=dict(job.status, is_scraping=False, scraped_pages=5))
+        await sync_to_async(get_status_cache().clear)()
+
+        events = await self.events()
+        self.assertEqual([event.split("\n")[0] for event in events[1:]], ["event: status", "event: done"])
+        done = json.loads(events[-1].split("data: ", 1)[1])
+        self.assertEqual((done["state"], done["scraped_pages"]), ("done", 5))
+
+
+class FilterNewUrlsTests(TestCase):
+    def setUp(self):
+        ScrapedDataEntry.objects.bulk_create([
+            ScrapedDataEntry(url=f"https://example.com/{name}", scraped_by_user_id="1", content_summary="text")
+            for name in ("b", "d")
+        ])
+
+    def test_new_urls_are_found_with_one_query_per_batch(self):
+        from .views import filter_new_urls
+        filter_new_urls = async_to_sync(filter_new_urls)
+
+        urls = ["https://example.com/a", "https://example.com/b/", "https://example.com/a/",
+                "https://example.com/c", "https://example.com/d", "https://example.com/e"]
+        # Five distinct URLs in batches of two
+        with mock.patch('bot.views.URL_LOOKUP_BATCH_SIZE', 2):
+            with self.assertNumQueries(3):
+                self.assertEqual(filter_new_urls(urls), [0, 3, 5])
+
+    def test_seen_urls_are_dropped_across_calls(self):
+        from .views import filter_new_urls
+        filter_new_urls = async_to_sync(filter_new_urls)
+
+        seen = set()
+        self.assertEqual(filter_new_urls(["https://example.com/a", "https://example.com/b"], seen=seen), [0])
+        self.assertEqual(filter_new_urls(["https://example.com/a/", "https://example.com/c"], seen=seen), [1])
+        with self.assertNumQueries(0):
+            self.assertEqual(filter_new_urls(["https://example.com/c/"], seen=seen), [])
+
+
+class ScrapedDataWriterTests(SimpleTestCase):
+    async def test_pages_complete_only_after_their_batch_commits(self):
+        from .views import ScrapedDataWriter
+
+        completed, status = [], {}
+        saves = mock.AsyncMock(side_effect=[DatabaseError("disk I/O error"), []])
+        writer = ScrapedDataWriter("1", "sitemap", status, batch_size=2,
+                                   on_committed=lambda position, url: completed.append(position))
+        pages = [({"url": f"https://example.com/{i}"}, (i, f"https://example.com/{i}")) for i in range(3)]
+        with mock.patch('bot.views.bulk_save_scraped_data_sync', saves), \
+                mock.patch('bot.views.rebuild_chunks_for_entries_async', mock.AsyncMock()):
+            await writer.add(*pages[0])
+            self.assertEqual(completed, [])
+            # The full batch is flushed and fails: its pages must not count as completed
+            await writer.add(*pages[1])
+            self.assertEqual(completed, [])
+            self.assertIn("disk I/O error", status["error"])
+
+            await writer.add(*pages[2])
+            await writer.flush()
+        self.assertEqual(completed, [2])
+        self.assertEqual(saves.await_args.args[0], [{"url": "https://example.com/2"}])
+
+
+class FakeCrawler:
+    async def arun(self, url):
+        html = f"<html><head><title>{url}</title></head><body><h1>Page</h1><p>Text of {url}</p></body></html>"
+        return mock.Mock(html=html, markdown="", url=url, response_headers={})
+
+
+@mock.patch('bot.ingest.embed_passages', return_value=None)
+class SitemapResumeTests(TestCase):
+    async def crawl(self, urls, failing_batches=()):
+        from . import views
+        from .sitemaps import SitemapEntry
+
+        async def sitemap(*args, **kwargs):
+            for url in urls:
+                yield SitemapEntry(url, None)
+
+        real_save = views.bulk_save_scraped_data_sync
+        calls = 0
+
+        async def save(batch, *args, **kwargs):
+            nonlocal calls
+            calls += 1
+            if calls in failing_batches:
+                raise DatabaseError("database is locked")
+            return await real_save(batch, *args, **kwargs)
+
+        status = {"user_id": "1", "rem_link": 100, "total_characters_scraped": 0}
+        with mock.patch.object(views, 'iter_sitemap_urls', sitemap), mock.patch.object(views, 'bulk_save_scraped_data_sync', save), \
+                self.settings(SCRAPE_WRITE_BATCH_SIZE=2, SCRAPE_CONCURRENCY=1, SCRAPE_RATE_PER_HOST=1000,
+                              SCRAPE_BURST_PER_HOST=1000, EXECUTOR_PROCESSES=0):
+            await views.scrape_sitemap_with_status("https://example.com/sitemap.xml", status, crawler=FakeCrawler())
+        return status
+
+    async def test_resume_point_covers_saved_pages(self, embed):
+        urls = [f"https://example.com/{i}" for i in range(5)]
+        status = await self.crawl(urls)
+        self.assertEqual((status["resume_position"], status["last_completed_url"]), (5, urls[-1]))
+        self.assertEqual(await ScrapedDataEntry.objects.acount(), 5)
+
+    async def test_failed_batch_holds_the_resume_point(self, embed):
+        urls = [f"https://example.com/{i}" for i in range(5)]
+        status = await self.crawl(urls, failing_batches={2})
+        # Pages 2 and 3 were lost with the second batch; a resumed job restarts at page 2
+        self.assertEqual((status["resume_position"], status["last_completed_url"]), (2, urls[1]))
+        self.assertEqual(await ScrapedDataEntry.objects.acount(), 3)
+
+
+class SinglePageScrapeTests(TestCase):
+    async def test_page_is_embedded_in_the_executor_thread_pool(self):
+        from .views import scrape_single_page_with_status
+
+        encoding_threads = []
+
+        def embed(passages, batch_size=64):
+            encoding_threads.append(threading.current_thread().name)
+            return None
+
+        status = {"user_id": "1", "rem_link": 1}
+        with mock.patch('bot.chunking.embed_passages', embed), self.settings(EXECUTOR_PROCESSES=0):
+            await scrape_single_page_with_status("https://example.com/a", status, crawler=FakeCrawler())
+
+        self.assertTrue(await ScrapedDataEntry.objects.filter(url="https://example.com/a").aexists())
+        # Not the thread-sensitive sync_to_async thread that all ORM calls of the loop share
+        self.assertEqual(len(encoding_threads), 1)
+        self.assertTrue(encoding_threads[0].startswith('bot-cpu'), encoding_threads[0])
+
+
+class FakeHttpSession:
+    """Answers every GET with `status` and `etag`, and records the request headers."""
+
+    def __init__(self, status=200, etag=None, error=None):
+        self.status, self.etag, self.error = status, etag, error
+        self.requests = []
+
+    @asynccontextmanager
+    async def get(self, url, headers=None):
+        self.requests.append((url, headers))
+        if self.error:
+            raise self.error
+        yield mock.Mock(status=self.status, headers={'ETag': self.etag} if self.etag else {})
+
+
+@mock.patch('bot.ingest.embed_passages', return_value=None)
+class RefreshScrapeTests(TestCase):
+    def setUp(self):
+        self.stored = {
+            entry.url: entry for entry in ScrapedDataEntry.objects.bulk_create([
+                ScrapedDataEntry(url=f"https://example.com/{name}", scraped_by_user_id="1", content_summary=f"old {name}",
+                                 embedding_checksum=content_checksum(f"old {name}"), http_etag=f'"{name}1"',
+                                 sitemap_lastmod=datetime(2024, 3, 1, tzinfo=dt_timezone.utc))
+                for name in ("a", "b", "c")
+            ])
+        }
+
+    async def test_conditional_get_sends_the_stored_validators(self, embed):
+        from .views import is_page_unchanged
+
+        known = {'http_etag': '"a1"', 'http_last_modified': "Fri, 01 Mar 2024 00:00:00 GMT"}
+        session = FakeHttpSession(status=304)
+        self.assertTrue(await is_page_unchanged(session, "https://example.com/a", known))
+        self.assertEqual(session.requests, [("https://example.com/a", {
+            'If-None-Match': '"a1"', 'If-Modified-Since': "Fri, 01 Mar 2024 00:00:00 GMT"})])
+
+        # Servers that ignore the conditional headers still reveal an unchanged page by its ETag
+        self.assertTrue(await is_page_unchanged(FakeHttpSession(etag='"a1"'), "https://example.com/a", known))
+        self.assertFalse(await is_page_unchanged(FakeHttpSession(etag='"a2"'), "https://example.com/a", known))
+        self.assertFalse(await is_page_unchanged(FakeHttpSession(error=OSError("reset")), "https://example.com/a", known))
+
+        session = FakeHttpSession(status=304)
+        self.assertFalse(await is_page_unchanged(session, "https://example.com/a", {}))
+        self.assertEqual(session.requests, [])
+
+    async def test_update_existing_rewrites_only_changed_entries(self, embed):
+        from .views import bulk_save_scraped_data_sync
+
+        batch = [
+            {"url": "https://example.com/a/", "content": "new a", "http_etag": '"a2"'},
+            {"url": "https://example.com/b", "content": "old b", "http_etag": '"b2"'},
+            {"url": "https://example.com/d", "content": "new d"},
+        ]
+        ignored = await bulk_save_scraped_data_sync(batch, "1", "sitemap")
+        self.assertEqual([entry.url for entry in ignored], ["https://example.com/d"])
+        self.assertEqual((await ScrapedDataEntry.objects.aget(url="https://example.com/a")).content_summary, "old a")
+
+        stale = await bulk_save_scraped_data_sync(batch[:2], "1", "sitemap", update_existing=True)
+        # b was rewritten with the same text, so only a needs new passages
+        self.assertEqual([entry.url for entry in stale], ["https://example.com/a"])
+        a = await ScrapedDataEntry.objects.aget(url="https://example.com/a")
+        self.assertEqual((a.pk, a.content_summary, a.http_etag), (self.stored["https://example.com/a"].pk, "new a", '"a2"'))
+        self.assertEqual((await ScrapedDataEntry.objects.aget(url="https://example.com/b")).http_etag, '"b2"')
+
+    async def test_refresh_recrawls_only_pages_that_changed(self, embed):
+        from . import views
+        from .sitemaps import SitemapEntry
+
+        newer = datetime(2024, 6, 1, tzinfo=dt_timezone.utc)
+        entries = [
+            SitemapEntry("https://example.com/a", newer),                                         # changed
+            SitemapEntry("https://example.com/b", datetime(2024, 3, 1, tzinfo=dt_timezone.utc)),  # lastmod not newer
+            SitemapEntry("https://example.com/c", newer),                                         # 304
+            SitemapEntry("https://example.com/d", None),                                          # new
+        ]
+
+        async def sitemap(*args, **kwargs):
+            for entry in entries:
+                yield entry
+
+        async def unchanged(session, url, known):
+            return url == "https://example.com/c"
+
+        status = {"user_id": "1", "rem_link": 100, "total_characters_scraped": 0}
+        with mock.patch.object(views, 'iter_sitemap_urls', sitemap), mock.patch.object(views, 'is_page_unchanged', unchanged), \
+                self.settings(SCRAPE_CONCURRENCY=1, SCRAPE_RATE_PER_HOST=1000, SCRAPE_BURST_PER_HOST=1000, EXECUTOR_PROCESSES=0):
+            await views.scrape_sitemap_with_status("https://example.com/sitemap.xml", status, crawler=FakeCrawler(),
+                                                   refresh=True)
+
+        self.assertEqual((status["skipped_pages"], status["unchanged_pages"], status["saved_pages"]), (1, 1, 2))
+        self.assertEqual(status["resume_position"], 4)
+        rows = {row.url: row async for row in ScrapedDataEntry.objects.all()}
+        self.assertIn("Text of https://example.com/a", rows["https://example.com/a"].content_summary)
+        self.assertEqual(rows["https://example.com/a"].sitemap_lastmod, newer)
+        self.assertEqual(rows["https://example.com/b"].content_summary, "old b")
+        self.assertEqual((rows["https://example.com/c"].content_summary, rows["https://example.com/c"].sitemap_lastmod),
+                         ("old c", newer))
+        self.assertIn("https://example.com/d", rows)
+
+
+def urlset(*entries):
+    urls = "".join(f"<url><loc>{loc}</loc>{f'<lastmod>{lastmod}</lastmod>' if lastmod else ''}</url>" for loc, lastmod in entries)
+    return f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'.encode()
+
+
+def sitemapindex(*locs):
+    sitemaps = "".join(f"<sitemap><loc>{loc}</loc></sitemap>" for loc in locs)
+    return f'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{sitemaps}</sitemapindex>'.encode()
+
+
+class FakeSitemapSession:
+    """Serves `documents` ({url: bytes}) in 16-byte chunks, and 404 for any other URL."""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.fetched = []
+
+    @asynccontextmanager
+    async def get(self, url):
+        self.fetched.append(url)
+        body = self.documents.get(url)
+
+        async def iter_chunked(size):
+            for start in range(0, len(body), 16):
+                yield body[start:start + 16]
+
+        def raise_for_status():
+            if body is None:
+                raise ValueError(f"404 for {url}")
+
+        yield mock.Mock(raise_for_status=raise_for_status, content=mock.Mock(iter_chunked=iter_chunked))
+
+
+class SitemapReaderTests(SimpleTestCase):
+    async def read(self, documents, url="https://example.com/sitemap.xml", **kwargs):
+        from .sitemaps import SitemapReader
+
+        self.session = FakeSitemapSession(documents)
+        self.reader = SitemapReader(self.session, concurrency=2, **kwargs)
+        return [entry async for entry in self.reader(url)]
+
+    async def test_gzipped_sitemap_with_lastmod(self):
+        entries = await self.read({"https://example.com/sitemap.xml": gzip.compress(urlset(
+            ("https://example.com/a", "2024-05-01"),
+            ("https://example.com/b", "2024-05-02T10:30:00+02:00"),
+            ("https://example.com/c", None),
+            ("https://example.com/d", "not a date"),
+        ))})
+        self.assertEqual([entry.url for entry in entries], [f"https://example.com/{name}" for name in "abcd"])
+        self.assertEqual([entry.lastmod for entry in entries], [
+            datetime(2024, 5, 1, tzinfo=dt_timezone.utc),
+            datetime(2024, 5, 2, 8, 30, tzinfo=dt_timezone.utc),
+            None,
+            None,
+        ])
+
+    async def test_nested_indexes_keep_index_order(self):
+        failed = []
+        entries = await self.read({
+            "https://example.com/sitemap.xml": sitemapindex(
+                "https://example.com/nested.xml", "https://example.com/missing.xml", "https://example.com/3.xml.gz"),
+            "https://example.com/nested.xml": sitemapindex("https://example.com/1.xml", "https://example.com/2.xml"),
+            "https://example.com/1.xml": urlset(("https://example.com/a", None), ("https://example.com/b", None)),
+            "https://example.com/2.xml": urlset(("https://example.com/c", None)),
+            "https://example.com/3.xml.gz": gzip.compress(urlset(("https://example.com/d", None))),
+        }, failed_sitemaps=failed)
+        self.assertEqual([entry.url for entry in entries], [f"https://example.com/{name}" for name in "abcd"])
+        self.assertEqual(failed, ["https://example.com/missing.xml"])
+
+    async def test_indexes_past_the_max_depth_are_not_followed(self):
+        documents = {
+            "https://example.com/sitemap.xml": sitemapindex("https://example.com/level1.xml"),
+            "https://example.com/level1.xml": sitemapindex("https://example.com/level2.xml"),
+            "https://example.com/level2.xml": urlset(("https://example.com/a", None)),
+        }
+        with mock.patch('bot.sitemaps.MAX_SITEMAP_DEPTH', 1):
+            self.assertEqual(await self.read(documents), [])
+        self.assertEqual(self.session.fetched, ["https://example.com/sitemap.xml", "https://example.com/level1.xml"])
+
+    async def test_modified_since_skips_unchanged_entries(self):
+        entries = await self.read({"https://example.com/sitemap.xml": urlset(
+            ("https://example.com/old", "2024-01-01"),
+            ("https://example.com/same", "2024-03-01"),
+            ("https://example.com/new", "2024-06-01"),
+            ("https://example.com/undated", None),
+        )}, modified_since=datetime(2024, 3, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual([entry.url for entry in entries], ["https://example.com/new", "https://example.com/undated"])
+
+
+class EmbeddingPipelineTests(TestCase):
+    def setUp(self):
+        # A page embedded from its old text, whose content has changed since
+        # bulk_create skips save(), which would chunk the entry with the real model
+        [self.entry] = ScrapedDataEntry.objects.bulk_create([ScrapedDataEntry(
+            url="https://example.com/a", scraped_by_user_id="1", content_summary="old text", embedding_checksum="stale")])
+        DocumentChunk.objects.create(entry=self.entry, position=0, text="old text", embedding=to_blob([1.0, 0.0]))
+        self.entry.content_summary = "new text that replaces it"
+
+    async def ingest(self, vectors):
+        status = {}
+        with mock.patch('bot.ingest.embed_passages', return_value=vectors):
+            async with EmbeddingPipeline(status) as pipeline:
+                await pipeline.submit([self.entry])
+        return status
+
+    async def test_failed_embedding_keeps_the_old_chunks(self):
+        status = await self.ingest(None)
+        self.assertEqual((status["embedded_pages"], status["embed_failed_pages"]), (0, 1))
+        self.assertEqual([chunk.text async for chunk in DocumentChunk.objects.all()], ["old text"])
+        self.assertEqual((await ScrapedDataEntry.objects.aget(pk=self.entry.pk)).embedding_checksum, "stale")
+
+    async def test_embedded_pages_replace_their_chunks(self):
+        status = await self.ingest(np.array([[0.0, 1.0]], dtype='float32'))
+        self.assertEqual((status["embedded_pages"], status["embed_failed_pages"]), (1, 0))
+        self.assertEqual([chunk.text async for chunk in DocumentChunk.objects.all()], ["new text that replaces it"])
+
+
+@mock.patch.multiple('bot.embeddings', _model=None, _model_error=None, _model_failed_at=None)
+class GetModelTests(SimpleTestCase):
+    def test_failed_load_is_retried_after_the_backoff(self):
+        from . import embeddings
+
+        clock = FakeClock()
+        backend = LengthBackend()
+        loads = mock.Mock(side_effect=[OSError("model files missing"), backend])
+        with mock.patch('bot.embeddings.load_backend', loads), mock.patch('bot.embeddings.time.monotonic', clock.monotonic), \
+                self.settings(EMBEDDING_LOAD_RETRY_SECONDS=60):
+            with self.assertRaisesMessage(RuntimeError, "model files missing"):
+                embeddings.get_model()
+            # Within the backoff the error is re-raised without another load
+            clock.now += 59
+            with self.assertRaisesMessage(RuntimeError, "model files missing"):
+                embeddings.get_model()
+            self.assertEqual(loads.call_count, 1)
+
+            clock.now += 1
+            self.assertIs(embeddings.get_model(), backend)
+            self.assertIs(embeddings.get_model(), backend)
+        self.assertEqual(loads.call_count, 2)
+
+
+class EmbeddingStoreTests(TestCase):
+    """Entries store their passage embeddings on save and re-encode only when the text changes."""
+
+    def setUp(self):
+        patcher = mock.patch('bot.chunking.encode_texts',
+                             side_effect=lambda texts, batch_size=32: np.ones((len(texts), 4), dtype='float32'))
+        self.encode = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_embedding_is_stored_and_reused_until_the_text_changes(self):
+        entry = ScrapedDataEntry.objects.create(url="https://example.com/a", scraped_by_user_id="1",
+                                                content_summary="Ada Lovelace wrote the first algorithm.")
+        chunk = DocumentChunk.objects.get(entry=entry)
+        np.testing.assert_array_equal(from_blob(chunk.embedding), np.ones(4, dtype='float32'))
+        self.assertEqual(entry.embedding_checksum, content_checksum(entry.content_summary))
+        self.assertEqual(from_blob(to_blob([1.5, -2])).tolist(), [1.5, -2])
+
+        entry.save()
+        self.assertEqual(self.encode.call_count, 1)
+
+        entry.content_summary = "Grace Hopper wrote the first compiler."
+        entry.save()
+        self.assertEqual(self.encode.call_count, 2)
+        self.assertEqual(list(DocumentChunk.objects.filter(entry=entry).values_list('text', flat=True)),
+                         ["Grace Hopper wrote the first compiler."])
+
+
+class SplitIntoChunksTests(SimpleTestCase):
+    def test_windows_overlap_and_cover_every_word(self):
+        words = [f"w{i}" for i in range(10)]
+        self.assertEqual(split_into_chunks(" ".join(words), size=4, overlap=1),
+                         ["w0 w1 w2 w3", "w3 w4 w5 w6", "w6 w7 w8 w9"])
+        # The last window stops at the end of the text instead of repeating a tail
+        self.assertEqual(split_into_chunks(" ".join(words[:5]), size=4, overlap=2), ["w0 w1 w2 w3", "w2 w3 w4"])
+
+    def test_short_and_empty_text(self):
+        self.assertEqual(split_into_chunks("  one\n two ", size=4, overlap=1), ["one two"])
+        self.assertEqual(split_into_chunks("", size=4, overlap=1), [])
+        self.assertEqual(split_into_chunks(None, size=4, overlap=1), [])
+
+    def test_overlap_must_be_smaller_than_size(self):
+        with self.assertRaises(ValueError):
+            split_into_chunks("a b c", size=3, overlap=3)
+
+
+class ChunkMigrationTests(TransactionTestCase):
+    """0006 turns current whole-page embeddings of short pages into chunks and marks the rest stale."""
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate([('bot', '0005_vectorindexstate')])
+        self.addCleanup(self.migrate_to_latest)
+
+    def migrate_to_latest(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_short_current_pages_keep_their_embedding(self):
+        apps = self.executor.loader.project_state([('bot', '0005_vectorindexstate')]).apps
+        Entry = apps.get_model('bot', 'ScrapedDataEntry')
+        base = apps.get_model('bot', 'VectorIndexState').objects.filter(pk=1).values_list('version', flat=True).first() or 0
+        vector = to_blob(np.arange(4))
+        short, long_text = "A  short\npage", " ".join(["word"] * (settings.CHUNK_SIZE + 1))
+        for url, text, embedding, checksum in [
+            ("https://example.com/short", short, vector, content_checksum(short)),
+            ("https://example.com/long", long_text, vector, content_checksum(long_text)),
+            ("https://example.com/changed", "new text", vector, content_checksum("old text")),
+            ("https://example.com/empty", "", None, None),
+        ]:
+            Entry.objects.create(url=url, scraped_by_user_id="1", content_summary=text,
+                                 embedding=embedding, embedding_checksum=checksum)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate([('bot', '0006_documentchunk')])
+        apps = executor.loader.project_state([('bot', '0006_documentchunk')]).apps
+        Entry = apps.get_model('bot', 'ScrapedDataEntry')
+        Chunk = apps.get_model('bot', 'DocumentChunk')
+
+        chunk = Chunk.objects.get()
+        self.assertEqual((chunk.entry.url, chunk.position, chunk.text), ("https://example.com/short", 0, "A short page"))
+        self.assertEqual(bytes(chunk.embedding), vector)
+        self.assertEqual(dict(Entry.objects.values_list('url', 'embedding_checksum')), {
+            "https://example.com/short": content_checksum(short),
+            "https://example.com/long": None,
+            "https://example.com/changed": None,
+            "https://example.com/empty": None,
+        })
+        self.assertEqual(apps.get_model('bot', 'VectorIndexState').objects.get(pk=1).version, base + 1)
+
+
+class FakeClock:
+    """Stands in for time.monotonic and asyncio.sleep: sleeping just advances the clock."""
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class RateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        for patcher in (mock.patch('bot.ratelimit.time.monotonic', self.clock.monotonic),
+                        mock.patch('bot.ratelimit.asyncio.sleep', self.clock.sleep)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_bucket_allows_a_burst_then_the_average_rate(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+
+        async def acquire(times):
+            for _ in range(times):
+                await bucket.acquire()
+
+        asyncio.run(acquire(3))
+        self.assertEqual(self.clock.sleeps, [])  # the burst is free
+        asyncio.run(acquire(2))
+        self.assertEqual(self.clock.sleeps, [0.5, 0.5])
+        self.clock.now += 10  # idle time refills only up to the capacity
+        asyncio.run(acquire(4))
+        self.assertEqual(self.clock.sleeps, [0.5, 0.5, 0.5])
+
+    def test_hosts_have_separate_buckets(self):
+        limiter = HostRateLimiter(rate=1, burst=1)
+
+        async def crawl():
+            await limiter.acquire("https://a.example/1")
+            await limiter.acquire("https://B.example/1")
+            await limiter.acquire("https://b.example/2")
+
+        asyncio.run(crawl())
+        self.assertEqual(set(limiter.buckets), {"a.example", "b.example"})
+        self.assertEqual(self.clock.sleeps, [1.0])  # only the second request to b.example waited
@@ -4,6 +4,8 @@ from . import views
 urlpatterns = [
     path('', views.scrape, name='scrape'),
     path('api/search/', views.api_search, name='api_search'),
+    path('api/search/cache/stats/', views.api_search_cache_stats, name='api_search_cache_stats'),
     path('api/scrape/', views.api_scrape, name='api_scrape'),
     path('api/scrape/status/<str:user_id>/', views.get_scrape_status, name='get_scrape_status'),
+    path('api/scrape/stream/<str:user_id>/', views.stream_scrape_status, name='stream_scrape_status'),
 ]
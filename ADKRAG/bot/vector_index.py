@@ -0,0 +1,431 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+
+import faiss
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+
+from .embeddings import from_blob
+from .models import DocumentChunk, VectorIndexState
+
+# --- Index Backends ---
+
+# Defaults for settings.VECTOR_INDEX; any key can be overridden there
+DEFAULT_INDEX_CONFIG = {
+    'TYPE': 'flat_l2',        # flat_l2 | flat_ip | flat_fp16 | pq | ivf_flat | hnsw_flat | ivf_pq
+    'NLIST': 1024,            # IVF: number of coarse clusters (capped by corpus size)
+    'NPROBE': 16,             # IVF: clusters visited per query
+    'HNSW_M': 32,             # HNSW: graph neighbours per node
+    'EF_CONSTRUCTION': 200,   # HNSW: build-time search depth
+    'EF_SEARCH': 64,          # HNSW: query-time search depth
+    'PQ_M': 16,               # PQ / IVF-PQ: sub-quantizers (must divide the dimension)
+    'PQ_NBITS': 8,            # PQ / IVF-PQ: bits per sub-quantizer code
+    'RETRAIN_GROWTH': 4.0,    # Retrain trained indexes once the corpus grows by this factor
+    'MMAP': True,             # Memory-map the vector codes of the saved index instead of copying them
+}
+
+INDEX_TYPES = ('flat_l2', 'flat_ip', 'flat_fp16', 'pq', 'ivf_flat', 'hnsw_flat', 'ivf_pq')
+
+# Exact index served by the product-quantized types until there are enough vectors to train codebooks
+PQ_FALLBACK_TYPES = {'pq': 'flat_l2', 'ivf_pq': 'ivf_flat'}
+
+# IVF k-means wants roughly this many training points per cluster
+MIN_POINTS_PER_CLUSTER = 39
+
+def get_index_config(overrides=None):
+    """Returns DEFAULT_INDEX_CONFIG merged with settings.VECTOR_INDEX and any explicit overrides."""
+    config = dict(DEFAULT_INDEX_CONFIG)
+    config.update(getattr(settings, 'VECTOR_INDEX', {}))
+    config.update(overrides or {})
+    if config['TYPE'] not in INDEX_TYPES:
+        raise ValueError(f"Unknown VECTOR_INDEX TYPE '{config['TYPE']}'. Choose one of: {', '.join(INDEX_TYPES)}.")
+    return config
+
+def uses_inner_product(config):
+    return config['TYPE'] == 'flat_ip'
+
+def needs_training(config):
+    return config['TYPE'] in ('pq', 'ivf_flat', 'ivf_pq')
+
+def pq_training_size(config):
+    """PQ codebooks need at least 2**nbits training points."""
+    return 2 ** config['PQ_NBITS']
+
+def prepare_vectors(vectors, config):
+    """Casts to contiguous float32 and L2-normalizes when the index ranks by inner product."""
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    if uses_inner_product(config):
+        vectors = vectors.copy()
+        faiss.normalize_L2(vectors)
+    return vectors
+
+def build_index(vectors, ids, config):
+    """
+    Creates an index of the configured type, trains it on `vectors` if the type
+    requires it, and adds the vectors under the given int64 ids.
+    """
+    dimension = vectors.shape[1]
+    n = len(vectors)
+    index_type = config['TYPE']
+
+    if index_type == 'flat_l2':
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+    elif index_type == 'flat_ip':
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+    elif index_type == 'flat_fp16':
+        # Exhaustive search over vectors stored as float16: half the bytes, near-identical distances
+        index = faiss.IndexIDMap2(faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16))
+    elif index_type == 'pq':
+        # Exhaustive search over PQ_M-byte product-quantized codes
+        if n < pq_training_size(config):
+            raise ValueError(f"PQ needs at least {pq_training_size(config)} vectors to train, got {n}.")
+        index = faiss.IndexIDMap2(faiss.IndexPQ(dimension, config['PQ_M'], config['PQ_NBITS']))
+        index.train(vectors)
+    elif index_type == 'hnsw_flat':
+        hnsw = faiss.IndexHNSWFlat(dimension, config['HNSW_M'])
+        hnsw.hnsw.efConstruction = config['EF_CONSTRUCTION']
+        index = faiss.IndexIDMap2(hnsw)
+    else:
+        # Small corpora cannot train many clusters; shrink nlist until training is meaningful
+        nlist = max(1, min(config['NLIST'], n // MIN_POINTS_PER_CLUSTER))
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == 'ivf_flat':
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, config['PQ_M'], config['PQ_NBITS'])
+        if index_type == 'ivf_pq' and n < pq_training_size(config):
+            raise ValueError(f"IVF-PQ needs at least {pq_training_size(config)} vectors to train, got {n}.")
+        index.train(vectors)
+
+    apply_search_params(index, config)
+    if n:
+        index.add_with_ids(vectors, ids)
+    return index
+
+def read_index_file(path, mmap=False):
+    """
+    Reads a saved index; returns (index, mapped). With mmap, the vector codes of the
+    flat, fp16 and PQ types (and the coarse quantizer of IVF types) are mapped from the
+    file instead of copied, so loading does not parse the vectors and every process on
+    the host shares one copy in the page cache. A mapped index must not be modified.
+    """
+    if mmap and hasattr(faiss, 'IO_FLAG_MMAP_IFC'):
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC), True
+    return faiss.read_index(path), False
+
+def apply_search_params(index, config):
+    """Sets query-time knobs (nprobe / efSearch) on the index or the index it wraps."""
+    inner = faiss.downcast_index(index.index) if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else index
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = min(config['NPROBE'], inner.nlist)
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = config['EF_SEARCH']
+
+def to_l2_distances(scores, config):
+    """
+    Converts inner-product scores of normalized vectors to squared L2 distances
+    (|a-b|^2 = 2 - 2<a,b>), so callers always see "lower is closer".
+    """
+    if uses_inner_product(config):
+        return 2.0 - 2.0 * scores
+    return scores
+
+
+class VectorIndexManager:
+    """
+    Process-wide FAISS index over the stored DocumentChunk embeddings.
+
+    Vectors are keyed by chunk id, so passages can be added and removed
+    incrementally instead of rebuilding an index for every request. Each save writes a
+    new data file and then swaps a small JSON manifest naming it and its version;
+    the authoritative version lives in VectorIndexState so every replica can tell
+    when its in-memory copy is stale and reload (or rebuild) it.
+    """
+
+    def __init__(self, path, save_interval=30, config=None):
+        self.path = str(path)
+        self.meta_path = f"{self.path}.json"
+        self.save_interval = save_interval
+        self.config = get_index_config(config)
+        self.index = None
+        # True while self.index is memory-mapped from self.path (read-only)
+        self.mapped = False
+        self.version = -1
+        # Number of vectors the index was trained on (trained index types only)
+        self.trained_size = 0
+        self._dirty = False
+        self._last_saved = 0.0
+        self._lock = threading.RLock()
+
+    # --- Persistence ---
+
+    def _read_manifest(self):
+        try:
+            with open(self.meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _data_path(self, manifest):
+        # Manifests written before data files were versioned point at self.path itself
+        if 'file' in manifest:
+            return os.path.join(os.path.dirname(self.path), manifest['file'])
+        return self.path
+
+    def load(self):
+        """Loads the index from disk if present. Does not touch the database."""
+        with self._lock:
+            meta = self._read_manifest()
+            data_path = self._data_path(meta)
+            if not (meta and os.path.exists(data_path)):
+                return False
+            try:
+                if meta.get('type') != self.config['TYPE']:
+                    # The configured backend changed; the caller will rebuild
+                    print(f"Vector index on disk is '{meta.get('type')}', configured '{self.config['TYPE']}'. Ignoring it.")
+                    return False
+                self.index, self.mapped = read_index_file(data_path, mmap=self.config['MMAP'])
+                apply_search_params(self.index, self.config)
+                self.version = meta.get('version', -1)
+                self.trained_size = meta.get('trained_size', 0)
+                print(f"Loaded vector index v{self.version} with {self.index.ntotal} vectors from {data_path}")
+                return True
+            except Exception as e:
+                print(f"Error loading vector index from {data_path}: {e}")
+                self.index = None
+                self.mapped = False
+                self.version = -1
+                return False
+
+    def _write_temp_file(self, directory, prefix, write):
+        """Writes through `write(path)` to a new, uniquely named file in `directory` and returns its path."""
+        fd, path = tempfile.mkstemp(dir=directory, prefix=prefix)
+        os.close(fd)
+        try:
+            write(path)
+            os.chmod(path, 0o644)
+        except BaseException:
+            os.unlink(path)
+            raise
+        return path
+
+    def save(self):
+        """
+        Writes the index to a new, uniquely named data file, then atomically replaces the
+        JSON manifest that names it and records its version. Readers always go through the
+        manifest, so they see a matching index and version, and concurrent writers (other
+        workers or replicas) never write to the same file. The data file of the previous
+        manifest is kept for readers that are still opening it; older ones are removed.
+        """
+        with self._lock:
+            if self.index is None:
+                return
+            directory = os.path.dirname(self.path) or '.'
+            os.makedirs(directory, exist_ok=True)
+            base = os.path.basename(self.path)
+            previous = self._read_manifest()
+
+            data_path = self._write_temp_file(
+                directory, f"{base}.v{self.version}.", lambda path: faiss.write_index(self.index, path))
+            manifest = {
+                'version': self.version,
+                'ntotal': self.index.ntotal,
+                'type': self.config['TYPE'],
+                'trained_size': self.trained_size,
+                'file': os.path.basename(data_path),
+                # A manifest from before versioned data files names no file: the data is self.path
+                'previous': previous.get('file') or (base if previous else None),
+            }
+
+            def write_manifest(path):
+                with open(path, 'w') as f:
+                    json.dump(manifest, f)
+
+            os.replace(self._write_temp_file(directory, f"{base}.json.", write_manifest), self.meta_path)
+
+            stale = previous.get('previous')
+            if stale and stale not in (manifest['file'], manifest['previous']):
+                try:
+                    os.unlink(os.path.join(directory, stale))
+                except FileNotFoundError:
+                    pass  # Already removed by another writer
+
+            self._dirty = False
+            self._last_saved = time.monotonic()
+
+    def _maybe_save(self):
+        # Writing the whole index on every page of a sitemap crawl would be quadratic,
+        # so mutations are flushed at most once per save_interval (and at exit).
+        if self._dirty and time.monotonic() - self._last_saved >= self.save_interval:
+            self.save()
+
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self.save()
+
+    # --- Versioning ---
+
+    @staticmethod
+    def get_db_version():
+        state, _ = VectorIndexState.objects.get_or_create(pk=1)
+        return state.version
+
+    @staticmethod
+    def bump_db_version():
+        VectorIndexState.objects.get_or_create(pk=1)
+        VectorIndexState.objects.filter(pk=1).update(version=F('version') + 1)
+        return VectorIndexState.objects.values_list('version', flat=True).get(pk=1)
+
+    def ensure_current(self):
+        """Reloads from disk, or rebuilds from the database, if another process changed the index."""
+        db_version = self.get_db_version()
+        with self._lock:
+            if self.index is not None and self.version == db_version:
+                return
+            # Another replica may have written a newer file to shared storage
+            if self.load() and self.version == db_version:
+                return
+            self.rebuild(version=db_version)
+
+    def rebuild(self, version=None):
+        """Rebuilds the index from every stored embedding and persists it."""
+        if version is None:
+            version = self.get_db_version()
+
+        chunks = DocumentChunk.objects.exclude(embedding__isnull=True).values_list('id', 'embedding')
+        ids, vectors = [], []
+        for chunk_id, embedding in chunks.iterator():
+            ids.append(chunk_id)
+            vectors.append(from_blob(embedding))
+
+        with self._lock:
+            self.index = None
+            self.mapped = False
+            self.trained_size = 0
+            if vectors:
+                self._build(np.array(ids, dtype='int64'), np.vstack(vectors))
+            self.version = version
+            self.save()
+            print(f"Rebuilt vector index v{self.version} with {len(ids)} vectors")
+
+    # --- Mutations ---
+
+    def _build(self, ids, vectors):
+        vectors = prepare_vectors(vectors, self.config)
+        fallback = PQ_FALLBACK_TYPES.get(self.config['TYPE'])
+        if fallback and len(vectors) < pq_training_size(self.config):
+            # Too few vectors to train PQ codebooks yet; serve exactly until the corpus grows
+            self.index = build_index(vectors, ids, get_index_config({'TYPE': fallback}))
+        else:
+            self.index = build_index(vectors, ids, self.config)
+        self.mapped = False
+        self.trained_size = len(vectors) if needs_training(self.config) else 0
+
+    def _make_writable(self):
+        # FAISS aborts the process when a memory-mapped index is resized,
+        # so the first mutation after a mapped load switches to a private copy
+        if self.mapped:
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+            apply_search_params(self.index, self.config)
+            self.mapped = False
+
+    def _add(self, ids, vectors):
+        if self.index is None:
+            self._build(ids, vectors)
+            return
+        self.index.add_with_ids(prepare_vectors(vectors, self.config), ids)
+
+    def _needs_rebuild(self):
+        """Trained indexes are retrained once the corpus outgrows the set they were trained on."""
+        if not needs_training(self.config) or self.index is None:
+            return False
+        return self.index.ntotal >= max(self.trained_size, 1) * self.config['RETRAIN_GROWTH']
+
+    def _remove(self, ids):
+        try:
+            self.index.remove_ids(ids)
+            return True
+        except RuntimeError:
+            # HNSW graphs do not support deletion; the caller rebuilds instead
+            return False
+
+    def _commit_change(self):
+        """Bumps the shared version; rebuilds if another process changed the index in the meantime."""
+        expected = self.version + 1
+        new_version = self.bump_db_version()
+        if new_version != expected or self._needs_rebuild():
+            self.rebuild(version=new_version)
+            return
+        self.version = new_version
+        self._dirty = True
+        self._maybe_save()
+
+    def update(self, remove_ids=(), add_ids=(), vectors=None):
+        """
+        Removes `remove_ids` and adds `vectors` under `add_ids` as one change,
+        so re-chunking an entry costs a single version bump.
+        """
+        remove_ids = np.array(list(remove_ids), dtype='int64')
+        add_ids = np.array(list(add_ids), dtype='int64')
+        if not len(remove_ids) and not len(add_ids):
+            return
+        with self._lock:
+            if self.index is None:
+                self.load()
+            if self.index is not None:
+                self._make_writable()
+            if self.index is not None and len(remove_ids) and not self._remove(remove_ids):
+                # Deleting from an index without deletion support; the rebuild reads the committed rows
+                self.rebuild(version=self.bump_db_version())
+                return
+            if len(add_ids):
+                self._add(add_ids, np.asarray(vectors, dtype='float32').reshape(len(add_ids), -1))
+            self._commit_change()
+
+    def remove(self, chunk_ids):
+        """Removes the vectors for the given chunk ids, if present."""
+        self.update(remove_ids=chunk_ids)
+
+    # --- Queries ---
+
+    def search(self, query_embeddings, k=1):
+        """
+        Returns (distances, chunk_ids) for the k nearest passages of each query row.
+        Missing neighbours are reported with an id of -1.
+        """
+        self.ensure_current()
+        with self._lock:
+            if self.index is None or self.index.ntotal == 0:
+                n = len(query_embeddings)
+                return np.empty((n, 0), dtype='float32'), np.empty((n, 0), dtype='int64')
+            distances, ids = self.index.search(prepare_vectors(query_embeddings, self.config), k)
+            return to_l2_distances(distances, self.config), ids
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal if self.index is not None else 0
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_index_manager():
+    """Returns the process-wide VectorIndexManager, creating it on first use."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                manager = VectorIndexManager(
+                    getattr(settings, 'VECTOR_INDEX_PATH', os.path.join(settings.BASE_DIR, 'vector_index', 'documents.faiss')),
+                    save_interval=getattr(settings, 'VECTOR_INDEX_SAVE_INTERVAL', 30),
+                    config=get_index_config(),
+                )
+                atexit.register(manager.flush)
+                _manager = manager
+    return _manager
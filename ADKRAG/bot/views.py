@@ -1,95 +1,52 @@
 import json
-import threading
 import asyncio
 import os
+import aiohttp
 # --- ASYNC/SYNC Bridge Import ---
 from asgiref.sync import sync_to_async
 # Import the necessary model from the local models.py file
 from .models import ScrapedDataEntry 
+from django.contrib.admin.views.decorators import staff_member_required
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
+from django.http import HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from crawl4ai import AsyncWebCrawler
-from bs4 import BeautifulSoup
 from pydantic import BaseModel, HttpUrl, Field
 from typing import Optional
 from myapp.models import AppSettings
-
-# Store status for each user (this could be moved to a database if persistence is required)
-scraping_status = {}
+from .extractors import extract_page_async
+from .ingest import EmbeddingPipeline
+from .ratelimit import HostRateLimiter
+from .sitemaps import iter_sitemap_urls
+from .jobs import enqueue_scrape_job, latest_job_for_user
+from .scrape_status import cache_status_from_db, etag_for, read_status
+from contextlib import asynccontextmanager
 
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
+from django.db import transaction
 from .models import ScrapedDataEntry
+from .chunking import rebuild_chunks_for_entries_async
+from .embeddings import content_checksum
 
 # Core RAG dependencies
-import faiss
-import numpy as np
 import os
 import json
-from sentence_transformers import SentenceTransformer
-
-# --- Initialize Global Resources ---
-try:
-    # Adjust this path if your model is not cached/downloaded correctly
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    print("SentenceTransformer model loaded successfully.")
-except Exception as e:
-    print(f"Error loading SentenceTransformer model: {e}")
-    model = None
-
-# --- Helper Functions ---
-
-def get_document_options_from_db():
-    """
-    Fetches unique content summaries (documents) from the ScrapedDataEntry model.
-    """
-    # Exclude entries that are null or empty
-    entries = ScrapedDataEntry.objects.exclude(
-        content_summary__isnull=True
-        ).exclude(content_summary__exact=''
-        ).values_list('content_summary', flat=True)
-    
-    # Return a list of unique document strings
-    return list(set(entries))
-
-def find_best_match(question, documents):
-    """
-    Encodes the question and documents, and finds the document with the highest
-    semantic similarity (lowest L2 distance) using FAISS.
-    """
-    if not model:
-        raise RuntimeError("Embedding model failed to load. Cannot perform vector search.")
-
-    all_texts = [question] + documents
-    embeddings = model.encode(all_texts)
-    embeddings = np.array(embeddings).astype('float32')
-
-    # Separate query and document embeddings
-    query_embedding = np.array([embeddings[0]]).astype('float32')
-    document_embeddings = embeddings[1:]
-
-    # FAISS Index for Similarity Search (Flat L2 distance is fast and reliable)
-    dimension = document_embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(document_embeddings)
-
-    # Search for the nearest neighbor (k=1)
-    # The L2 index returns distance and index
-    distances, indices = index.search(query_embedding, 1)
-    
-    # The index returned is relative to the documents list (embeddings[1:])
-    best_match_index = indices[0][0]
-    best_match_document = documents[best_match_index]
-
-    return best_match_document
+from .retrieval import parse_search_params, search_response
+from .search_cache import cache_stats
 
 # --- Django View for API Endpoint ---
 
 @csrf_exempt
 def api_search(request):
-    """Handles the API request for vector search."""
+    """
+    Handles the API request for vector search.
+
+    Optional JSON parameters: 'k' (number of passages), 'max_distance' (drop passages
+    with a larger squared L2 distance), 'mmr' / 'mmr_lambda' (diversify the results)
+    and 'fetch_k' (size of the candidate pool for MMR).
+    """
     if request.method != 'POST':
         return JsonResponse({"error": "Method not allowed"}, status=405)
     
@@ -105,33 +62,17 @@ def api_search(request):
         return JsonResponse({"error": "Question field is required"}, status=400)
 
     try:
-        # 1. Get documents from the model
-        document_options = get_document_options_from_db()
-        
-        if not document_options:
-            return JsonResponse({"error": "No scraped data found in the database to search against."}, status=503)
+        params = parse_search_params(data)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
-        # 2. Find the most relevant document (semantic search)
-        best_match_content = find_best_match(question, document_options)
-        
-        prompt = (
-            f'User Question: "{question}" \n\n '
-            f'Based on the following relevant content, write a helpful and short reply (under 50 words): \n\n '
-            f'Content: "{best_match_content}"'
-        )
-        
-        return JsonResponse({
-            "answer": prompt,
-            "question": question,
-            "matched_content_preview": best_match_content[:50] + "..."
-        })
-            
-    except RuntimeError as e:
-        # Catches errors like model not loading
-        return JsonResponse({"error": str(e)}, status=500)
-    except Exception as e:
-        print(f"Error during API processing: {e}")
-        return JsonResponse({"error": f"An internal server error occurred: {str(e)}"}, status=500)
+    status, payload = search_response(question, **params)
+    return JsonResponse(payload, status=status)
+
+@staff_member_required
+def api_search_cache_stats(request):
+    """Returns hit/miss counters of the query-embedding and result caches (staff only)."""
+    return JsonResponse(cache_stats())
 
 # Define the ScrapedData model using Pydantic for structured data
 class ScrapedData(BaseModel):
@@ -142,6 +83,9 @@ class ScrapedData(BaseModel):
     url: HttpUrl
     content: str
     Learn_More: str
+    # Validators from the response, echoed back by refresh scrapes as conditional request headers
+    http_etag: Optional[str] = Field(None, title="ETag Header")
+    http_last_modified: Optional[str] = Field(None, title="Last-Modified Header")
 
     class Config:
         json_encoders = {HttpUrl: str}
@@ -168,16 +112,79 @@ def check_url_exists(url):
     normalized_url = normalize_url(url)
     return ScrapedDataEntry.objects.filter(url=normalized_url).exists()
 
+# Keeps each `url IN (...)` query well below SQLite's bound-parameter limit
+URL_LOOKUP_BATCH_SIZE = 500
+
+@sync_to_async
+def filter_new_urls(urls, seen=None):
+    """
+    Returns the positions in `urls` of URLs that are not in the database yet, using
+    one `url__in` query per batch instead of one exists() query per URL. Only the first
+    occurrence of each normalized URL is kept, so duplicates in a sitemap are crawled once;
+    pass the same `seen` set to successive calls to also drop duplicates across calls.
+    """
+    seen = set() if seen is None else seen
+    first_positions = {}
+    for position, url in enumerate(urls):
+        normalized_url = normalize_url(url)
+        if normalized_url not in seen:
+            first_positions.setdefault(normalized_url, position)
+    seen.update(first_positions)
+
+    normalized_urls = list(first_positions)
+    existing = set()
+    for start in range(0, len(normalized_urls), URL_LOOKUP_BATCH_SIZE):
+        batch = normalized_urls[start:start + URL_LOOKUP_BATCH_SIZE]
+        existing.update(ScrapedDataEntry.objects.filter(url__in=batch).values_list('url', flat=True))
+
+    return sorted(position for url, position in first_positions.items() if url not in existing)
+
+@sync_to_async
+def load_known_entries(normalized_urls):
+    """Returns {url: freshness fields} for the given normalized URLs that are already stored."""
+    known = {}
+    for start in range(0, len(normalized_urls), URL_LOOKUP_BATCH_SIZE):
+        batch = normalized_urls[start:start + URL_LOOKUP_BATCH_SIZE]
+        for row in ScrapedDataEntry.objects.filter(url__in=batch).values(
+            'id', 'url', 'http_etag', 'http_last_modified', 'sitemap_lastmod'
+        ):
+            known[row['url']] = row
+    return known
+
+async def is_page_unchanged(session, url, known):
+    """
+    Sends a conditional GET with the stored ETag / Last-Modified validators.
+    True when the server answers 304 Not Modified (or returns the same ETag).
+    Pages without validators, and failed checks, count as changed.
+    """
+    headers = {}
+    if known.get('http_etag'):
+        headers['If-None-Match'] = known['http_etag']
+    if known.get('http_last_modified'):
+        headers['If-Modified-Since'] = known['http_last_modified']
+    if not headers:
+        return False
+    try:
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304:
+                return True
+            etag = response.headers.get('ETag')
+            return response.status == 200 and bool(etag) and etag == known.get('http_etag')
+    except Exception as e:
+        print(f"Conditional request failed for {url}: {e}")
+        return False
+
 @sync_to_async
 def save_scraped_data_to_db_sync(scraped_data, user_id, scrape_mode):
     """
-    Saves data using the normalized URL string.
+    Saves data using the normalized URL string. The entry's passages are not built
+    here: the caller embeds them with rebuild_chunks_for_entries_async.
     """
     # Normalize the URL before saving
     normalized_url_str = normalize_url(str(scraped_data['url']))
     
     # Save new entry
-    ScrapedDataEntry.objects.create(
+    entry = ScrapedDataEntry(
         url=normalized_url_str, # SAVING THE NORMALIZED URL
         scraped_by_user_id=user_id,
         scrape_mode=scrape_mode,
@@ -185,57 +192,206 @@ def save_scraped_data_to_db_sync(scraped_data, user_id, scrape_mode):
         meta_title=scraped_data.get('meta_title'),
         meta_description=scraped_data.get('meta_description'),
         meta_keywords=scraped_data.get('meta_keywords'),
-        content_summary=scraped_data.get('content', '')
+        content_summary=scraped_data.get('content', ''),
+        http_etag=scraped_data.get('http_etag'),
+        http_last_modified=scraped_data.get('http_last_modified'),
     )
+    entry.save(rebuild_chunks=False)
     print(f"Successfully saved new entry for: {normalized_url_str}")
-    return True
+    return entry
 
-async def save_scraped_data_wrapper(scraped_data, user_id, scrape_mode, status):
+async def save_scraped_data_wrapper(scraped_data, user_id, scrape_mode, status, check_existing=True):
     """
     Asynchronous wrapper to handle error logging and the duplicate check before saving.
+    The sitemap path pre-filters URLs in bulk and passes check_existing=False; the
+    unique constraint on url still rejects a concurrent duplicate.
     """
     url_to_check = str(scraped_data['url'])
     
     try:
         # Check for duplication again before saving (using normalized URL check)
-        if await check_url_exists(url_to_check):
+        if check_existing and await check_url_exists(url_to_check):
              print(f"Skipping save for duplicate URL: {url_to_check}")
              status["error"] = f"Skipped duplicate URL: {url_to_check}"
              return False
              
-        await save_scraped_data_to_db_sync(scraped_data, user_id, scrape_mode)
+        entry = await save_scraped_data_to_db_sync(scraped_data, user_id, scrape_mode)
+        # Encoding runs in the executor thread pool, not in the thread-sensitive ORM thread
+        await rebuild_chunks_for_entries_async([entry])
         return True
 
     except Exception as e:
         print(f"Error saving data to database: {e}")
         status["error"] = f"Error saving data to database: {str(e)}"
         return False
+
+# Columns overwritten when a refresh scrape re-crawls an existing entry
+REFRESHED_FIELDS = ['name', 'meta_title', 'meta_description', 'meta_keywords', 'content_summary',
+                    'content_hash', 'http_etag', 'http_last_modified', 'sitemap_lastmod']
+
+@sync_to_async
+def bulk_save_scraped_data_sync(batch, user_id, scrape_mode, update_existing=False):
+    """
+    Writes a batch of ScrapedData dicts with one bulk_create in one transaction.
+    URLs that already exist are ignored, or updated in place with update_existing.
+    Returns the new entries and the entries whose content changed, which need
+    to be re-chunked and re-embedded.
+    """
+    entries = {}
+    for scraped_data in batch:
+        normalized_url_str = normalize_url(str(scraped_data['url']))
+        content = scraped_data.get('content', '')
+        entries.setdefault(normalized_url_str, ScrapedDataEntry(
+            url=normalized_url_str, # SAVING THE NORMALIZED URL
+            scraped_by_user_id=user_id,
+            scrape_mode=scrape_mode,
+            name=scraped_data.get('name'),
+            meta_title=scraped_data.get('meta_title'),
+            meta_description=scraped_data.get('meta_description'),
+            meta_keywords=scraped_data.get('meta_keywords'),
+            content_summary=content,
+            content_hash=content_checksum(content),
+            http_etag=scraped_data.get('http_etag'),
+            http_last_modified=scraped_data.get('http_last_modified'),
+            sitemap_lastmod=scraped_data.get('sitemap_lastmod'),
+        ))
+
+    # url -> checksum of the content its passages were embedded from. Read before the transaction,
+    # which then starts with its write: a deferred SQLite transaction that has already read
+    # cannot wait for the write lock and fails with "database is locked" instead
+    embedded = dict(ScrapedDataEntry.objects.filter(url__in=list(entries)).values_list('url', 'embedding_checksum'))
+    with transaction.atomic():
+        if update_existing:
+            ScrapedDataEntry.objects.bulk_create(
+                list(entries.values()), update_conflicts=True, unique_fields=['url'], update_fields=REFRESHED_FIELDS,
+            )
+        else:
+            ScrapedDataEntry.objects.bulk_create(list(entries.values()), ignore_conflicts=True)
+
+    # bulk_create skips save() (and conflicts leave pk unset), so reload the new or changed
+    # rows; the writer builds their passages and embeddings in one encode call per batch
+    stale_urls = [
+        url for url, entry in entries.items()
+        if url not in embedded or (update_existing and entry.content_hash != embedded[url])
+    ]
+    return list(ScrapedDataEntry.objects.filter(url__in=stale_urls))
+
+@sync_to_async
+def touch_unchanged_entries_sync(unchanged):
+    """Records the sitemap lastmod of (entry id, lastmod) pairs whose pages did not change."""
+    ScrapedDataEntry.objects.bulk_update(
+        [ScrapedDataEntry(pk=entry_id, sitemap_lastmod=lastmod) for entry_id, lastmod in unchanged],
+        ['sitemap_lastmod'],
+    )
+
+class ScrapedDataWriter:
+    """
+    Buffers scraped pages and writes them with bulk_create once `batch_size` pages
+    are waiting or `flush_interval` seconds have passed, instead of one transaction
+    (and SQLite fsync) per page. Use as `async with`, which flushes on exit,
+    including when the scrape is cancelled. New and changed entries are handed to
+    the EmbeddingPipeline if one is given, otherwise embedded batch by batch.
+
+    Pages can carry a `completion` (sitemap position, url): `on_committed` is called
+    with it once the page's batch is committed, and never for a batch that failed,
+    so a resumed crawl does not start after pages that were never written.
+    """
+
+    def __init__(self, user_id, scrape_mode, status, batch_size=None, flush_interval=None, update_existing=False,
+                 pipeline=None, on_committed=None):
+        self.user_id = user_id
+        self.scrape_mode = scrape_mode
+        self.status = status
+        self.batch_size = batch_size or getattr(settings, 'SCRAPE_WRITE_BATCH_SIZE', 50)
+        self.flush_interval = flush_interval or getattr(settings, 'SCRAPE_WRITE_FLUSH_SECONDS', 5)
+        self.update_existing = update_existing
+        self.pipeline = pipeline
+        self.on_committed = on_committed
+        self._buffer = []     # (scraped data, completion)
+        self._unchanged = []  # (entry id, sitemap lastmod, completion)
+        self._lock = asyncio.Lock()
+        self._timer = None
+
+    async def __aenter__(self):
+        self._timer = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._timer.cancel()
+        await self.flush()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def add(self, scraped_data, completion=None):
+        self._buffer.append((scraped_data, completion))
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+
+    async def add_unchanged(self, entry_id, sitemap_lastmod, completion=None):
+        """
+        Queues a refresh-scraped entry whose page did not change; only its sitemap lastmod
+        is stored. Returns False, queuing nothing, when there is no lastmod to store.
+        """
+        if sitemap_lastmod is None:
+            return False
+        self._unchanged.append((entry_id, sitemap_lastmod, completion))
+        if len(self._unchanged) >= self.batch_size:
+            await self.flush()
+        return True
+
+    def _committed(self, items):
+        if self.on_committed:
+            for *_, completion in items:
+                if completion is not None:
+                    self.on_committed(*completion)
+
+    async def flush(self):
+        async with self._lock:
+            batch, self._buffer = self._buffer, []
+            unchanged, self._unchanged = self._unchanged, []
+            if unchanged:
+                try:
+                    await touch_unchanged_entries_sync([(entry_id, lastmod) for entry_id, lastmod, _ in unchanged])
+                    self._committed(unchanged)
+                except Exception as e:
+                    print(f"Error updating {len(unchanged)} unchanged entries: {e}")
+            if not batch:
+                return 0
+            try:
+                stale_entries = await bulk_save_scraped_data_sync([data for data, _ in batch], self.user_id,
+                                                                  self.scrape_mode, update_existing=self.update_existing)
+                # The pages are stored; only now may the resume point move past them
+                self._committed(batch)
+                if self.pipeline:
+                    # Blocks while the embedder is behind, which in turn holds up the crawl workers
+                    await self.pipeline.submit(stale_entries)
+                else:
+                    await rebuild_chunks_for_entries_async(stale_entries)
+                inserted = len(stale_entries)
+            except Exception as e:
+                print(f"Error saving batch of {len(batch)} pages to database: {e}")
+                self.status["error"] = f"Error saving data to database: {str(e)}"
+                return 0
+            print(f"Saved batch: {inserted} new or changed of {len(batch)} pages")
+            self.status["last_batch_inserted"] = inserted
+            self.status["saved_pages"] = self.status.get("saved_pages", 0) + inserted
+            return inserted
+
 # ----------------------------------------------------
 
 # Asynchronous function to get URLs from a sitemap
 async def get_sitemap_urls(sitemap_url):
-    import aiohttp
-    async with aiohttp.ClientSession() as session:
-        async with session.get(sitemap_url) as response:
-            sitemap_xml = await response.text()
-    soup = BeautifulSoup(sitemap_xml, "xml")
-    urls = [loc.get_text(strip=True) for loc in soup.find_all("loc")]
-    return urls
-
-# Function to remove unnecessary tags like headers, footers, and sidebars
-def remove_header_footer(soup):
-    for tag in soup.find_all(["header", "footer", "nav"]):
-        tag.decompose()
-    for tag in soup.find_all(class_=lambda x: x and ("cookie" in x.lower() or "sidebar" in x.lower())):
-        tag.decompose()
-    for p in soup.find_all("p"):
-        if "cookie" in p.get_text().lower():
-            p.decompose()
+    # Crawls stream the sitemap through iter_sitemap_urls; this collects it for other callers
+    return [entry.url async for entry in iter_sitemap_urls(sitemap_url)]
 
 # Process a URL to extract content and metadata
-async def process_url(crawler, url, status):
+async def process_url(crawler, url, status, check_existing=True):
     # Check for duplication early before expensive scraping. Uses the normalization function.
-    if await check_url_exists(url):
+    # (Sitemap scrapes already dropped known URLs in bulk via filter_new_urls.)
+    if check_existing and await check_url_exists(url):
         print(f"Skipping scrape for existing URL: {url}")
         status["error"] = f"Skipped scrape for existing URL: {url}"
         status["rem_link"] = status.get("rem_link", 0) - 1
@@ -246,28 +402,23 @@ async def process_url(crawler, url, status):
         status["current_url"] = url
         result = await crawler.arun(url=url)
         html_content = getattr(result, 'html', result.markdown)
-        soup = BeautifulSoup(html_content, "html.parser")
-
-        h1_tag = soup.find('h1')
-        h1_value = h1_tag.get_text(strip=True) if h1_tag else None
-
-        remove_header_footer(soup)
 
-        title_tag = soup.find('title')
-        meta_title = title_tag.get_text(strip=True) if title_tag else None
+        # Metadata and boilerplate stripping (SCRAPE_EXTRACTOR), parsed off the event loop
+        page = await extract_page_async(html_content)
+        h1_value = page["name"]
+        meta_title = page["meta_title"]
+        meta_description = page["meta_description"]
+        meta_keywords = page["meta_keywords"]
 
-        meta_desc_tag = soup.find('meta', attrs={'name': 'description'})
-        meta_description = (meta_desc_tag['content'].strip() if meta_desc_tag and meta_desc_tag.has_attr('content') else None)
-
-        meta_keywords_tag = soup.find('meta', attrs={'name': 'keywords'})
-        meta_keywords = (meta_keywords_tag['content'].strip() if meta_keywords_tag and meta_keywords_tag.has_attr('content') else None)
-
-        content = soup.get_text(separator="\n", strip=True)
+        content = page["content"]
         char_count = len(content)
         
         # Update total characters directly in the status object
         status["total_characters_scraped"] += char_count
 
+        # Keep the HTTP validators so a later refresh can ask "changed since?"
+        response_headers = {key.lower(): value for key, value in (getattr(result, 'response_headers', None) or {}).items()}
+
         # Create a ScrapedData object and return it
         scraped_data = ScrapedData(
             name=h1_value,
@@ -276,7 +427,9 @@ async def process_url(crawler, url, status):
             meta_keywords=meta_keywords,
             url=result.url,
             Learn_More=f"{h1_value} - For more info, go to {result.url}",
-            content=content
+            content=content,
+            http_etag=response_headers.get('etag'),
+            http_last_modified=response_headers.get('last-modified'),
         )
 
         status["rem_link"] = status.get("rem_link", 0) - 1
@@ -284,10 +437,20 @@ async def process_url(crawler, url, status):
     except Exception as e:
         print(f"Error processing {url}: {e}")
         status["error"] = f"Error processing {url}: {str(e)}"
+        status["failed_pages"] = status.get("failed_pages", 0) + 1
         return None
 
+@asynccontextmanager
+async def crawler_session(crawler=None):
+    """Yields the given (pooled) crawler, or launches a dedicated one for the duration."""
+    if crawler is not None:
+        yield crawler
+        return
+    async with AsyncWebCrawler() as own_crawler:
+        yield own_crawler
+
 # Function to scrape a single page
-async def scrape_single_page_with_status(page_url, status):
+async def scrape_single_page_with_status(page_url, status, crawler=None):
     if status.get("rem_link", 0) <= 0:
         status["is_scraping"] = False
         status["error"] = "Your current plan doesn’t support fetching data from this URL — consider upgrading your plan."
@@ -300,7 +463,7 @@ async def scrape_single_page_with_status(page_url, status):
     status["total_characters_scraped"] = 0
     scrape_mode = "single"
 
-    async with AsyncWebCrawler() as crawler:
+    async with crawler_session(crawler) as crawler:
         data = await process_url(crawler, page_url, status)
         if data:
             # --- DATABASE SAVE (using async wrapper) ---
@@ -312,77 +475,201 @@ async def scrape_single_page_with_status(page_url, status):
     status["remaining_pages"] = 0
     status["is_scraping"] = False
 
-# Function to process each URL during sitemap scraping
-async def process_url_with_status(crawler, url, status):
+# Function to process each URL during sitemap scraping.
+# Returns True when the page was buffered in the writer, which then reports its completion.
+async def process_url_with_status(crawler, url, status, check_existing=True, writer=None, sitemap_lastmod=None,
+                                  completion=None):
     try:
-        new_data = await process_url(crawler, url, status)
+        new_data = await process_url(crawler, url, status, check_existing=check_existing)
         
-        if new_data:
+        if new_data and writer:
+            new_data["sitemap_lastmod"] = sitemap_lastmod
+            # --- DATABASE SAVE (buffered, bulk insert) ---
+            await writer.add(new_data, completion=completion)
+            return True
+        elif new_data:
             scrape_mode = "sitemap"
             # --- DATABASE SAVE (using async wrapper) ---
-            await save_scraped_data_wrapper(new_data, status['user_id'], scrape_mode, status)
+            await save_scraped_data_wrapper(new_data, status['user_id'], scrape_mode, status, check_existing=check_existing)
             # ---------------------
         
     except Exception as e:
         # process_url handles setting the error in status
         print(f"Error processing {url}: {e}")
+    return False
 
 # Function to scrape all URLs in a sitemap
-async def scrape_sitemap_with_status(sitemap_url, status):
-    try:
-        sitemap_urls = await get_sitemap_urls(sitemap_url)
-        total_urls = len(sitemap_urls)
-
-        if total_urls == 0:
-            status["is_scraping"] = False
-            status["error"] = "No URLs found in the sitemap."
-            return
+async def scrape_sitemap_with_status(sitemap_url, status, crawler=None, resume_position=0, refresh=False):
+    """
+    Crawls every URL of a sitemap (or nested sitemap index) while the sitemap is still
+    being downloaded and parsed. Progress is tracked as resume_position: the number of
+    sitemap URLs completed without gaps, so an interrupted job restarts from there.
 
-        status["remaining_pages"] = total_urls
-        status["scraped_pages"] = 0
+    Known URLs are skipped, unless `refresh` is set: then a known page is re-crawled
+    only if its sitemap <lastmod> is newer than the stored one (or either is missing)
+    and a conditional request with its stored ETag / Last-Modified does not return 304.
+    """
+    try:
+        status["skipped_pages"] = 0
+        status["unchanged_pages"] = 0
+        status["remaining_pages"] = 0
+        status["scraped_pages"] = resume_position
+        status["resume_position"] = resume_position
+        status["failed_pages"] = 0
         status["total_characters_scraped"] = 0
         status["is_scraping"] = True
 
-        async with AsyncWebCrawler() as crawler:
-            for url in sitemap_urls:
-                status["current_url"] = url
+        # A fixed pool of workers shares one crawler; the per-host token bucket
+        # replaces the old fixed 1 second sleep between pages.
+        concurrency = max(1, getattr(settings, 'SCRAPE_CONCURRENCY', 4))
+        rate_limiter = HostRateLimiter(
+            rate=getattr(settings, 'SCRAPE_RATE_PER_HOST', 2.0),
+            burst=getattr(settings, 'SCRAPE_BURST_PER_HOST', 2),
+        )
+        # Bounded, so parsing pauses while the crawlers catch up
+        url_queue = asyncio.Queue(maxsize=URL_LOOKUP_BATCH_SIZE)
+        completed = {}  # position -> url, for completed positions past the resume point
+        seen_urls = set()
+        failed_sitemaps = []
+        total_urls = 0
+        sitemap_error = None
+
+        def mark_completed(position, url):
+            # Advance the resume point over every contiguously completed URL. Pages handed
+            # to the writer are only completed once their batch is committed.
+            completed[position] = url
+            while status["resume_position"] in completed:
+                status["last_completed_url"] = completed.pop(status["resume_position"])
+                status["resume_position"] += 1
+
+        async def refresh_targets(batch):
+            # index in batch -> stored freshness fields (None for new URLs) of URLs worth re-crawling
+            first_indexes = {}
+            for index, (_, url, _) in enumerate(batch):
+                first_indexes.setdefault(normalize_url(url), index)
+            first_indexes = {url: index for url, index in first_indexes.items() if url not in seen_urls}
+            seen_urls.update(first_indexes)
+
+            known = await load_known_entries(list(first_indexes))
+            targets = {}
+            for url, index in first_indexes.items():
+                entry, lastmod = known.get(url), batch[index][2]
+                if entry and lastmod and entry['sitemap_lastmod'] and lastmod <= entry['sitemap_lastmod']:
+                    continue
+                targets[index] = entry
+            return targets
+
+        async def enqueue_batch(batch):
+            # Drop already-scraped (and repeated) URLs with one bulk query per batch
+            if refresh:
+                targets = await refresh_targets(batch)
+            else:
+                targets = dict.fromkeys(await filter_new_urls([url for _, url, _ in batch], seen=seen_urls))
+            for index, (position, url, lastmod) in enumerate(batch):
+                if index in targets:
+                    status["remaining_pages"] += 1
+                    await url_queue.put((position, url, lastmod, targets[index]))
+                else:
+                    # Skipped URLs count as completed for the resume point
+                    status["skipped_pages"] += 1
+                    mark_completed(position, url)
+
+        async def produce():
+            nonlocal total_urls, sitemap_error
+            try:
+                batch = []
+                async for entry in iter_sitemap_urls(sitemap_url, rate_limiter=rate_limiter,
+                                                     failed_sitemaps=failed_sitemaps):
+                    if total_urls >= resume_position:
+                        batch.append((total_urls, entry.url, entry.lastmod))
+                    total_urls += 1
+                    if len(batch) >= URL_LOOKUP_BATCH_SIZE:
+                        await enqueue_batch(batch)
+                        batch = []
+                if batch:
+                    await enqueue_batch(batch)
+            except Exception as e:
+                sitemap_error = e
+            # One end marker per worker (not sent when cancelled)
+            for _ in range(concurrency):
+                await url_queue.put(None)
+
+        async def worker(crawler, writer, http_session):
+            while (item := await url_queue.get()) is not None:
+                position, url, lastmod, known = item
+                buffered = False
                 try:
-                    await process_url_with_status(crawler, url, status)
+                    await rate_limiter.acquire(url)
+                    status["current_url"] = url
+                    if known:
+                        if await is_page_unchanged(http_session, url, known):
+                            status["unchanged_pages"] += 1
+                            buffered = await writer.add_unchanged(known['id'], lastmod, completion=(position, url))
+                            continue
+                        await rate_limiter.acquire(url)
+                    buffered = await process_url_with_status(crawler, url, status, check_existing=False, writer=writer,
+                                                             sitemap_lastmod=lastmod, completion=(position, url))
                 except Exception as e:
-                    # process_url_with_status already logs the error, just break the loop
-                    break  
-
-                status["scraped_pages"] += 1 # Incremented ONLY here for sitemap mode
-                status["remaining_pages"] -= 1
-
-                await asyncio.sleep(1) # Sleep for a short duration to avoid overwhelming the server
+                    # One bad URL must not stop the rest of the sitemap
+                    print(f"Error processing {url}: {e}")
+                    status["error"] = f"Error processing {url}: {str(e)}"
+                    status["failed_pages"] += 1
+                finally:
+                    # All workers run on one event loop, so these updates never interleave
+                    status["scraped_pages"] += 1
+                    status["remaining_pages"] -= 1
+                    if not buffered:
+                        mark_completed(position, url)
+
+        # Exits run in reverse: the writer flushes into the pipeline, which then drains
+        async with crawler_session(crawler) as crawler, \
+                EmbeddingPipeline(status) as pipeline, \
+                ScrapedDataWriter(status['user_id'], "sitemap", status, update_existing=refresh,
+                                  pipeline=pipeline, on_committed=mark_completed) as writer, \
+                aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as http_session:
+            await asyncio.gather(produce(), *(worker(crawler, writer, http_session) for _ in range(concurrency)))
+
+        if sitemap_error:
+            raise sitemap_error
 
         status["is_scraping"] = False
         status["remaining_pages"] = 0
-        status["error"] = None
+        if total_urls == 0:
+            status["error"] = "No URLs found in the sitemap."
+        elif status["failed_pages"] or failed_sitemaps:
+            crawled = status["scraped_pages"] - resume_position
+            status["error"] = f"{status['failed_pages']} of {crawled} pages failed to scrape."
+            if failed_sitemaps:
+                status["error"] += f" {len(failed_sitemaps)} child sitemap(s) could not be read."
+        else:
+            status["error"] = None
+        if status.get("embed_failed_pages"):
+            embed_error = f"{status['embed_failed_pages']} pages could not be embedded; run `manage.py embed_entries`."
+            status["error"] = f"{status['error']} {embed_error}" if status["error"] else embed_error
     except Exception as e:
         status["is_scraping"] = False
         status["error"] = f"Error during sitemap scraping: {str(e)}"
         print(f"Error during sitemap scraping: {str(e)}")
+        # The worker marks the job as failed
+        raise
 
-# Main scraper runner
-async def run_scraper(scrape_mode, scrape_url, status):
+# Main scraper runner (called by the ScrapeWorker in bot/jobs.py)
+async def run_scraper(scrape_mode, scrape_url, status, crawler=None, resume_position=0):
     if scrape_mode == "single":
-        await scrape_single_page_with_status(scrape_url, status)
+        await scrape_single_page_with_status(scrape_url, status, crawler=crawler)
     elif scrape_mode == "sitemap":
-        await scrape_sitemap_with_status(scrape_url, status)
+        await scrape_sitemap_with_status(scrape_url, status, crawler=crawler, resume_position=resume_position)
+    elif scrape_mode == "refresh":
+        # Incremental re-crawl of a sitemap: only new and changed pages are scraped and re-embedded
+        await scrape_sitemap_with_status(scrape_url, status, crawler=crawler, resume_position=resume_position,
+                                         refresh=True)
     else:
         status["is_scraping"] = False
-        status["error"] = "Invalid scrape mode. Please choose 'single' or 'sitemap'."
+        raise ValueError("Invalid scrape mode. Please choose 'single', 'sitemap' or 'refresh'.")
     
     # Ensure status is definitely set to false when the runner exits
     status["is_scraping"] = False
 
-# Threaded function to run the scraper in the background
-def run_scraper_thread(scrape_mode, scrape_url, status):
-    # This thread runs the entire async event loop
-    asyncio.run(run_scraper(scrape_mode, scrape_url, status))
-
 # API endpoint to start the scraper
 @csrf_exempt
 def api_scrape(request):
@@ -402,27 +689,12 @@ def api_scrape(request):
                 # if the user has 0 links remaining.
                 return JsonResponse({"error": "Invalid or missing 'rem_link' parameter."}, status=400)
 
-            # If a task is already running, prevent starting a new one
-            if user_id in scraping_status and scraping_status[user_id]["status"].get("is_scraping", False):
+            # Queue the job for `manage.py run_scrape_worker`; one active job per user
+            job = enqueue_scrape_job(user_id, scrape_url, scrape_mode, rem_link)
+            if job is None:
                  return JsonResponse({"error": "A scraping task is already running for this user."}, status=409)
 
-            status = {
-                "scraped_pages": 0,
-                "remaining_pages": 0,
-                "current_url": None,
-                "total_characters_scraped": 0,
-                "is_scraping": True,
-                "user_id": user_id,
-                "file_size": 0, # Kept for status response compatibility, though no longer relevant
-                "rem_link": rem_link,
-                "error": None,
-            }
-
-            scraping_status[user_id] = {"url": scrape_url, "mode": scrape_mode, "status": status}
-            thread = threading.Thread(target=run_scraper_thread, args=(scrape_mode, scrape_url, status))
-            thread.start()
-
-            return JsonResponse({"status": "Scrape started", "scrape_url": scrape_url, "scrape_mode": scrape_mode})
+            return JsonResponse({"status": "Scrape started", "job_id": job.pk, "scrape_url": scrape_url, "scrape_mode": scrape_mode})
 
         except json.JSONDecodeError:
             return JsonResponse({"error": "Invalid JSON format in the request body."}, status=400)
@@ -431,27 +703,89 @@ def api_scrape(request):
 
 # Get scrape status
 def get_scrape_status(request, user_id):
-    entry = scraping_status.get(user_id)
-    if not entry:
-        # Change 404 to 200 with an empty/completed status to prevent the frontend from erroring/spamming the console
-        return JsonResponse({"user_id": user_id, "is_scraping": False, "error": "No scraping task found for this user_id.", "scraped_pages": 0, "remaining_pages": 0}, status=200)
-
-    status = entry.get("status", {})
-    all_urls = [status.get("current_url") or entry.get("url")]
-    response_data = {
-        "user_id": user_id,
-        "url": entry.get("url"),
-        "mode": entry.get("mode"),
-        "scraped_pages": status.get("scraped_pages", 0),
-        "total_characters_scraped": status.get("total_characters_scraped", 0),
-        "is_scraping": status.get("is_scraping", False),
-        "remaining_pages": status.get("remaining_pages", 0),
-        "current_url": status.get("current_url") or entry.get("url"),
-        "file_size": status.get("file_size", 0),
-        "all_urls": all_urls,
-        "error": status.get("error", ""),
-    }
-    return JsonResponse(response_data)
+    """
+    Serves the latest progress snapshot from the shared cache (published by the
+    scrape worker) and only falls back to the ScrapeJob row on a cache miss.
+    Supports If-None-Match so unchanged polls are answered with 304.
+    """
+    payload = read_status(user_id)
+    if payload is None:
+        job = latest_job_for_user(user_id)
+        if not job:
+            # Change 404 to 200 with an empty/completed status to prevent the frontend from erroring/spamming the console
+            return JsonResponse({"user_id": user_id, "is_scraping": False, "error": "No scraping task found for this user_id.", "scraped_pages": 0, "remaining_pages": 0}, status=200)
+        payload = cache_status_from_db(job)
+
+    etag = etag_for(payload)
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse(payload)
+    response['ETag'] = etag
+    # Let browsers cache the body but revalidate it on every poll
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+# Fields whose changes are pushed to /bot/api/scrape/stream/ subscribers
+STREAMED_STATUS_FIELDS = ("scraped_pages", "remaining_pages", "current_url", "error", "failed_pages", "skipped_pages",
+                          "unchanged_pages", "saved_pages", "embedded_pages", "embed_failed_pages",
+                          "total_characters_scraped", "is_scraping", "state")
+
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _scrape_status_events(user_id):
+    """
+    Async generator of Server-Sent Events for a user's scrape job. It reads the shared
+    status cache every SCRAPE_STREAM_POLL_INTERVAL seconds (no ORM on the hot path),
+    emits only the fields that changed, a heartbeat comment when idle, and a final "done".
+    """
+    poll_interval = getattr(settings, 'SCRAPE_STREAM_POLL_INTERVAL', 0.5)
+    heartbeat_interval = getattr(settings, 'SCRAPE_STREAM_HEARTBEAT_SECONDS', 15)
+    max_duration = getattr(settings, 'SCRAPE_STREAM_MAX_SECONDS', 3600)
+
+    loop = asyncio.get_running_loop()
+    started = last_sent = loop.time()
+    previous = {}
+
+    # Tell EventSource how long to wait before reconnecting after a dropped connection
+    yield "retry: 3000\n\n"
+
+    while loop.time() - started < max_duration:
+        payload = await sync_to_async(read_status)(user_id)
+        if payload is None:
+            job = await sync_to_async(latest_job_for_user)(user_id)
+            if not job:
+                yield _sse_event("done", {"user_id": user_id, "is_scraping": False, "error": "No scraping task found for this user_id.", "scraped_pages": 0, "remaining_pages": 0})
+                return
+            payload = await sync_to_async(cache_status_from_db)(job)
+
+        delta = {key: payload.get(key) for key in STREAMED_STATUS_FIELDS if payload.get(key) != previous.get(key)}
+        if delta:
+            if not previous:
+                # The first event carries the full snapshot
+                delta = payload
+            yield _sse_event("status", delta)
+            previous = payload
+            last_sent = loop.time()
+        elif loop.time() - last_sent >= heartbeat_interval:
+            # SSE comment line: keeps proxies and load balancers from closing an idle stream
+            yield ": heartbeat\n\n"
+            last_sent = loop.time()
+
+        if not payload.get("is_scraping"):
+            yield _sse_event("done", payload)
+            return
+
+        await asyncio.sleep(poll_interval)
+
+# Stream scrape status (Server-Sent Events; served by the ASGI application)
+async def stream_scrape_status(request, user_id):
+    response = StreamingHttpResponse(_scrape_status_events(user_id), content_type="text/event-stream")
+    response['Cache-Control'] = 'no-cache'
+    # Disable response buffering in nginx-style proxies
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 # NOTE: The old append_data_to_file function has been removed.
 
@@ -1,7 +1,9 @@
 
+import asyncio
 from google.adk.agents import Agent
 # from google.adk.tools import google_search
 import requests
+from requests.adapters import HTTPAdapter
 import json
 from typing import Dict, Any
 
@@ -12,18 +14,51 @@ load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 BASE_URL = os.getenv("DJANGO_BASE_URL", "http://127.0.0.1:8000")
 LOCAL_API_URL = f"{BASE_URL}/bot/api/search/" 
 
-def search_api(question: str) -> str:
-    """
-    Sends a search query to the local RAG API endpoint and returns the raw JSON response.
-    Use this tool for all factual queries requiring internal blog information.
+# "local" calls the retrieval code in this process, "http" posts to LOCAL_API_URL (for agents
+# deployed apart from the Django project), "auto" uses local whenever Django is set up here.
+SEARCH_MODE = os.getenv("RAG_SEARCH_MODE", "auto").lower()
 
-    Args:
-        question (str): The question or query to send to the API.
+# Keep-alive connection pool for the HTTP fallback, shared by all tool calls
+http_session = requests.Session()
+http_session.mount("http://", HTTPAdapter(pool_maxsize=int(os.getenv("RAG_SEARCH_POOL_SIZE", "20"))))
+http_session.mount("https://", HTTPAdapter(pool_maxsize=int(os.getenv("RAG_SEARCH_POOL_SIZE", "20"))))
 
-    Returns:
-        str: The raw JSON text response from the API, containing the 'answer' 
-             and 'graph_url' generated by the RAG system.
+def use_local_search() -> bool:
+    if SEARCH_MODE in ("local", "http"):
+        return SEARCH_MODE == "local"
+    try:
+        from django.apps import apps
+        return apps.ready and apps.is_installed("bot")
+    except ImportError:
+        return False
+
+def search_local(question: str) -> str:
+    """Runs the same search as /bot/api/search/ in this process and returns its JSON body."""
+    from bot.retrieval import parse_search_params, search_response
+
+    question = question.strip()
+    if not question:
+        return json.dumps({"error": "Question field is required"})
+    # The parameters /bot/api/search/ uses for a request with only a question (same cache entries)
+    status, payload = search_response(question, **parse_search_params({}))
+    return json.dumps(payload)
+
+def search_local_in_thread(question: str) -> str:
     """
+    search_local for a worker thread outside Django's request cycle. The thread's ORM
+    connection is closed afterwards (CONN_MAX_AGE permitting), as Django does at the end
+    of a request, so executor threads do not keep database connections open.
+    """
+    from django.db import close_old_connections
+
+    close_old_connections()
+    try:
+        return search_local(question)
+    finally:
+        close_old_connections()
+
+def search_http(question: str) -> str:
+    """Posts the question to the RAG API over the pooled HTTP session."""
     url = LOCAL_API_URL
     
     payload = json.dumps({
@@ -35,7 +70,7 @@ def search_api(question: str) -> str:
 
     try:
         # Use a timeout for stability
-        response = requests.post(url, headers=headers, data=payload, timeout=120)
+        response = http_session.post(url, headers=headers, data=payload, timeout=120)
         response.raise_for_status()  # Raises an HTTPError if the response was an error
         
         # Return the raw JSON text for the LLM to parse and summarize
@@ -46,6 +81,29 @@ def search_api(question: str) -> str:
     except Exception as e:
         return f"An unexpected error occurred: {e}"
 
+async def search_api(question: str) -> str:
+    """
+    Sends a search query to the local RAG API endpoint and returns the raw JSON response.
+    Use this tool for all factual queries requiring internal blog information.
+
+    Args:
+        question (str): The question or query to send to the API.
+
+    Returns:
+        str: The raw JSON text response from the API, containing the 'answer' 
+             and 'graph_url' generated by the RAG system.
+    """
+    if use_local_search():
+        from asgiref.sync import sync_to_async
+
+        # Off the event loop, in a thread of its own: the default thread_sensitive=True would queue
+        # every concurrent search behind Django's single sync thread
+        try:
+            return await sync_to_async(search_local_in_thread, thread_sensitive=False)(question)
+        except Exception as e:
+            return f"An unexpected error occurred: {e}"
+    return await asyncio.to_thread(search_http, question)
+
 # Define the Agent based on the instructions from the original Flask project
 root_agent = Agent(
     name="wikipedia_analyst",
@@ -0,0 +1,110 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from google.adk.sessions import DatabaseSessionService
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# google-adk >= 1.19 runs the session store on an async SQLAlchemy engine, which needs an
+# asyncio driver; plain sqlite:// and postgresql:// URLs are mapped to one
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+psycopg'}
+# psycopg works either way; only aiosqlite has no blocking mode
+SYNC_DRIVERS = {'sqlite+aiosqlite': 'sqlite'}
+
+
+def async_db_url(db_url):
+    """Returns `db_url` with the default driver of its backend replaced by the asyncio one."""
+    url = make_url(db_url)
+    drivername = ASYNC_DRIVERS.get(url.drivername, url.drivername)
+    return url.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+def sync_db_url(db_url):
+    """Returns `db_url` with a blocking driver, for maintenance commands that use a plain engine."""
+    url = make_url(db_url)
+    drivername = SYNC_DRIVERS.get(url.drivername, url.drivername)
+    return url.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+def engine_options(db_url, pool=None, busy_timeout=2):
+    """
+    Returns the create_engine() keyword arguments for the ADK session store: the pool
+    settings for server databases and file-backed SQLite, and for SQLite a busy timeout
+    so writers wait for the lock instead of failing with "database is locked".
+    """
+    url = make_url(db_url)
+    options = {}
+    if url.get_backend_name() == 'sqlite':
+        options['connect_args'] = {'timeout': busy_timeout}
+        if url.database in (None, '', ':memory:'):
+            # In-memory SQLite lives in a single connection; there is nothing to pool
+            return options
+    options.update(pool or {})
+    return options
+
+
+# Set while a session store call only reads; its transaction then begins deferred
+_read_only = contextvars.ContextVar('adk_session_read_only', default=False)
+
+
+@contextmanager
+def read_only_transactions():
+    """Marks the transactions begun inside the block as read-only (see enable_sqlite_wal)."""
+    token = _read_only.set(True)
+    try:
+        yield
+    finally:
+        _read_only.reset(token)
+
+
+class SessionService(DatabaseSessionService):
+    """DatabaseSessionService whose read-only calls run in read-only transactions."""
+
+    async def get_session(self, *args, **kwargs):
+        # Creating the tables (on first use) reads the schema and then writes; not read-only
+        await self._ensure_tables_created()
+        with read_only_transactions():
+            return await super().get_session(*args, **kwargs)
+
+    async def list_sessions(self, *args, **kwargs):
+        with read_only_transactions():
+            return await super().list_sessions(*args, **kwargs)
+
+
+def enable_sqlite_wal(engine, busy_timeout=2):
+    """
+    Puts every SQLite connection of the engine in WAL mode (readers no longer block the
+    writer), with synchronous=NORMAL, which is durable under WAL, and a busy timeout.
+    Transactions that may write start with BEGIN IMMEDIATE: a deferred transaction that
+    reads and then writes fails at once with "database is locked" when another writer got
+    in between, without waiting for the busy timeout. Read-only transactions (see
+    read_only_transactions) begin deferred, so under WAL they never wait for a writer.
+    """
+    engine = getattr(engine, 'sync_engine', engine)  # the listeners go on the async engine's sync core
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        # Let SQLAlchemy emit BEGIN itself instead of the driver's deferred BEGIN
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def begin(connection):
+        connection.exec_driver_sql("BEGIN" if _read_only.get() else "BEGIN IMMEDIATE")
+
+
+def create_session_service(db_url=None, pool=None, busy_timeout=None):
+    """Creates the ADK DatabaseSessionService from ADK_SESSION_DB_URL and its pool settings."""
+    db_url = async_db_url(db_url or settings.ADK_SESSION_DB_URL)
+    pool = getattr(settings, 'ADK_SESSION_DB_POOL', {}) if pool is None else pool
+    busy_timeout = getattr(settings, 'ADK_SESSION_DB_BUSY_TIMEOUT', 2) if busy_timeout is None else busy_timeout
+
+    service = SessionService(db_url=db_url, **engine_options(db_url, pool, busy_timeout))
+    if make_url(db_url).get_backend_name() == 'sqlite':
+        enable_sqlite_wal(service.db_engine, busy_timeout)
+    return service
@@ -0,0 +1,180 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from google.adk.events import Event
+from google.adk.sessions import DatabaseSessionService
+from google.genai.types import Content, Part
+
+from bot.models import ScrapedDataEntry
+from myapp.adk_session_store import async_db_url, create_session_service
+from myapp.models import ChatMessage
+
+# name -> (ADK session store in its own file, tuned SQLite settings). The two middle scenarios
+# change one thing at a time, so each change's share of the difference is visible.
+SCENARIOS = {
+    'shared': (False, False),
+    'shared_tuned': (False, True),
+    'separate_untuned': (True, False),
+    'separate': (True, True),
+}
+
+
+class Command(BaseCommand):
+    """
+    Reproduces SQLite write-lock contention between the writers of one pod: the ADK runner
+    appending session events, chat messages being saved and scrape batches being bulk
+    inserted. For each scenario the three run concurrently for --duration seconds against
+    fresh databases in a temporary directory, and "database is locked" errors are counted.
+
+      shared            the old setup: ADK sessions inside the Django database file, default SQLite settings
+      shared_tuned      one file, but Django with the busy timeout from the DATABASES OPTIONS and the
+                        session engine from create_session_service (WAL, IMMEDIATE write transactions)
+      separate_untuned  the session store in its own file, default SQLite settings on both
+      separate          the current setup: its own file (as ADK_SESSION_DB_URL) and the tuned settings
+
+    Read ops/s together with the locked column. The scrape batches have the shape of the
+    scraper's batch save: the existing rows are read outside the transaction, which then starts
+    with its insert, so it queues for the write lock instead of failing to upgrade a read lock.
+    Locked errors should therefore stay near zero in every scenario; a few in shared_tuned are
+    session appends that waited longer than ADK_SESSION_DB_BUSY_TIMEOUT behind Django writers.
+    The ops/s columns show how the writers share the lock; they vary between runs, so compare
+    scenarios over a longer --duration. With its own file the session store no longer takes
+    the lock that chat messages and scrape batches queue for.
+    """
+    help = "Benchmark concurrent ADK, chat and scrape writes on SQLite and count 'database is locked' errors."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS))
+        parser.add_argument('--duration', type=float, default=15, help="Seconds per scenario.")
+        parser.add_argument('--adk-writers', type=int, default=4, help="Threads appending ADK session events.")
+        parser.add_argument('--chat-writers', type=int, default=4, help="Threads saving chat messages.")
+        parser.add_argument('--scrape-writers', type=int, default=2, help="Threads bulk-inserting scraped pages.")
+        parser.add_argument('--batch-size', type=int, default=200, help="Pages per scrape transaction.")
+
+    def handle(self, *args, **options):
+        header = f"{'scenario':<16} {'writer':<8} {'ops':>7} {'ops/s':>8} {'locked':>7} {'other':>6}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for scenario in options['scenarios']:
+                results, other_errors = self.run_scenario(scenario, tmpdir, options)
+                for writer, (ops, locked, other) in results.items():
+                    self.stdout.write(f"{scenario:<16} {writer:<8} {ops:>7} {ops / options['duration']:>8.1f} "
+                                      f"{locked:>7} {other:>6}")
+                for message in sorted(other_errors)[:3]:
+                    self.stdout.write(f"  other error: {message}")
+
+    def setup_databases(self, scenario, tmpdir):
+        """Creates and migrates a Django database alias and the ADK session service for a scenario."""
+        separate, tuned = SCENARIOS[scenario]
+        alias = f"benchmark_{scenario}"
+        db_path = os.path.join(tmpdir, f"{scenario}.sqlite3")
+        django_options = dict(settings.DATABASES['default'].get('OPTIONS', {})) if tuned else {}
+        connections.settings[alias] = {**connections.settings['default'], 'NAME': db_path, 'OPTIONS': django_options}
+        call_command('migrate', database=alias, verbosity=0)
+
+        session_db_url = async_db_url(f"sqlite:///{os.path.join(tmpdir, f'{scenario}_adk.sqlite3') if separate else db_path}")
+        if tuned:
+            session_service = create_session_service(db_url=session_db_url)
+        else:
+            session_service = DatabaseSessionService(db_url=session_db_url)
+        return alias, session_service
+
+    def run_scenario(self, scenario, tmpdir, options):
+        alias, session_service = self.setup_databases(scenario, tmpdir)
+        user = User.objects.db_manager(alias).create_user(username=f"benchmark-{uuid.uuid4().hex[:8]}")
+        deadline = time.monotonic() + options['duration']
+        counters = {writer: [0, 0, 0] for writer in ('adk', 'chat', 'scrape')}
+        other_errors = set()
+        lock = threading.Lock()
+
+        def record(writer, error=None):
+            with lock:
+                if error is None:
+                    counters[writer][0] += 1
+                elif 'database is locked' in str(error):
+                    counters[writer][1] += 1
+                else:
+                    counters[writer][2] += 1
+                    other_errors.add(f"{writer}: {str(error).splitlines()[0][:160]}")
+
+        # Created up front: the first create_session of an app inserts its app_states row, which
+        # would race between writers
+        sessions = [
+            asyncio.run(session_service.create_session(app_name="benchmark", user_id=str(user.pk),
+                                                       session_id=f"bench-{n}"))
+            for n in range(options['adk_writers'])
+        ]
+
+        def adk_writer(n):
+            async def run():
+                session = sessions[n]
+                while time.monotonic() < deadline:
+                    event = Event(author="user", invocation_id=uuid.uuid4().hex,
+                                  content=Content(role="user", parts=[Part(text="What is new on the blog?")]))
+                    try:
+                        await session_service.append_event(session, event)
+                        record('adk')
+                    except Exception as e:
+                        record('adk', e)
+                        # Reload the session so a failed append does not leave it stale
+                        session = await session_service.get_session(app_name="benchmark", user_id=session.user_id,
+                                                                    session_id=session.id)
+            asyncio.run(run())
+
+        def chat_writer(n):
+            try:
+                while time.monotonic() < deadline:
+                    try:
+                        ChatMessage.objects.using(alias).create(user_id=user.pk, session_id=f"bench-{n}",
+                                                                role="user", text="What is new on the blog?")
+                        record('chat')
+                    except Exception as e:
+                        record('chat', e)
+            finally:
+                connections.close_all()
+
+        def scrape_writer(n):
+            batch_number = 0
+            try:
+                while time.monotonic() < deadline:
+                    batch_number += 1
+                    urls = [f"https://example.com/{n}/{batch_number}/{i}" for i in range(options['batch_size'])]
+                    try:
+                        # Same shape as the scraper's batch save: read existing rows, then insert in
+                        # a transaction that starts with its write
+                        list(ScrapedDataEntry.objects.using(alias).filter(url__in=urls).values_list('url', flat=True))
+                        with transaction.atomic(using=alias):
+                            ScrapedDataEntry.objects.using(alias).bulk_create([
+                                ScrapedDataEntry(url=url, scraped_by_user_id=str(user.pk), scrape_mode='sitemap',
+                                                 content_summary="Lorem ipsum " * 200)
+                                for url in urls
+                            ], ignore_conflicts=True)
+                        record('scrape')
+                    except Exception as e:
+                        record('scrape', e)
+            finally:
+                connections.close_all()
+
+        threads = (
+            [threading.Thread(target=adk_writer, args=(n,)) for n in range(options['adk_writers'])]
+            + [threading.Thread(target=chat_writer, args=(n,)) for n in range(options['chat_writers'])]
+            + [threading.Thread(target=scrape_writer, args=(n,)) for n in range(options['scrape_writers'])]
+        )
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        connections[alias].close()
+        asyncio.run(session_service.db_engine.dispose())
+        return counters, other_errors
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from google.adk.sessions.database_session_service import Base
+from sqlalchemy import MetaData, create_engine, select, type_coerce
+from sqlalchemy.dialects import postgresql, sqlite
+
+from myapp.adk_session_store import sync_db_url
+
+# Parents before children, so the foreign keys hold while copying
+TABLES = ('app_states', 'user_states', 'sessions', 'events')
+
+# Inserts that skip rows already in the target, so the copy can be re-run
+INSERT_OR_IGNORE = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+class Command(BaseCommand):
+    """
+    One-off copy of the ADK session tables (sessions, events, app and user state) from the
+    database they used to share with Django into ADK_SESSION_DB_URL, so existing chats keep
+    their agent memory after the session store moved to its own file.
+
+    The target tables are created with the installed google-adk schema; columns that older
+    versions did not have keep their defaults. Rows already in the target are left alone.
+    """
+    help = "Copy ADK sessions from the Django database (or --source) into ADK_SESSION_DB_URL (or --target)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', help="Database URL holding the existing sessions (default: the Django database).")
+        parser.add_argument('--target', help="Database URL to copy them into (default: ADK_SESSION_DB_URL).")
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows inserted per statement.")
+
+    def handle(self, *args, **options):
+        source_url = sync_db_url(options['source'] or f"sqlite:///{settings.DATABASES['default']['NAME']}")
+        target_url = sync_db_url(options['target'] or settings.ADK_SESSION_DB_URL)
+        if source_url == target_url:
+            raise CommandError("Source and target are the same database; nothing to copy.")
+
+        source, target = create_engine(source_url), create_engine(target_url)
+        try:
+            source_tables = MetaData()
+            source_tables.reflect(source, only=lambda name, _: name in TABLES)
+            if 'sessions' not in source_tables.tables:
+                raise CommandError(f"No ADK session tables in {source.url!r}.")
+            Base.metadata.create_all(target)
+
+            for name in TABLES:
+                if name in source_tables.tables:
+                    copied = self.copy_table(source, target, source_tables.tables[name], Base.metadata.tables[name],
+                                             options['batch_size'])
+                    self.stdout.write(f"{name}: {copied} rows")
+        finally:
+            source.dispose()
+            target.dispose()
+
+        self.stdout.write(self.style.SUCCESS(f"Copied ADK sessions to {target.url!r}."))
+
+    def copy_table(self, source, target, source_table, target_table, batch_size):
+        # Read the source through the ADK column types, so JSON and pickled values are decoded
+        # and re-encoded for the target's dialect instead of being copied as raw text or bytes
+        columns = [
+            type_coerce(source_table.c[column.name], column.type).label(column.name)
+            for column in target_table.columns if column.name in source_table.c
+        ]
+        insert = INSERT_OR_IGNORE.get(target.dialect.name)
+        statement = insert(target_table).on_conflict_do_nothing() if insert else target_table.insert()
+
+        copied = 0
+        with source.connect() as reader, target.begin() as writer:
+            result = reader.execution_options(yield_per=batch_size).execute(select(*columns))
+            for rows in result.partitions():
+                writer.execute(statement, [dict(row._mapping) for row in rows])
+                copied += len(rows)
+        return copied
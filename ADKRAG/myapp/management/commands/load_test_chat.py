@@ -0,0 +1,120 @@
+import asyncio
+import os
+import secrets
+import time
+
+import aiohttp
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """
+    Measures how many concurrent chats one server sustains. Logs in once, then for each
+    concurrency level keeps that many /api/chat/ requests in flight (one chat session per
+    client) for --duration seconds and reports throughput, latency and errors.
+
+    Run it against the same pod served by WSGI (`gunicorn myadk.wsgi`) and by ASGI
+    (`gunicorn myadk.asgi -k uvicorn.workers.UvicornWorker`) to compare the two.
+    Every request is a real agent turn, billed by the model provider.
+    """
+    help = "Load-test /api/chat/ at increasing concurrency and report the highest level the server sustains."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default=os.getenv("DJANGO_BASE_URL", "http://127.0.0.1:8000"))
+        parser.add_argument('--username', required=True)
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 5, 10, 25, 50])
+        parser.add_argument('--duration', type=float, default=60, help="Seconds spent at each concurrency level.")
+        parser.add_argument('--message', default="Give me a one-sentence summary of the latest article.")
+        parser.add_argument('--timeout', type=float, default=120, help="Per-request timeout (the UI gives up after 120s).")
+        parser.add_argument('--max-error-rate', type=float, default=0.01)
+        parser.add_argument('--max-p99', type=float, default=30.0, help="Highest acceptable p99 latency in seconds.")
+
+    def handle(self, *args, **options):
+        asyncio.run(self._run(options))
+
+    async def _run(self, options):
+        base_url = options['base_url'].rstrip('/')
+        connector = aiohttp.TCPConnector(limit=max(options['concurrency']))
+        # unsafe=True keeps cookies for IP hosts such as 127.0.0.1
+        async with aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.CookieJar(unsafe=True),
+                                         timeout=aiohttp.ClientTimeout(total=options['timeout'])) as http:
+            csrftoken = await self._login(http, base_url, options['username'], options['password'])
+
+            header = f"{'clients':>8} {'turns':>7} {'errors':>7} {'turns/s':>8} {'p50 s':>7} {'p99 s':>7}"
+            self.stdout.write(header)
+            self.stdout.write('-' * len(header))
+
+            sustained = 0
+            for concurrency in options['concurrency']:
+                result = await self._run_level(http, base_url, csrftoken, concurrency, options)
+                self.stdout.write(
+                    f"{concurrency:>8} {result['turns']:>7} {result['errors']:>7} {result['turns_per_s']:>8.2f} "
+                    f"{result['p50']:>7.2f} {result['p99']:>7.2f}"
+                )
+                attempts = result['turns'] + result['errors']
+                if attempts and result['errors'] / attempts <= options['max_error_rate'] and result['p99'] <= options['max_p99']:
+                    sustained = concurrency
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sustained {sustained} concurrent chats (error rate <= {options['max_error_rate']:.0%}, "
+            f"p99 <= {options['max_p99']:.0f}s)."
+        ))
+
+    async def _login(self, http, base_url, username, password):
+        login_url = f"{base_url}/accounts/login/"
+        async with http.get(login_url) as response:
+            await response.read()
+        async with http.post(login_url, data={
+            'username': username,
+            'password': password,
+            'csrfmiddlewaretoken': self._cookie(http, 'csrftoken'),
+        }, headers={'Referer': login_url}) as response:
+            await response.read()
+        if not self._cookie(http, 'sessionid'):
+            raise CommandError(f"Could not log in to {login_url} as {username}.")
+        # Django rotates the CSRF token on login
+        return self._cookie(http, 'csrftoken')
+
+    @staticmethod
+    def _cookie(http, name):
+        for cookie in http.cookie_jar:
+            if cookie.key == name:
+                return cookie.value
+        return None
+
+    async def _run_level(self, http, base_url, csrftoken, concurrency, options):
+        latencies = []
+        errors = 0
+        deadline = time.monotonic() + options['duration']
+
+        async def client(session_id):
+            nonlocal errors
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    async with http.post(
+                        f"{base_url}/api/chat/", params={'session_id': session_id},
+                        json={'message': options['message']},
+                        headers={'X-CSRFToken': csrftoken, 'Referer': base_url},
+                    ) as response:
+                        await response.read()
+                        ok = response.status == 200
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(client(f"loadtest-{secrets.token_hex(4)}") for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+        return {
+            'turns': len(latencies),
+            'errors': errors,
+            'turns_per_s': len(latencies) / elapsed,
+            'p50': float(np.percentile(latencies, 50)) if latencies else float('nan'),
+            'p99': float(np.percentile(latencies, 99)) if latencies else float('nan'),
+        }
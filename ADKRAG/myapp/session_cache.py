@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Counter names exposed by SessionCache.stats()
+STAT_NAMES = ('hits', 'shared_hits', 'misses', 'creates', 'evictions', 'expirations')
+
+
+class SessionCache:
+    """
+    Remembers which ADK sessions are known to exist, so a chat turn only touches the
+    session database the first time a user:session pair is seen.
+
+    Entries live in a per-process LRU bounded by max_entries and expire after ttl seconds.
+    With shared_alias, entries are also written to that Django cache (e.g. Redis), so a
+    session created by one worker or replica is a hit for all the others that use the same
+    session database.
+    """
+
+    def __init__(self, max_entries=10000, ttl=3600, shared_alias=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared_alias = shared_alias
+        self._entries = OrderedDict()  # key -> expiry (monotonic seconds)
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(STAT_NAMES, 0)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            max_entries=getattr(settings, 'ADK_SESSION_CACHE_MAX_ENTRIES', 10000),
+            ttl=getattr(settings, 'ADK_SESSION_CACHE_TTL', 3600),
+            shared_alias=getattr(settings, 'ADK_SESSION_CACHE_ALIAS', None),
+        )
+
+    def count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _shared_key(self, key):
+        return f"adk:session:{key}"
+
+    def _get_local(self, key):
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is None:
+                return False
+            if expires <= time.monotonic():
+                del self._entries[key]
+                self._stats['expirations'] += 1
+                return False
+            self._entries.move_to_end(key)
+            return True
+
+    def _add_local(self, key):
+        with self._lock:
+            self._entries[key] = time.monotonic() + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    async def contains(self, key):
+        """Returns True if the session is known to exist, counting a hit or a miss."""
+        if self._get_local(key):
+            self.count('hits')
+            return True
+        if self.shared_alias and await caches[self.shared_alias].aget(self._shared_key(key)):
+            self._add_local(key)
+            self.count('shared_hits')
+            return True
+        self.count('misses')
+        return False
+
+    async def add(self, key):
+        """Records that the session exists."""
+        self._add_local(key)
+        if self.shared_alias:
+            await caches[self.shared_alias].aset(self._shared_key(key), True, timeout=self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns this process's counters, the current size and the hit ratio."""
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries), max_entries=self.max_entries,
+                         ttl=self.ttl, shared_alias=self.shared_alias)
+        lookups = stats['hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['hits'] + stats['shared_hits']) / lookups, 4) if lookups else None
+        return stats
@@ -1,3 +1,301 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import json
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from google.adk.agents import BaseAgent
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from google.adk.events import Event
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai.types import Content, FunctionCall, FunctionResponse, Part
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from . import views
+from .adk_session_store import create_session_service
+from .models import ChatMessage
+from .session_cache import SessionCache
+
+
+class FakeAgent(BaseAgent):
+    """Local stand-in for the LLM agent: streams two text chunks around a tool call."""
+    fail: bool = False
+
+    def event(self, ctx, partial=False, **part):
+        return Event(author=self.name, invocation_id=ctx.invocation_id, partial=partial,
+                     content=Content(role="model", parts=[Part(**part)]))
+
+    async def _run_async_impl(self, ctx):
+        yield self.event(ctx, function_call=FunctionCall(name="search_api", args={"question": "adk"}))
+        yield self.event(ctx, function_response=FunctionResponse(name="search_api", response={"answer": "ADK"}))
+        yield self.event(ctx, partial=True, text="Hello ")
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        yield self.event(ctx, partial=True, text="world")
+        yield self.event(ctx, text="Hello world")
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class ChatViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="alice", password="secret")
+        self.client.force_login(self.user)
+        self.agent = FakeAgent(name="fake_agent")
+        runner = Runner(agent=self.agent, app_name=views.ADK_APP_NAME, session_service=InMemorySessionService())
+        patchers = [
+            mock.patch.object(views, "runner", runner),
+            mock.patch.object(views, "session_service", runner.session_service),
+            mock.patch.object(views, "adk_sessions", SessionCache()),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def stream(self, message):
+        response = await self.async_client.post("/api/chat/stream/?session_id=s1", {"message": message},
+                                                content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        return parse_sse(body)
+
+    async def test_stream_forwards_partial_and_tool_events(self):
+        await self.async_client.aforce_login(self.user)
+        events = await self.stream("What is ADK?")
+        self.assertEqual(events, [
+            ("tool_call", {"name": "search_api", "args": {"question": "adk"}}),
+            ("tool_result", {"name": "search_api"}),
+            ("delta", {"text": "Hello "}),
+            ("delta", {"text": "world"}),
+            ("done", {"response": "Hello world"}),
+        ])
+
+    async def test_stream_persists_each_message_once(self):
+        await self.async_client.aforce_login(self.user)
+        await self.stream("What is ADK?")
+        messages = [(m.role, m.text) async for m in ChatMessage.objects.filter(session_id="s1")]
+        self.assertEqual(messages, [("user", "What is ADK?"), ("agent", "Hello world")])
+
+    async def test_stream_reports_agent_errors_without_saving_an_answer(self):
+        await self.async_client.aforce_login(self.user)
+        self.agent.fail = True
+        events = await self.stream("What is ADK?")
+        self.assertEqual(events[-1][0], "error")
+        self.assertIn("model unavailable", events[-1][1]["response"])
+        self.assertFalse(await ChatMessage.objects.filter(role="agent").aexists())
+
+    def test_chat_returns_the_final_response(self):
+        response = self.client.post("/api/chat/?session_id=s1", {"message": "What is ADK?"},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"response": "Hello world"})
+
+    def test_history_lists_messages_and_sessions_with_basic_auth(self):
+        self.client.post("/api/chat/?session_id=s1", {"message": "What is ADK?"}, content_type="application/json")
+        ChatMessage.objects.create(user=User.objects.create_user(username="bob"), session_id="s1", role="user",
+                                   text="Not alice's")
+        self.client.logout()
+        credentials = base64.b64encode(b"alice:secret").decode()
+        response = self.client.get("/api/history/?session_id=s1", HTTP_AUTHORIZATION=f"Basic {credentials}")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([(m["role"], m["text"]) for m in data["history"]],
+                         [("user", "What is ADK?"), ("agent", "Hello world")])
+        self.assertEqual(data["sessions"], [{"id": "s1", "name": "What is ADK?"}])
+
+    def test_chat_with_basic_auth_needs_no_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        credentials = base64.b64encode(b"alice:secret").decode()
+        for path in ("/api/chat/?session_id=s1", "/api/chat/stream/?session_id=s2"):
+            response = client.post(path, {"message": "What is ADK?"}, content_type="application/json",
+                                    HTTP_AUTHORIZATION=f"Basic {credentials}")
+            self.assertEqual(response.status_code, 200, path)
+        self.assertEqual(ChatMessage.objects.filter(user=self.user, role="user").count(), 2)
+
+    def test_chat_with_a_session_cookie_needs_a_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post("/api/chat/?session_id=s1", {"message": "hi"}, content_type="application/json")
+        self.assertEqual(response.status_code, 403)
+        self.assertIn("CSRF", response.json()["detail"])
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_chat_rejects_wrong_basic_credentials(self):
+        self.client.logout()
+        credentials = base64.b64encode(b"alice:wrong").decode()
+        response = self.client.post("/api/chat/?session_id=s1", {"message": "hi"}, content_type="application/json",
+                                    HTTP_AUTHORIZATION=f"Basic {credentials}")
+        # As in DRF: SessionAuthentication comes first and sends no challenge, so this is a 403
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json(), {"detail": "Invalid username/password."})
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_history_requires_login(self):
+        self.client.logout()
+        response = self.client.get("/api/history/?session_id=s1")
+        self.assertEqual(response.status_code, 401)
+
+    def test_chat_requires_login(self):
+        self.client.logout()
+        response = self.client.post("/api/chat/stream/?session_id=s1", {"message": "hi"}, content_type="application/json")
+        self.assertEqual(response.status_code, 401)
+
+
+class SessionCacheTests(SimpleTestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = SessionCache(max_entries=2, ttl=60)
+        asyncio.run(cache.add("a"))
+        asyncio.run(cache.add("b"))
+        self.assertTrue(asyncio.run(cache.contains("a")))
+        asyncio.run(cache.add("c"))
+        self.assertFalse(asyncio.run(cache.contains("b")))
+        self.assertTrue(asyncio.run(cache.contains("a")))
+        stats = cache.stats()
+        self.assertEqual((stats["size"], stats["evictions"], stats["hits"], stats["misses"]), (2, 1, 2, 1))
+
+    def test_entries_expire(self):
+        cache = SessionCache(ttl=10)
+        with mock.patch("myapp.session_cache.time.monotonic", return_value=100.0):
+            asyncio.run(cache.add("a"))
+        with mock.patch("myapp.session_cache.time.monotonic", return_value=111.0):
+            self.assertFalse(asyncio.run(cache.contains("a")))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    @override_settings(CACHES={"shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "adk-test"}})
+    def test_shared_cache_is_consulted_after_a_local_miss(self):
+        asyncio.run(SessionCache(shared_alias="shared").add("a"))
+        other_process = SessionCache(shared_alias="shared")
+        self.assertTrue(asyncio.run(other_process.contains("a")))
+        self.assertEqual(other_process.stats()["shared_hits"], 1)
+
+
+class EnsureAdkSessionTests(SimpleTestCase):
+    def setUp(self):
+        self.service = mock.Mock(create_session=mock.AsyncMock(), get_session=mock.AsyncMock())
+        for patcher in (mock.patch.object(views, "session_service", self.service),
+                        mock.patch.object(views, "adk_sessions", SessionCache())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_miss_costs_one_create_and_hits_cost_nothing(self):
+        asyncio.run(views.ensure_adk_session("s1", "1"))
+        asyncio.run(views.ensure_adk_session("s1", "1"))
+        self.assertEqual(self.service.create_session.await_count, 1)
+        self.service.get_session.assert_not_called()
+        self.assertEqual(views.adk_sessions.stats()["creates"], 1)
+
+    def test_existing_session_counts_as_created(self):
+        self.service.create_session.side_effect = AlreadyExistsError()
+        self.service.get_session.return_value = object()
+        asyncio.run(views.ensure_adk_session("s1", "1"))
+        self.assertTrue(asyncio.run(views.adk_sessions.contains("1:s1")))
+        self.assertEqual(views.adk_sessions.stats()["creates"], 0)
+
+    def test_lost_state_row_race_is_retried(self):
+        # The user_states insert of a new user collided with another worker; the session is not there
+        self.service.create_session.side_effect = [IntegrityError("INSERT", {}, Exception("UNIQUE constraint failed")),
+                                                   object()]
+        self.service.get_session.return_value = None
+        asyncio.run(views.ensure_adk_session("s1", "1"))
+        self.assertEqual(self.service.create_session.await_count, 2)
+        self.assertTrue(asyncio.run(views.adk_sessions.contains("1:s1")))
+
+    def test_failed_retry_is_not_cached(self):
+        conflict = IntegrityError("INSERT", {}, Exception("UNIQUE constraint failed"))
+        self.service.create_session.side_effect = [conflict, conflict]
+        self.service.get_session.return_value = None
+        with self.assertRaises(IntegrityError):
+            asyncio.run(views.ensure_adk_session("s1", "1"))
+        self.assertFalse(asyncio.run(views.adk_sessions.contains("1:s1")))
+
+
+class SessionCacheStatsTests(TestCase):
+    def test_stats_are_staff_only(self):
+        self.assertEqual(self.client.get("/api/sessions/cache/stats/").status_code, 302)
+        self.client.force_login(User.objects.create_user(username="staff", is_staff=True))
+        response = self.client.get("/api/sessions/cache/stats/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("hits", response.json())
+
+
+class SessionStoreTransactionTests(SimpleTestCase):
+    def test_only_writing_calls_begin_immediate(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        service = create_session_service(db_url=f"sqlite:///{os.path.join(tmpdir.name, 'adk.sqlite3')}")
+        begins = []
+
+        @event.listens_for(service.db_engine.sync_engine, "before_cursor_execute")
+        def record(conn, cursor, statement, *args):
+            if statement.startswith("BEGIN"):
+                begins.append(statement)
+
+        async def run():
+            try:
+                session = await service.create_session(app_name="agents", user_id="1", session_id="s1")
+                created = begins[:]
+                begins.clear()
+                await service.get_session(app_name="agents", user_id="1", session_id="s1")
+                await service.list_sessions(app_name="agents", user_id="1")
+                read = begins[:]
+                begins.clear()
+                await service.append_event(session, Event(author="user", invocation_id="i1"))
+                return created, read, begins[:]
+            finally:
+                await service.db_engine.dispose()
+
+        created, read, appended = asyncio.run(run())
+        self.assertTrue(created and appended)
+        self.assertEqual(set(created + appended), {"BEGIN IMMEDIATE"})
+        self.assertEqual(read, ["BEGIN", "BEGIN"])
+
+
+class CopyAdkSessionsTests(SimpleTestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.source_url = f"sqlite:///{os.path.join(tmpdir.name, 'db.sqlite3')}"
+        self.target_url = f"sqlite:///{os.path.join(tmpdir.name, 'adk_sessions.sqlite3')}"
+
+    async def create_session(self):
+        service = create_session_service(db_url=self.source_url)
+        session = await service.create_session(app_name="agents", user_id="1", session_id="s1",
+                                               state={"topic": "adk", "user:name": "alice"})
+        await service.append_event(session, Event(author="user", invocation_id="i1",
+                                                  content=Content(role="user", parts=[Part(text="What is ADK?")])))
+        await service.db_engine.dispose()
+
+    async def load_copied_session(self):
+        service = create_session_service(db_url=self.target_url)
+        try:
+            return await service.get_session(app_name="agents", user_id="1", session_id="s1")
+        finally:
+            await service.db_engine.dispose()
+
+    def test_sessions_events_and_state_are_copied_once(self):
+        asyncio.run(self.create_session())
+        for _ in range(2):  # re-running skips the rows already copied
+            call_command("copy_adk_sessions", source=self.source_url, target=self.target_url, stdout=io.StringIO())
+
+        session = asyncio.run(self.load_copied_session())
+        self.assertEqual(session.state, {"topic": "adk", "user:name": "alice"})
+        self.assertEqual([event.content.parts[0].text for event in session.events], ["What is ADK?"])
+
+    def test_same_database_is_refused(self):
+        with self.assertRaisesMessage(CommandError, "same database"):
+            call_command("copy_adk_sessions", source=self.source_url, target=self.source_url)
@@ -8,5 +8,7 @@ urlpatterns = [
     # API Routes
     path('api/history/', views.ChatHistoryView.as_view(), name='api_history'),
     path('api/chat/', views.ChatAPIView.as_view(), name='api_chat'), 
+    path('api/chat/stream/', views.ChatStreamView.as_view(), name='api_chat_stream'),
+    path('api/sessions/cache/stats/', views.session_cache_stats, name='api_session_cache_stats'),
     path('api/settings/', views.AppSettingsAPIView.as_view(), name='app_settings_api'),
 ]
@@ -1,20 +1,31 @@
-import asyncio
+import json
 import secrets
 import os
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.urls import reverse
 from django.conf import settings
 from django.db.models import Max, Subquery, OuterRef # <-- UPDATED IMPORT for Subquery/OuterRef
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required 
 from django.contrib.auth.forms import UserCreationForm 
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
 from rest_framework.views import APIView
+from rest_framework.request import Request
 from rest_framework.response import Response
-from rest_framework import status
-from google.adk.sessions import DatabaseSessionService
+from rest_framework.settings import api_settings
+from rest_framework import exceptions, status
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.adk.runners import Runner
 from google.genai.types import Content, Part
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from sqlalchemy.exc import IntegrityError
 from .models import ChatMessage, AppSettings, COLOR_CHOICES
 from .serializers import ChatMessageSerializer, ChatRequestSerializer, AppSettingsSerializer
+from .adk_session_store import create_session_service
+from .session_cache import SessionCache
 from django.contrib.auth import login
 
 # Import the ADK Agent (Corrected path)
@@ -27,11 +38,13 @@ except ImportError:
 # --- Global ADK Initialization ---
 ADK_APP_NAME = getattr(settings, 'ADK_APP_NAME', 'agents')
 
-# FIX: Construct the DB_URL using settings.BASE_DIR and pass it to DatabaseSessionService
-DB_PATH = os.path.join(settings.BASE_DIR, 'db.sqlite3')
-DB_URL = f"sqlite:///{DB_PATH}"
-session_service = DatabaseSessionService(db_url=DB_URL)
+# The session store has its own database (ADK_SESSION_DB_URL), so agent event writes do not
+# compete with Django for db.sqlite3's write lock
+session_service = create_session_service()
 
+# One Runner per process, shared by every request. Under the ASGI application the async
+# chat views below run on the server's long-lived event loop, so a chat turn no longer
+# creates its own loop or holds a worker thread while the model is answering.
 runner = None
 if root_agent:
     runner = Runner(
@@ -40,46 +53,109 @@ if root_agent:
         session_service=session_service,
     )
 
-adk_sessions = {} # Tracks initialized ADK sessions in memory
+# Bounded LRU/TTL record of ADK sessions known to exist (optionally shared through a Django cache)
+adk_sessions = SessionCache.from_settings()
 
-def get_adk_user_id(request) -> str:
+def get_adk_user_id(user) -> str:
     """Returns the ADK user ID, which is the Django User ID (PK)."""
-    # Use request.user.pk (Primary Key) which is guaranteed to be unique and persistent
+    # Use user.pk (Primary Key) which is guaranteed to be unique and persistent
     # We must convert it to a string for use as the ADK user_id
-    if request.user.is_authenticated:
-        return str(request.user.pk)
-    # Fallback to an anonymous ID, though these views should be protected by @login_required
+    if user.is_authenticated:
+        return str(user.pk)
+    # Fallback to an anonymous ID, though these views require an authenticated user
     return "anonymous_user"
 
-# Use a synchronous wrapper for the async ADK session initialization
-def initialize_adk_session_sync(session_id: str, adk_user_id: str):
-    """Synchronously ensures the ADK session is accessible and created."""
-    # Key the in-memory cache by both user and session ID for separation
+async def ensure_adk_session(session_id: str, adk_user_id: str):
+    """
+    Ensures the ADK session exists. On a cache miss the session is created
+    unconditionally, so a miss costs one write instead of a read followed by a write.
+    A conflict is only taken as "already exists" once get_session finds the session:
+    the insert can also lose a race on the app or user state row of a new user.
+    """
+    # Key the cache by both user and session ID for separation
     cache_key = f"{adk_user_id}:{session_id}"
-    
-    if cache_key not in adk_sessions:
-        print(f"Initializing ADK session check for {adk_user_id}/{session_id}")
-        
-        async def _init_session():
-            try:
-                session = await session_service.get_session(
-                    app_name=ADK_APP_NAME, 
-                    user_id=adk_user_id, 
-                    session_id=session_id
-                )
-                if not session:
-                    await session_service.create_session(
-                        app_name=ADK_APP_NAME,
-                        user_id=adk_user_id,
-                        session_id=session_id
-                    )
-            except Exception as e:
-                print(f"DatabaseSessionService Initialization Error: {e}")
-                raise 
-            
-            adk_sessions[cache_key] = True
+    if await adk_sessions.contains(cache_key):
+        return
 
-        asyncio.run(_init_session())
+    session_key = dict(app_name=ADK_APP_NAME, user_id=adk_user_id, session_id=session_id)
+    try:
+        try:
+            await session_service.create_session(**session_key)
+        except (AlreadyExistsError, IntegrityError):
+            if await session_service.get_session(**session_key) is None:
+                # Lost the race on a state row; that row exists now, so the retry can succeed
+                await session_service.create_session(**session_key)
+                adk_sessions.count('creates')
+        else:
+            adk_sessions.count('creates')
+    except Exception as e:
+        print(f"DatabaseSessionService Initialization Error: {e}")
+        raise
+
+    await adk_sessions.add(cache_key)
+
+async def get_agent_response(message, session_id: str, user_id: str) -> str:
+    """Runs the agent for one user message and returns the text of its final response."""
+    response = ""
+    async for event in runner.run_async(
+        user_id=user_id, # Use the dynamic ADK user ID here
+        session_id=session_id,
+        new_message=message
+    ):
+        if hasattr(event, "is_final_response") and event.is_final_response():
+            if hasattr(event.content, "parts") and event.content.parts:
+                response = event.content.parts[0].text
+                break
+    return response
+
+# Makes the model stream partial text events instead of one complete response
+STREAMING_RUN_CONFIG = RunConfig(streaming_mode=StreamingMode.SSE)
+
+def event_text(event) -> str:
+    """Returns the concatenated text parts of an ADK event."""
+    content = getattr(event, "content", None)
+    parts = getattr(content, "parts", None) or []
+    return "".join(part.text for part in parts if getattr(part, "text", None))
+
+async def stream_agent_events(message, session_id: str, user_id: str):
+    """
+    Runs the agent with streaming enabled and yields (kind, payload) pairs as ADK events
+    arrive: ("delta", text) for partial text, ("tool_call", {...}) and ("tool_result", {...})
+    for tool progress, and finally ("final", text) exactly once.
+    """
+    streamed = []
+    async for event in runner.run_async(
+        user_id=user_id,
+        session_id=session_id,
+        new_message=message,
+        run_config=STREAMING_RUN_CONFIG,
+    ):
+        for call in event.get_function_calls():
+            yield "tool_call", {"name": call.name, "args": call.args or {}}
+        for result in event.get_function_responses():
+            yield "tool_result", {"name": result.name}
+        if getattr(event, "partial", False):
+            text = event_text(event)
+            if text:
+                streamed.append(text)
+                yield "delta", text
+        elif event.is_final_response():
+            # The final event repeats the whole answer; fall back to the deltas if it has no text
+            yield "final", event_text(event) or "".join(streamed)
+            return
+    yield "final", "".join(streamed)
+
+def sse_event(event, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def parse_request_data(request):
+    """Returns the JSON or form body of a request as a dict, or None if the JSON is malformed."""
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+    return request.POST
 
 
 # --- Web Page Views ---
@@ -156,60 +232,101 @@ def register_view(request):
     return render(request, 'registration/register.html', {'form': form})
 
 
-# --- API Views (DRF) ---
+# --- Async API Views ---
+
+def authenticate_api_request(request):
+    """
+    Runs DRF's authentication classes (Session and Basic by default) on a Django request,
+    as APIView would, and returns the user (AnonymousUser when no credentials were sent).
+    SessionAuthentication enforces CSRF for cookie logins; Basic auth needs no token.
+    Returns a JsonResponse instead when the credentials are rejected.
+    """
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        return drf_request.user
+    except (exceptions.AuthenticationFailed, exceptions.PermissionDenied) as exc:
+        response = JsonResponse({"detail": exc.detail}, status=exc.status_code)
+        if isinstance(exc, exceptions.AuthenticationFailed):
+            # Same rule as DRF: 401 with a challenge if the first authenticator has one, else 403
+            authenticators = drf_request.authenticators
+            header = authenticators[0].authenticate_header(drf_request) if authenticators else None
+            if header:
+                response['WWW-Authenticate'] = header
+            else:
+                response.status_code = status.HTTP_403_FORBIDDEN
+        return response
+
+
+class AsyncAPIView(View):
+    """
+    Base for the async API views. DRF's APIView cannot run async handlers, so this keeps
+    its request handling: the view is CSRF exempt and the DRF authentication classes set
+    request.user (in a thread, since they may query the database) before the handler runs.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await sync_to_async(authenticate_api_request)(request)
+        if isinstance(user, JsonResponse):
+            return user
+        return await super().dispatch(request, *args, **kwargs)
 
-class ChatHistoryView(APIView):
+
+class ChatHistoryView(AsyncAPIView):
     """Retrieves chat history for the current session and all sessions, filtered by user.
        Now includes the last user message as the session name.
     """
-    
-    def get(self, request):
-        if not request.user.is_authenticated:
-            return Response({"error": "Authentication required."}, status=status.HTTP_401_UNAUTHORIZED)
-            
-        adk_user_id = get_adk_user_id(request)
+
+    async def get(self, request):
+        user = request.user
+        if not user.is_authenticated:
+            return JsonResponse({"error": "Authentication required."}, status=401)
+
         current_session_id = request.GET.get('session_id')
-        
+
         if not current_session_id:
-            return Response({"history": [], "sessions": []}, status=status.HTTP_200_OK)
+            return JsonResponse({"history": [], "sessions": []}, status=200)
 
         # 1. Load History for the current session, FILTERED by user_id
         history_qs = ChatMessage.objects.filter(
-            user_id=request.user.pk, # Filter by Django user PK
+            user_id=user.pk, # Filter by Django user PK
             session_id=current_session_id
         )
-        history_data = ChatMessageSerializer(history_qs, many=True).data
-        
+        history_data = ChatMessageSerializer([message async for message in history_qs], many=True).data
+
         # 2. Load all unique session IDs and their last user message, FILTERED by user_id
-        
+
         # Subquery to find the text of the most recent 'user' message for each session_id
         last_user_message_text = ChatMessage.objects.filter(
-            user_id=request.user.pk,
+            user_id=user.pk,
             session_id=OuterRef('session_id'),
             role='user'
         ).order_by('-timestamp').values('text')[:1] # Get the text of the latest user message
-        
-        
-        # Query distinct session IDs, annotated with max timestamp (for sorting) 
+
+
+        # Query distinct session IDs, annotated with max timestamp (for sorting)
         # and the text of the last user message
         sessions_qs = ChatMessage.objects.filter(
-            user_id=request.user.pk # Filter by Django user PK
+            user_id=user.pk # Filter by Django user PK
         ).values('session_id').annotate(
             # Annotate with the max timestamp for sorting
             max_timestamp=Max('timestamp'),
             # Annotate with the text of the last user message
             last_user_message_text=Subquery(last_user_message_text)
         ).order_by('-max_timestamp')
-        
+
         # Process the queryset into a list of objects for the frontend
         sessions_list_data = []
         MAX_NAME_LENGTH = 25
-        
-        for item in sessions_qs:
+
+        async for item in sessions_qs:
             session_id = item['session_id']
             # Get the last user message text
             session_name = item['last_user_message_text']
-            
+
             # Fallback to a default name if no user message was sent yet
             if not session_name:
                 display_name = f"Chat #{session_id}"
@@ -218,91 +335,141 @@ class ChatHistoryView(APIView):
                 display_name = session_name
                 if len(display_name) > MAX_NAME_LENGTH:
                     display_name = display_name[:MAX_NAME_LENGTH - 3] + '...'
-                
+
             sessions_list_data.append({
                 'id': session_id,
                 'name': display_name,
             })
 
-        return Response({
+        return JsonResponse({
             "history": history_data,
             "current_session_id": current_session_id,
             "sessions": sessions_list_data # Send the list of objects with ID and Name
         })
 
 
-class ChatAPIView(APIView):
-    """Handles new user messages and runs the ADK agent, protected and filtered by user."""
+async def begin_chat_turn(request):
+    """
+    Validates a chat request, ensures its ADK session exists and saves the user's message.
+    Returns (user, adk_user_id, session_id, message) or a JsonResponse describing the error.
+    """
+    user = request.user  # Set by AsyncAPIView's DRF authentication
+    if not user.is_authenticated:
+        return JsonResponse({"error": "Authentication required."}, status=401)
 
-    def post(self, request):
-        if not request.user.is_authenticated:
-            return Response({"error": "Authentication required."}, status=status.HTTP_401_UNAUTHORIZED)
+    adk_user_id = get_adk_user_id(user)
 
-        adk_user_id = get_adk_user_id(request)
-        
-        if not runner:
-            return Response({"response": "Error: Agent runner is not initialized."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    if not runner:
+        return JsonResponse({"response": "Error: Agent runner is not initialized."}, status=500)
 
-        serializer = ChatRequestSerializer(data=request.data)
-        if not serializer.is_valid():
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        
-        user_input = serializer.validated_data['message']
-        current_session_id = request.GET.get('session_id')
-        
-        if not current_session_id:
-            return Response({"response": "Error: Session ID is missing."}, status=status.HTTP_400_BAD_REQUEST)
+    data = parse_request_data(request)
+    if data is None:
+        return JsonResponse({"response": "Error: Invalid JSON format."}, status=400)
+    serializer = ChatRequestSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    user_input = serializer.validated_data['message']
+    current_session_id = request.GET.get('session_id')
+
+    if not current_session_id:
+        return JsonResponse({"response": "Error: Session ID is missing."}, status=400)
+
+    # 1. Ensure the ADK session is initialized/loaded
+    try:
+        await ensure_adk_session(current_session_id, adk_user_id)
+    except Exception as e:
+        return JsonResponse({"response": f"ADK Session Init Error: {str(e)}"}, status=500)
+
+    # 2. Save user message to Django DB, setting the user_id field
+    await ChatMessage.objects.acreate(
+        user_id=user.pk, # Set the Foreign Key to the current user
+        session_id=current_session_id,
+        role="user",
+        text=user_input
+    )
+
+    # 3. Prepare the message for the runner
+    message = Content(role="user", parts=[Part(text=user_input)])
+    return user, adk_user_id, current_session_id, message
+
+
+class ChatAPIView(AsyncAPIView):
+    """Handles new user messages and runs the ADK agent, protected and filtered by user."""
 
-        # 1. Ensure the ADK session is initialized/loaded (using the synchronous wrapper)
+    async def post(self, request):
+        turn = await begin_chat_turn(request)
+        if isinstance(turn, JsonResponse):
+            return turn
+        user, adk_user_id, current_session_id, message = turn
+
+        # 4. Run the ADK Agent on the server's event loop
         try:
-            # Pass the user ID to the initializer
-            initialize_adk_session_sync(current_session_id, adk_user_id)
+            final_response = await get_agent_response(message, current_session_id, adk_user_id)
         except Exception as e:
-            return Response({"response": f"ADK Session Init Error: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        # 2. Save user message to Django DB, setting the user_id field
-        ChatMessage.objects.create(
-            user_id=request.user.pk, # Set the Foreign Key to the current user
-            session_id=current_session_id, 
-            role="user", 
-            text=user_input
+            final_response = f"An agent error occurred during run: {str(e)}"
+            return JsonResponse({"response": final_response}, status=500)
+
+        # 5. Save agent message to Django DB, setting the user_id field
+        await ChatMessage.objects.acreate(
+            user_id=user.pk, # Set the Foreign Key to the current user
+            session_id=current_session_id,
+            role="agent",
+            text=final_response
         )
 
-        # 3. Prepare the message for the runner
-        message = Content(role="user", parts=[Part(text=user_input)])
-
-        final_response = "Sorry, I encountered an internal error."
-
-        # 4. Define the async function to run the agent (internal to the post method)
-        async def get_agent_response(msg, session_id, user_id):
-            response = ""
-            async for event in runner.run_async(
-                user_id=user_id, # Use the dynamic ADK user ID here
-                session_id=session_id,
-                new_message=msg
-            ):
-                if hasattr(event, "is_final_response") and event.is_final_response():
-                    if hasattr(event.content, "parts") and event.content.parts:
-                        response = event.content.parts[0].text
-                        break
-            return response
-
-        # 5. Run the ADK Agent asynchronously from the synchronous view
+        return JsonResponse({"response": final_response}, status=200)
+
+
+class ChatStreamView(AsyncAPIView):
+    """
+    Streaming variant of ChatAPIView (Server-Sent Events; served by the ASGI application).
+    Emits "delta" events with partial text, "tool_call"/"tool_result" progress events and
+    a closing "done" event with the full answer, or "error" if the agent fails.
+    """
+
+    async def post(self, request):
+        turn = await begin_chat_turn(request)
+        if isinstance(turn, JsonResponse):
+            return turn
+        response = StreamingHttpResponse(self.events(*turn), content_type="text/event-stream")
+        response['Cache-Control'] = 'no-cache'
+        # Disable response buffering in nginx-style proxies
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @staticmethod
+    async def events(user, adk_user_id, session_id, message):
+        final_response = ""
         try:
-            final_response = asyncio.run(get_agent_response(message, current_session_id, adk_user_id))
+            async for kind, payload in stream_agent_events(message, session_id, adk_user_id):
+                if kind == "final":
+                    final_response = payload
+                elif kind == "delta":
+                    yield sse_event("delta", {"text": payload})
+                else:
+                    yield sse_event(kind, payload)
         except Exception as e:
-            final_response = f"An agent error occurred during run: {str(e)}"
-            return Response({"response": final_response}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-        # 6. Save agent message to Django DB, setting the user_id field
-        ChatMessage.objects.create(
-            user_id=request.user.pk, # Set the Foreign Key to the current user
-            session_id=current_session_id, 
-            role="agent", 
+            yield sse_event("error", {"response": f"An agent error occurred during run: {str(e)}"})
+            return
+
+        # Persist the agent's answer once, after the stream completed
+        await ChatMessage.objects.acreate(
+            user_id=user.pk,
+            session_id=session_id,
+            role="agent",
             text=final_response
         )
+        yield sse_event("done", {"response": final_response})
+
+
+@staff_member_required
+def session_cache_stats(request):
+    """Returns this process's ADK session cache counters (hits, misses, evictions, ...)."""
+    return JsonResponse(adk_sessions.stats())
 
-        return Response({"response": final_response}, status=status.HTTP_200_OK)
+
+# --- API Views (DRF) ---
 
 class AppSettingsAPIView(APIView):
     """Handles GET and PATCH requests for the current user's AppSettings."""